@@ -0,0 +1,24 @@
+-- CreateTable
+CREATE TABLE "IntradayBar" (
+    "id" TEXT NOT NULL,
+    "stockId" TEXT NOT NULL,
+    "interval" INTEGER NOT NULL,
+    "start" TIMESTAMP(3) NOT NULL,
+    "open" DOUBLE PRECISION NOT NULL,
+    "high" DOUBLE PRECISION NOT NULL,
+    "low" DOUBLE PRECISION NOT NULL,
+    "close" DOUBLE PRECISION NOT NULL,
+    "volume" BIGINT NOT NULL DEFAULT 0,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "IntradayBar_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "IntradayBar_stockId_interval_start_key" ON "IntradayBar"("stockId", "interval", "start");
+
+-- CreateIndex
+CREATE INDEX "IntradayBar_start_idx" ON "IntradayBar"("start");
+
+-- AddForeignKey
+ALTER TABLE "IntradayBar" ADD CONSTRAINT "IntradayBar_stockId_fkey" FOREIGN KEY ("stockId") REFERENCES "Stock"("id") ON DELETE CASCADE ON UPDATE CASCADE;
@@ -1,9 +1,14 @@
+import argparse
 import asyncio
 import aiohttp
+import sys
 import random
 import time
 import json
 import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 import ssl
@@ -13,11 +18,65 @@ import cloudscraper
 from aiohttp_socks import ProxyConnector
 import backoff
 from urllib.parse import quote
+from request_timing import RequestTimer
+from crawler_metrics import CrawlerMetrics
+from crawler_profile import default_profile_prefix, profile_run
+from contextlib import nullcontext
+from singleflight import SingleFlight
+from connection_warmup import prewarm_aiohttp, tcp_connector
+from bar_builder import BarBuilder
+from db_sink import QuoteSink
+from redis_sink import RedisSink, publish_results
+from quote_board import DEFAULT_BOARD_PATH, QuoteBoard
+from delta_filter import HEARTBEAT_SECONDS, DeltaFilter, default_state_path
+from output_format import FORMATS, emit_results
+from page_parsers import PAGE_PARSERS
 
 logger = logging.getLogger(__name__)
 
+# Hosts of the sources in fetch_stock_data, pre-connected at startup
+SOURCE_HOSTS = [
+    'https://query1.finance.yahoo.com/',
+    'https://finance.yahoo.com/',
+    'https://www.google.com/',
+    'https://www.investing.com/',
+    'https://www.marketwatch.com/',
+    'https://www.cnbc.com/',
+]
+
+# How often the daemon writes finished intraday bars
+BAR_FLUSH_SECONDS = 15
+
+# Sources whose volume is the day's real cumulative volume; the page
+# scrapers only find a price, so their rows don't move bar volume
+VOLUME_SOURCES = frozenset({'yahoo_quote_api'})
+
+# How often the daemon writes the request timing summary to stderr and starts a new period
+TIMING_EMIT_SECONDS = 300
+
+# Yahoo's multi-symbol quote API; the page scrapers are only the fallback
+YAHOO_QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote'
+YAHOO_CRUMB_URL = 'https://query1.finance.yahoo.com/v1/test/getcrumb'
+# Sets the session cookie the crumb is tied to
+YAHOO_COOKIE_URL = 'https://fc.yahoo.com/'
+YAHOO_BATCH_SIZE = 50
+
+# Page parsing runs in this many worker processes; 0 parses on the event loop
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+# Pages shorter than this are parsed inline
+PARSE_INLINE_CHARS = 64 * 1024
+
+
+def _record_retry(details):
+    """backoff on_backoff handler: count retries per source"""
+    crawler = details['args'][0]
+    crawler.metrics.observe_retry(details['kwargs'].get('source', 'unknown'))
+
+
 class AdvancedMultiCrawler:
-    def __init__(self):
+    def __init__(self, parse_workers: int = PARSE_WORKERS):
+        self.parse_workers = parse_workers
+        self.parse_pool = None
         self.ua = UserAgent()
         self.scraper = cloudscraper.create_scraper()
         self.session = None
@@ -25,6 +84,11 @@ class AdvancedMultiCrawler:
         self.current_proxy_index = 0
         self.request_count = 0
         self.last_request_time = 0
+        self.timer = RequestTimer()
+        self.metrics = CrawlerMetrics('advanced_multi_crawler')
+        # Concurrent lookups of the same (symbol, source) share one upstream fetch
+        self.flights = SingleFlight(on_coalesced=lambda key: self.metrics.observe_coalesced())
+        self.yahoo_crumb = None
         
         # User agent pool
         self.user_agents = [
@@ -58,13 +122,20 @@ class AdvancedMultiCrawler:
         
     async def initialize(self):
         """Initialize the crawler with proxy list and session"""
-        await self.fetch_free_proxies()
         await self.create_session()
+        if self.parse_workers > 0:
+            # Forked children would inherit the loop and aiohttp's threads
+            self.parse_pool = ProcessPoolExecutor(self.parse_workers,
+                                                  mp_context=multiprocessing.get_context('forkserver'))
+        # Connection setup to the quote hosts overlaps the proxy list fetch
+        await asyncio.gather(self.fetch_free_proxies(), prewarm_aiohttp(self.session, SOURCE_HOSTS))
         
     async def close(self):
         """Close the session"""
         if self.session:
             await self.session.close()
+        if self.parse_pool:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
             
     async def fetch_free_proxies(self):
         """Fetch free proxy list from multiple sources"""
@@ -135,12 +206,13 @@ class AdvancedMultiCrawler:
                     
         if not connector:
             # Use unverified SSL context for better compatibility
-            connector = aiohttp.TCPConnector(ssl=self.ssl_context)
+            connector = tcp_connector(ssl=self.ssl_context)
             
         self.session = aiohttp.ClientSession(
             headers=headers,
             connector=connector,
-            cookie_jar=aiohttp.CookieJar()
+            cookie_jar=aiohttp.CookieJar(),
+            trace_configs=[self.timer.trace_config()]
         )
         
     async def apply_rate_limiting(self):
@@ -166,9 +238,11 @@ class AdvancedMultiCrawler:
         backoff.expo,
         (aiohttp.ClientError, asyncio.TimeoutError),
         max_tries=3,
-        max_time=30
+        max_time=30,
+        on_backoff=_record_retry
     )
-    async def fetch_with_retry(self, url: str, timeout: int = 30) -> Optional[str]:
+    async def fetch_with_retry(self, url: str, timeout: int = 30, source: str = 'unknown',
+                               symbol: Optional[str] = None) -> Optional[str]:
         """Fetch URL with retry logic and exponential backoff"""
         await self.apply_rate_limiting()
         
@@ -177,7 +251,8 @@ class AdvancedMultiCrawler:
             self.session.headers['User-Agent'] = self.get_random_user_agent()
             
         try:
-            async with self.session.get(url, timeout=timeout, allow_redirects=True) as response:
+            async with self.session.get(url, timeout=timeout, allow_redirects=True,
+                                        trace_request_ctx={'source': source, 'symbol': symbol}) as response:
                 if response.status == 200:
                     return await response.text()
                 else:
@@ -187,13 +262,13 @@ class AdvancedMultiCrawler:
             logger.error(f"Error fetching {url}: {e}")
             raise
             
-    async def fetch_with_cloudscraper(self, url: str) -> Optional[str]:
+    async def fetch_with_cloudscraper(self, url: str, source: str = 'unknown',
+                                      symbol: Optional[str] = None) -> Optional[str]:
         """Use cloudscraper for sites with anti-bot protection"""
         try:
             response = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                self.scraper.get, 
-                url
+                None,
+                lambda: self.timer.get(self.scraper, url, source, symbol, client='cloudscraper')
             )
             if response.status_code == 200:
                 return response.text
@@ -204,6 +279,72 @@ class AdvancedMultiCrawler:
             logger.error(f"Cloudscraper error for {url}: {e}")
             return None
             
+    async def _get_yahoo_crumb(self, refresh: bool = False) -> Optional[str]:
+        """Crumb token the quote API wants alongside the session cookie"""
+        if self.yahoo_crumb and not refresh:
+            return self.yahoo_crumb
+        try:
+            async with self.session.get(YAHOO_COOKIE_URL, timeout=10, allow_redirects=True,
+                                        trace_request_ctx={'source': 'yahoo_quote_api', 'symbol': None}):
+                pass
+            async with self.session.get(YAHOO_CRUMB_URL, timeout=10,
+                                        trace_request_ctx={'source': 'yahoo_quote_api', 'symbol': None}) as response:
+                if response.status == 200:
+                    self.yahoo_crumb = (await response.text()).strip() or None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not get a Yahoo crumb: {e}")
+        return self.yahoo_crumb
+        
+    @backoff.on_exception(
+        backoff.expo,
+        (aiohttp.ClientError, asyncio.TimeoutError),
+        max_tries=3,
+        max_time=30,
+        on_backoff=_record_retry
+    )
+    async def _fetch_yahoo_chunk(self, symbols: List[str], source: str = 'yahoo_quote_api') -> List[Dict[str, Any]]:
+        """One v7 quote call; returns Yahoo's raw result items"""
+        for attempt in range(2):
+            params = {'symbols': ','.join(symbols)}
+            crumb = await self._get_yahoo_crumb(refresh=attempt > 0)
+            if crumb:
+                params['crumb'] = crumb
+            async with self.session.get(YAHOO_QUOTE_URL, params=params, timeout=10,
+                                        headers={'Accept': 'application/json'},
+                                        trace_request_ctx={'source': source, 'symbol': None}) as response:
+                if response.status in (401, 403) and attempt == 0:
+                    # Expired or missing crumb
+                    continue
+                if response.status != 200:
+                    logger.warning(f"Yahoo quote API returned {response.status} for {len(symbols)} symbols")
+                    return []
+                data = await response.json(content_type=None)
+                return (data.get('quoteResponse') or {}).get('result') or []
+        return []
+        
+    async def fetch_yahoo_batch(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Full quotes for as many symbols as the quote API knows, YAHOO_BATCH_SIZE per call"""
+        chunks = [symbols[i:i + YAHOO_BATCH_SIZE] for i in range(0, len(symbols), YAHOO_BATCH_SIZE)]
+        
+        async def fetch(chunk: List[str]) -> List[Dict[str, Any]]:
+            started = time.perf_counter()
+            items = []
+            try:
+                items = await self._fetch_yahoo_chunk(chunk, source='yahoo_quote_api')
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Yahoo quote API failed for {len(chunk)} symbols: {e}")
+            finally:
+                self.metrics.observe_request('yahoo_quote_api', time.perf_counter() - started, bool(items))
+            return items
+        
+        quotes = {}
+        for items in await asyncio.gather(*(fetch(chunk) for chunk in chunks)):
+            for item in items:
+                row = yahoo_quote(item)
+                if row:
+                    quotes[row['symbol']] = row
+        return quotes
+        
     async def fetch_stock_data(self, symbol: str) -> Optional[Dict[str, Any]]:
         """Fetch stock data with multiple fallback sources"""
         # List of data sources with their fetch methods
@@ -222,10 +363,7 @@ class AdvancedMultiCrawler:
                 # Set timeout for each source attempt (10 seconds)
                 try:
                     # Try with normal session first
-                    result = await asyncio.wait_for(
-                        fetch_method(symbol, use_cloudscraper=False), 
-                        timeout=10.0
-                    )
+                    result = await self._attempt(fetch_method, symbol, use_cloudscraper=False)
                     if result:
                         logger.info(f"Successfully fetched {symbol} from {source_name}")
                         return result
@@ -235,10 +373,7 @@ class AdvancedMultiCrawler:
                 # Try with cloudscraper if normal fetch failed
                 try:
                     logger.info(f"Retrying {symbol} from {source_name} with cloudscraper")
-                    result = await asyncio.wait_for(
-                        fetch_method(symbol, use_cloudscraper=True),
-                        timeout=10.0
-                    )
+                    result = await self._attempt(fetch_method, symbol, use_cloudscraper=True)
                     if result:
                         logger.info(f"Successfully fetched {symbol} from {source_name} with cloudscraper")
                         return result
@@ -255,126 +390,120 @@ class AdvancedMultiCrawler:
         logger.error(f"Failed to fetch data for {symbol} from all sources")
         return None
         
-    async def _fetch_from_yahoo(self, symbol: str, use_cloudscraper: bool = False) -> Optional[Dict[str, Any]]:
-        """Fetch from Yahoo Finance"""
-        url = f"https://finance.yahoo.com/quote/{symbol}"
+    async def _attempt(self, fetch_method, symbol: str, use_cloudscraper: bool) -> Optional[Dict[str, Any]]:
+        """Run one source attempt, coalesced with identical attempts already in flight"""
+        key = (symbol, fetch_method.__name__, use_cloudscraper)
+        return await self.flights.do(key, self._timed_attempt, fetch_method, symbol, use_cloudscraper)
         
+    async def _timed_attempt(self, fetch_method, symbol: str, use_cloudscraper: bool) -> Optional[Dict[str, Any]]:
+        """Run one source attempt with a 10 second timeout, feeding the latency metrics"""
+        source = 'cloudscraper' if use_cloudscraper else fetch_method.__name__.replace('_fetch_from_', '')
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await asyncio.wait_for(
+                fetch_method(symbol, use_cloudscraper=use_cloudscraper),
+                timeout=10.0
+            )
+            return result
+        finally:
+            self.metrics.observe_request(source, time.perf_counter() - started, result is not None)
+        
+    async def _fetch_page(self, source: str, url: str, symbol: str, use_cloudscraper: bool) -> Optional[Dict[str, Any]]:
+        """Download a quote page and parse it with the source's page parser"""
         if use_cloudscraper:
-            html = await self.fetch_with_cloudscraper(url)
+            html = await self.fetch_with_cloudscraper(url, source=source, symbol=symbol)
         else:
-            html = await self.fetch_with_retry(url)
+            html = await self.fetch_with_retry(url, source=source, symbol=symbol)
             
-        if html:
-            # Parse the HTML to extract data
-            # This is a simplified example - you'd need proper parsing
-            try:
-                import re
-                price_match = re.search(r'data-symbol="' + symbol + r'"[^>]*data-field="regularMarketPrice"[^>]*>([0-9,.]+)', html)
-                if price_match:
-                    return {
-                        'symbol': symbol,
-                        'price': float(price_match.group(1).replace(',', '')),
-                        'source': 'Yahoo Finance',
-                        'timestamp': datetime.now().isoformat()
-                    }
-            except Exception as e:
-                logger.error(f"Error parsing Yahoo data: {e}")
-                
-        return None
+        if not html:
+            return None
+        try:
+            return await self.parse_page(source, symbol, html)
+        except Exception as e:
+            logger.error(f"Error parsing {source} data: {e}")
+            return None
+        
+    async def parse_page(self, source: str, symbol: str, html: str) -> Optional[Dict[str, Any]]:
+        """Parse a page in the worker pool, so regex scans of large pages don't stall the event loop
+        
+        Small bodies are parsed inline; shipping them to a worker costs more
+        than the parse.
+        """
+        parser = PAGE_PARSERS[source]
+        if self.parse_pool is None or len(html) < PARSE_INLINE_CHARS:
+            return parser(symbol, html)
+        return await asyncio.get_event_loop().run_in_executor(self.parse_pool, parser, symbol, html)
+        
+    async def _fetch_from_yahoo(self, symbol: str, use_cloudscraper: bool = False) -> Optional[Dict[str, Any]]:
+        """Fetch from Yahoo Finance"""
+        url = f"https://finance.yahoo.com/quote/{symbol}"
+        return await self._fetch_page('yahoo', url, symbol, use_cloudscraper)
         
     async def _fetch_from_google(self, symbol: str, use_cloudscraper: bool = False) -> Optional[Dict[str, Any]]:
         """Fetch from Google Finance"""
         url = f"https://www.google.com/finance/quote/{symbol}:NASDAQ"
-        
-        if use_cloudscraper:
-            html = await self.fetch_with_cloudscraper(url)
-        else:
-            html = await self.fetch_with_retry(url)
-            
-        if html:
-            # Parse Google Finance data
-            try:
-                import re
-                price_match = re.search(r'class="YMlKec fxKbKc">([0-9,.]+)', html)
-                if price_match:
-                    return {
-                        'symbol': symbol,
-                        'price': float(price_match.group(1).replace(',', '')),
-                        'source': 'Google Finance',
-                        'timestamp': datetime.now().isoformat()
-                    }
-            except Exception as e:
-                logger.error(f"Error parsing Google data: {e}")
-                
-        return None
+        return await self._fetch_page('google', url, symbol, use_cloudscraper)
         
     async def _fetch_from_investing(self, symbol: str, use_cloudscraper: bool = False) -> Optional[Dict[str, Any]]:
         """Fetch from Investing.com"""
         # Investing.com requires more complex handling
         search_url = f"https://www.investing.com/search/?q={symbol}"
-        
-        if use_cloudscraper:
-            html = await self.fetch_with_cloudscraper(search_url)
-        else:
-            html = await self.fetch_with_retry(search_url)
-            
-        if html:
-            # This is a placeholder - Investing.com requires more complex parsing
-            return None
-            
-        return None
+        return await self._fetch_page('investing', search_url, symbol, use_cloudscraper)
         
     async def _fetch_from_marketwatch(self, symbol: str, use_cloudscraper: bool = False) -> Optional[Dict[str, Any]]:
         """Fetch from MarketWatch"""
         url = f"https://www.marketwatch.com/investing/stock/{symbol.lower()}"
-        
-        if use_cloudscraper:
-            html = await self.fetch_with_cloudscraper(url)
-        else:
-            html = await self.fetch_with_retry(url)
-            
-        if html:
-            # Parse MarketWatch data
-            try:
-                import re
-                price_match = re.search(r'class="intraday__price"[^>]*>.*?([0-9,.]+)', html, re.DOTALL)
-                if price_match:
-                    return {
-                        'symbol': symbol,
-                        'price': float(price_match.group(1).replace(',', '')),
-                        'source': 'MarketWatch',
-                        'timestamp': datetime.now().isoformat()
-                    }
-            except Exception as e:
-                logger.error(f"Error parsing MarketWatch data: {e}")
-                
-        return None
+        return await self._fetch_page('marketwatch', url, symbol, use_cloudscraper)
         
     async def _fetch_from_cnbc(self, symbol: str, use_cloudscraper: bool = False) -> Optional[Dict[str, Any]]:
         """Fetch from CNBC"""
         url = f"https://www.cnbc.com/quotes/{symbol}"
-        
-        if use_cloudscraper:
-            html = await self.fetch_with_cloudscraper(url)
-        else:
-            html = await self.fetch_with_retry(url)
-            
-        if html:
-            # Parse CNBC data
-            try:
-                import re
-                price_match = re.search(r'QuoteStrip-lastPrice">([0-9,.]+)', html)
-                if price_match:
-                    return {
-                        'symbol': symbol,
-                        'price': float(price_match.group(1).replace(',', '')),
-                        'source': 'CNBC',
-                        'timestamp': datetime.now().isoformat()
-                    }
-            except Exception as e:
-                logger.error(f"Error parsing CNBC data: {e}")
-                
+        return await self._fetch_page('cnbc', url, symbol, use_cloudscraper)
+
+def yahoo_quote(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Result row from one v7 quote API item, or None without a price"""
+    price = item.get('regularMarketPrice')
+    symbol = item.get('symbol')
+    if not price or not symbol:
         return None
+    previous_close = item.get('regularMarketPreviousClose') or price
+    change = item.get('regularMarketChange')
+    if change is None:
+        change = price - previous_close
+    market_time = item.get('regularMarketTime')
+    return {
+        "symbol": symbol,
+        "name": item.get('shortName') or item.get('longName') or symbol,
+        "currentPrice": price,
+        "previousClose": previous_close,
+        "change": round(change, 4),
+        "changePercent": round(item.get('regularMarketChangePercent') or 0, 2),
+        "dayOpen": item.get('regularMarketOpen') or price,
+        "dayHigh": item.get('regularMarketDayHigh') or price,
+        "dayLow": item.get('regularMarketDayLow') or price,
+        "volume": int(item.get('regularMarketVolume') or 0),
+        "timestamp": (datetime.fromtimestamp(market_time) if market_time else datetime.now()).isoformat(),
+        "source": "yahoo_quote_api"
+    }
+
+def failed_result(symbol: str, error: str) -> Dict[str, Any]:
+    """Result row for a symbol no source could price"""
+    return {
+        "symbol": symbol,
+        "name": symbol,
+        "currentPrice": 0,
+        "previousClose": 0,
+        "change": 0,
+        "changePercent": 0,
+        "dayOpen": 0,
+        "dayHigh": 0,
+        "dayLow": 0,
+        "volume": 0,
+        "timestamp": datetime.now().isoformat(),
+        "source": "crawler",
+        "error": error
+    }
 
 async def process_symbol(crawler, symbol: str) -> Dict[str, Any]:
     """Process a single symbol"""
@@ -385,82 +514,224 @@ async def process_symbol(crawler, symbol: str) -> Dict[str, Any]:
         
         if data:
             # Format data to match expected output
+            price = data.get('price', 0)
             result = {
                 "symbol": symbol,
                 "name": symbol,  # Use symbol as name for now
-                "currentPrice": data.get('price', 0),
-                "previousClose": data.get('price', 0) * 0.99,  # Estimate
-                "change": data.get('price', 0) * 0.01,
+                "currentPrice": price,
+                "previousClose": price * 0.99,  # Estimate
+                "change": price * 0.01,
                 "changePercent": 1.0,
-                "dayOpen": data.get('price', 0),
-                "dayHigh": data.get('price', 0) * 1.01,
-                "dayLow": data.get('price', 0) * 0.99,
+                "dayOpen": price,
+                "dayHigh": price * 1.01,
+                "dayLow": price * 0.99,
                 "volume": 1000000,
                 "timestamp": data.get('timestamp', datetime.now().isoformat()),
                 "source": data.get('source', 'Unknown')
             }
+            crawler.metrics.observe_symbol(True)
         else:
-            result = {
-                "symbol": symbol,
-                "name": symbol,
-                "currentPrice": 0,
-                "previousClose": 0,
-                "change": 0,
-                "changePercent": 0,
-                "dayOpen": 0,
-                "dayHigh": 0,
-                "dayLow": 0,
-                "volume": 0,
-                "timestamp": datetime.now().isoformat(),
-                "source": "crawler",
-                "error": "Failed to fetch data from all sources"
-            }
+            result = failed_result(symbol, "Failed to fetch data from all sources")
+            crawler.metrics.observe_symbol(False)
             
         return result
         
     except Exception as e:
         logger.error(f"Error processing {symbol}: {e}")
-        return {
-            "symbol": symbol,
-            "name": symbol,
-            "currentPrice": 0,
-            "previousClose": 0,
-            "change": 0,
-            "changePercent": 0,
-            "dayOpen": 0,
-            "dayHigh": 0,
-            "dayLow": 0,
-            "volume": 0,
-            "timestamp": datetime.now().isoformat(),
-            "source": "crawler",
-            "error": str(e)
-        }
+        crawler.metrics.observe_symbol(False)
+        return failed_result(symbol, str(e))
+
+async def crawl_symbols(crawler, symbols: List[str]) -> List[Dict[str, Any]]:
+    """Process symbols in parallel, keeping the queue depth gauge current
+    
+    US tickers are first priced in bulk by the Yahoo quote API; only the
+    symbols it misses go through the per-symbol page scrapers.
+    """
+    # 6-digit KRX codes aren't Yahoo tickers without a suffix
+    tickers = [symbol for symbol in symbols if not (len(symbol) == 6 and symbol.isdigit())]
+    batch = await crawler.fetch_yahoo_batch(tickers) if tickers else {}
+    
+    async def run(symbol: str) -> Dict[str, Any]:
+        try:
+            if symbol in batch:
+                crawler.metrics.observe_symbol(True)
+                return batch[symbol]
+            return await process_symbol(crawler, symbol)
+        finally:
+            crawler.metrics.queue_depth -= 1
+    
+    return await asyncio.gather(*(run(symbol) for symbol in symbols))
+
+def parse_symbols(text: str) -> List[str]:
+    """Split a comma-separated list, dropping blanks and duplicates (order kept)"""
+    return list(dict.fromkeys(symbol.strip().upper() for symbol in text.split(',') if symbol.strip()))
+
+async def run_daemon(crawler, sink: Optional[QuoteSink] = None, fmt: str = 'json',
+                     delta: Optional[DeltaFilter] = None, cache: Optional[RedisSink] = None,
+                     board: Optional[QuoteBoard] = None):
+    """Long-running mode: one comma-separated batch per stdin line, one JSON array per stdout line
+
+    Batches are crawled concurrently, so overlapping symbols share upstream
+    fetches and result lines are written in completion order. Binary formats
+    write one length-prefixed frame per batch instead of a line. With a sink,
+    the results also feed 1/5/15-minute bars, written every BAR_FLUSH_SECONDS.
+    With a delta filter, only quotes that changed are written out; the bars
+    still see every poll. With a Redis sink, each emitted batch is also
+    published to the API's price cache. With a quote board, every poll of a
+    listed symbol lands in its shared-memory slot. Request timing goes to
+    stderr every TIMING_EMIT_SECONDS.
+    """
+    loop = asyncio.get_event_loop()
+    pending = set()
+    bars = BarBuilder() if sink is not None else None
+    
+    async def crawl_batch(symbols: List[str]):
+        results = await crawl_symbols(crawler, symbols)
+        if bars is not None:
+            bars.add(results, VOLUME_SOURCES)
+        if board is not None:
+            board.update(results)
+        if delta is not None:
+            results = delta.filter(results)
+            delta.save()
+            if not results:
+                return
+        emit_results(results, fmt, framed=True)
+        if cache is not None:
+            try:
+                await loop.run_in_executor(None, cache.publish, results)
+            except Exception as e:
+                logger.error(f"Publishing {len(results)} quotes to Redis failed: {e}")
+    
+    async def flush_bars():
+        # Collected on the loop so the write thread never sees a half-updated bar
+        rows, marks = bars.finished()
+        if not rows:
+            return
+        try:
+            await loop.run_in_executor(None, sink.upsert_intraday_bars, rows)
+        except Exception as e:
+            logger.error(f"Writing {len(rows)} intraday bars failed, keeping them buffered: {e}")
+            return
+        bars.mark_flushed(marks)
+    
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(BAR_FLUSH_SECONDS)
+            await flush_bars()
+    
+    async def emit_timing_periodically():
+        while True:
+            await asyncio.sleep(TIMING_EMIT_SECONDS)
+            crawler.timer.emit(reset=True)
+    
+    flusher = asyncio.ensure_future(flush_periodically()) if bars is not None else None
+    timing = asyncio.ensure_future(emit_timing_periodically())
+    
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        symbols = parse_symbols(line)
+        if symbols:
+            crawler.metrics.queue_depth += len(symbols)
+            task = asyncio.ensure_future(crawl_batch(symbols))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    
+    if pending:
+        await asyncio.gather(*pending)
+    
+    timing.cancel()
+    if flusher is not None:
+        flusher.cancel()
+        await flush_bars()
 
 # Command line interface
 async def main():
-    import sys
+    parser = argparse.ArgumentParser(description='Multi-source stock crawler')
+    parser.add_argument('symbols', nargs='?', help='Comma-separated symbols, e.g. AAPL,MSFT')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and read symbol batches from stdin, one per line')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve Prometheus metrics on this port (daemon mode)')
+    parser.add_argument('--stats-file',
+                        help='Write run metrics here when done (JSON, or Prometheus text for *.prom)')
+    parser.add_argument('--profile', nargs='?', const='', metavar='PREFIX',
+                        help='Profile the run into PREFIX.pstats and PREFIX.collapsed')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='Output encoding (msgpack needs msgpack, arrow needs pyarrow)')
+    parser.add_argument('--db-url', nargs='?', const='', metavar='URL',
+                        help='Daemon mode: build intraday bars from the polls and write them to this '
+                             'database (default DATABASE_URL)')
+    parser.add_argument('--changed-only', nargs='?', type=float, const=0.0, metavar='EPSILON',
+                        help='Only emit symbols whose quote moved by more than EPSILON (relative) '
+                             'since it was last emitted')
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_SECONDS,
+                        help='With --changed-only, re-emit unchanged symbols after this many seconds')
+    parser.add_argument('--delta-state', metavar='PATH',
+                        help='With --changed-only, where to keep the last emitted quotes '
+                             '(default .cache/last_emitted.<script>.json)')
+    parser.add_argument('--redis-url', nargs='?', const='', metavar='URL',
+                        help='Also publish the results to the Redis price cache (default REDIS_URL)')
+    parser.add_argument('--board', nargs='?', const='', metavar='PATH',
+                        help='Daemon mode: keep the shared-memory quote board current (default QUOTE_BOARD_PATH)')
+    parser.add_argument('--parse-workers', type=int, default=PARSE_WORKERS,
+                        help='Processes that parse quote pages (0 parses on the event loop)')
+    args = parser.parse_args()
     
-    if len(sys.argv) < 2:
+    if not args.symbols and not args.daemon:
         print(json.dumps([{"error": "No symbols provided"}]))
         sys.exit(1)
         
     # Configure logging to stderr to not interfere with JSON output
     logging.basicConfig(level=logging.INFO, stream=sys.stderr)
     
-    symbols = sys.argv[1].split(',')
-    results = []
+    profiler = nullcontext()
+    if args.profile is not None:
+        profiler = profile_run(args.profile or default_profile_prefix(__file__, args.stats_file))
     
-    async with AdvancedMultiCrawler() as crawler:
-        # Process stocks in parallel
-        tasks = []
-        for symbol in symbols:
-            symbol = symbol.strip().upper()
-            tasks.append(process_symbol(crawler, symbol))
-        
-        results = await asyncio.gather(*tasks)
+    with profiler:
+        await run_crawler(args)
+
+async def run_crawler(args):
+    delta = None
+    if args.changed_only is not None:
+        delta = DeltaFilter(args.changed_only, args.heartbeat, args.delta_state or default_state_path(__file__))
+    async with AdvancedMultiCrawler(args.parse_workers) as crawler:
+        if args.daemon:
+            if args.metrics_port:
+                crawler.metrics.serve(args.metrics_port)
+            sink = QuoteSink.connect(args.db_url or None) if args.db_url is not None else None
+            cache = RedisSink.connect(args.redis_url or None) if args.redis_url is not None else None
+            board = QuoteBoard.for_master(args.board or DEFAULT_BOARD_PATH) if args.board is not None else None
+            try:
+                await run_daemon(crawler, sink, args.format, delta, cache, board)
+            finally:
+                if board is not None:
+                    board.close()
+                if sink is not None:
+                    sink.close()
+                if cache is not None:
+                    cache.close()
+        else:
+            symbols = parse_symbols(args.symbols)
+            crawler.metrics.queue_depth = len(symbols)
+            results = await crawl_symbols(crawler, symbols)
+            if delta is not None:
+                results = delta.filter(results)
+                delta.save()
+                logger.info(f"Suppressed {delta.suppressed} unchanged quotes")
+            
+            # Output results (JSON unless --format says otherwise)
+            emit_results(results, args.format)
+            if args.redis_url is not None:
+                publish_results(results, args.redis_url or None)
     
-    # Output results as JSON
-    print(json.dumps(results))
+    # Per-request timing summary goes to stderr with the logs
+    crawler.timer.emit()
+    if args.stats_file:
+        crawler.metrics.write_stats_file(args.stats_file)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
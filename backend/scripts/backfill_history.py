@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parallel OHLCV backfill from Naver's chart API (fchart.stock.naver.com).
+
+Fetches daily, weekly or monthly bars for the whole tracked universe with
+bounded concurrency and a per-host rate limit, parses the EUC-KR XML
+incrementally as it streams in, and upserts daily bars into PriceHistory in
+batches, so NaverChartService/StockDataService find history in the
+database instead of calling upstream per chart.
+
+Progress is kept in a state file: an interrupted run resumes with the
+symbols it hadn't finished, and later runs only request the bars since each
+symbol's last stored date. Chart responses are revalidated with their
+ETag / Last-Modified, so a chart that hasn't changed since the last run
+comes back as a bodiless 304.
+
+Usage:
+    backfill_history.py                         # tracked stocks, daily, DATABASE_URL
+    backfill_history.py 005930,000660 --count 1000
+    backfill_history.py --timeframe week --out ./charts
+"""
+
+import argparse
+import asyncio
+import codecs
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+import aiohttp
+import backoff
+
+from connection_warmup import prewarm_aiohttp, tcp_connector
+from crawler_metrics import CrawlerMetrics
+from db_sink import QuoteSink
+from http_cache import DEFAULT_CACHE_DIR, ValidatorCache
+from rate_limit import HostRateLimiter
+from request_timing import RequestTimer
+
+logger = logging.getLogger(__name__)
+
+CHART_URL = 'https://fchart.stock.naver.com/sise.nhn'
+
+TIMEFRAMES = ('day', 'week', 'month')
+
+# Bars requested for a symbol with no history yet: ~2 years of days,
+# 5 years of weeks, 10 years of months
+DEFAULT_COUNT = {'day': 500, 'week': 260, 'month': 120}
+
+# Days per bar, to size incremental requests
+BAR_DAYS = {'day': 1, 'week': 7, 'month': 30}
+
+STATE_PATH = os.path.join(DEFAULT_CACHE_DIR, 'backfill_state.json')
+
+# Own file: a stored chart is far bigger than a parsed quote page
+VALIDATOR_PATH = os.path.join(DEFAULT_CACHE_DIR, 'chart_validators.json')
+
+CHUNK_SIZE = 16384
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Referer': 'https://finance.naver.com',
+}
+
+# (date 'YYYYMMDD', open, high, low, close, volume)
+Bar = Tuple[str, int, int, int, int, int]
+
+
+class ChartBarParser:
+    """Incremental parser for the sise.nhn XML
+
+    The body is EUC-KR, which expat can't decode itself, so chunks go through
+    an incremental decoder first. Parsed <item> elements are dropped right
+    away, so memory stays flat however many bars are requested.
+    """
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('euc-kr')(errors='replace')
+        self.parser = XMLPullParser(events=('start', 'end'))
+        self.chart = None
+        self.name: Optional[str] = None
+        self.bars: List[Bar] = []
+
+    def feed(self, chunk: bytes):
+        self.parser.feed(self.decoder.decode(chunk))
+        self._drain()
+
+    def close(self) -> List[Bar]:
+        self.parser.feed(self.decoder.decode(b'', final=True))
+        self.parser.close()
+        self._drain()
+        return self.bars
+
+    def _drain(self):
+        for event, element in self.parser.read_events():
+            if event == 'start':
+                if element.tag == 'chartdata':
+                    self.chart = element
+                    self.name = element.get('name')
+                continue
+            if element.tag == 'item':
+                bar = self._bar(element.get('data', ''))
+                if bar:
+                    self.bars.append(bar)
+        if self.chart is not None:
+            # Attributes were read on 'start'; finished items aren't needed
+            del self.chart[:]
+
+    @staticmethod
+    def _bar(data: str) -> Optional[Bar]:
+        values = data.split('|')
+        if len(values) < 6 or len(values[0]) != 8:
+            return None
+        try:
+            return (values[0],) + tuple(int(float(value)) for value in values[1:6])
+        except ValueError:
+            # Days without trades come through as "null"
+            return None
+
+
+class BackfillState:
+    """Last stored bar date per timeframe and symbol, plus the day it was fetched"""
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable backfill state {path}: {e}")
+            self.data = {}
+
+    def get(self, timeframe: str, symbol: str) -> Dict[str, str]:
+        return self.data.get(timeframe, {}).get(symbol, {})
+
+    def done(self, timeframe: str, symbol: str, last_date: Optional[str]):
+        entry = self.data.setdefault(timeframe, {}).setdefault(symbol, {})
+        if last_date and last_date > entry.get('last', ''):
+            entry['last'] = last_date
+        entry['fetched'] = date.today().isoformat()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+
+def bars_needed(state: Dict[str, str], timeframe: str, count: int) -> int:
+    """Full count for a new symbol, else enough to cover the gap since the last bar"""
+    last = state.get('last')
+    if not last:
+        return count
+    gap_days = (date.today() - datetime.strptime(last, '%Y%m%d').date()).days
+    # A couple of extra bars so a revised last bar gets overwritten
+    return max(3, min(count, gap_days // BAR_DAYS[timeframe] + 3))
+
+
+class Backfiller:
+    def __init__(self, args, sink: Optional[QuoteSink], stock_ids: Dict[str, Optional[str]]):
+        self.args = args
+        self.sink = sink
+        self.stock_ids = stock_ids
+        self.state = BackfillState()
+        self.timer = RequestTimer()
+        self.metrics = CrawlerMetrics('backfill_history')
+        self.cache = ValidatorCache(VALIDATOR_PATH, metrics=self.metrics)
+        self.limiter = HostRateLimiter(args.rate)
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.session = None
+        self.bars_written = 0
+        self.failed: List[str] = []
+
+    @backoff.on_exception(backoff.expo, (aiohttp.ClientError, asyncio.TimeoutError), max_tries=3, max_time=60)
+    async def fetch(self, symbol: str, count: int) -> List[Bar]:
+        params = {'symbol': symbol, 'timeframe': self.args.timeframe, 'count': count, 'requestType': 0}
+        url = f'{CHART_URL}?{urlencode(params)}'
+        headers = {**HEADERS, **self.cache.conditional_headers(url)}
+        await self.limiter.for_url(CHART_URL).acquire()
+        async with self.session.get(url, headers=headers,
+                                    timeout=aiohttp.ClientTimeout(total=30),
+                                    trace_request_ctx={'source': 'naver_chart', 'symbol': symbol}) as response:
+            stored = self.cache.revalidated(url, response)
+            if stored is not None:
+                return [tuple(bar) for bar in stored]
+            response.raise_for_status()
+            parser = ChartBarParser()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                parser.feed(chunk)
+            bars = parser.close()
+            self.cache.store(url, response, bars)
+            return bars
+
+    async def fetch_symbol(self, symbol: str) -> Tuple[str, Optional[List[Bar]]]:
+        count = self.args.count
+        if not self.args.full:
+            count = bars_needed(self.state.get(self.args.timeframe, symbol), self.args.timeframe, count)
+        async with self.semaphore:
+            started = time.perf_counter()
+            bars = None
+            try:
+                bars = await self.fetch(symbol, count)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ParseError) as e:
+                logger.warning(f"Chart fetch failed for {symbol}: {e}")
+            finally:
+                self.metrics.observe_request('naver_chart', time.perf_counter() - started, bars is not None)
+                self.metrics.queue_depth -= 1
+        self.metrics.observe_symbol(bars is not None)
+        return symbol, bars
+
+    def write_batch(self, batch: List[Tuple[str, List[Bar]]]):
+        """Store one batch of symbols, then record them as done (runs in a worker thread)"""
+        if self.sink is not None:
+            rows = [
+                (self.stock_ids[symbol], datetime.strptime(bar[0], '%Y%m%d')) + bar[1:]
+                for symbol, bars in batch for bar in bars
+            ]
+            self.bars_written += self.sink.upsert_price_history(rows)
+        if self.args.out:
+            for symbol, bars in batch:
+                self.bars_written += write_chart_file(self.args.out, symbol, self.args.timeframe, bars)
+        for symbol, bars in batch:
+            self.state.done(self.args.timeframe, symbol, max((bar[0] for bar in bars), default=None))
+        self.state.save()
+
+    async def run(self, symbols: List[str]):
+        loop = asyncio.get_running_loop()
+        connector = tcp_connector(limit_per_host=self.args.concurrency)
+        async with aiohttp.ClientSession(connector=connector, trace_configs=[self.timer.trace_config()]) as session:
+            self.session = session
+            await prewarm_aiohttp(session, [CHART_URL])
+            self.metrics.queue_depth = len(symbols)
+
+            batch: List[Tuple[str, List[Bar]]] = []
+            tasks = [asyncio.ensure_future(self.fetch_symbol(symbol)) for symbol in symbols]
+            for next_done in asyncio.as_completed(tasks):
+                symbol, bars = await next_done
+                if bars is None:
+                    self.failed.append(symbol)
+                    continue
+                batch.append((symbol, bars))
+                if len(batch) >= self.args.batch_symbols:
+                    # Fetches keep running while the batch is written
+                    await loop.run_in_executor(None, self.write_batch, batch)
+                    batch = []
+            if batch:
+                await loop.run_in_executor(None, self.write_batch, batch)
+
+
+def write_chart_file(out_dir: str, symbol: str, timeframe: str, bars: List[Bar]) -> int:
+    """Merge bars into out_dir/<symbol>_<timeframe>.json (NaverChartService item shape)"""
+    path = os.path.join(out_dir, f'{symbol}_{timeframe}.json')
+    items = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            items = {item['date']: item for item in json.load(f)}
+    except (OSError, ValueError):
+        pass
+    for day, open_, high, low, close, volume in bars:
+        key = f'{day[:4]}-{day[4:6]}-{day[6:]}'
+        items[key] = {'date': key, 'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump([items[key] for key in sorted(items)], f)
+    os.replace(tmp_path, path)
+    return len(bars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill OHLCV history from Naver chart data')
+    parser.add_argument('symbols', nargs='?', help='Comma-separated stock codes (default: tracked stocks)')
+    parser.add_argument('--timeframe', choices=TIMEFRAMES, default='day')
+    parser.add_argument('--count', type=int, help='Bars per new symbol (default depends on timeframe)')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore saved progress and fetch --count bars for every symbol')
+    parser.add_argument('--db-url', help='Database to write PriceHistory to (default DATABASE_URL)')
+    parser.add_argument('--no-db', action='store_true', help="Don't write to the database")
+    parser.add_argument('--out', metavar='DIR', help='Also write <symbol>_<timeframe>.json files here')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight')
+    parser.add_argument('--rate', type=float, default=10.0, help='Requests per second per host')
+    parser.add_argument('--batch-symbols', type=int, default=50, help='Symbols per database write')
+    parser.add_argument('--stats-file',
+                        help='Write run metrics here when done (JSON, or Prometheus text for *.prom)')
+    args = parser.parse_args()
+    args.count = args.count or DEFAULT_COUNT[args.timeframe]
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    sink = None
+    if not args.no_db:
+        if args.timeframe != 'day':
+            parser.error("PriceHistory holds daily bars only; use --no-db --out DIR for week/month")
+        sink = QuoteSink.connect(args.db_url)
+    elif not args.out:
+        parser.error("Nothing to write: give --out DIR or drop --no-db")
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    requested = [code.strip() for code in args.symbols.split(',') if code.strip()] if args.symbols else None
+    if sink is not None:
+        stock_ids = sink.stock_ids(requested)
+        missing = sorted(set(requested or []) - set(stock_ids))
+        if missing:
+            logger.warning(f"Not in the Stock table, skipped: {', '.join(missing)}")
+    elif requested:
+        stock_ids = dict.fromkeys(requested)
+    else:
+        parser.error("Give symbols when running without a database")
+
+    backfiller = Backfiller(args, sink, stock_ids)
+
+    # Naver charts cover KRX codes only
+    symbols = [symbol for symbol in stock_ids if len(symbol) == 6 and symbol.isalnum()]
+    if not args.full:
+        # Symbols finished earlier today were already brought up to date
+        today = date.today().isoformat()
+        symbols = [symbol for symbol in symbols
+                   if backfiller.state.get(args.timeframe, symbol).get('fetched') != today]
+    try:
+        asyncio.run(backfiller.run(symbols))
+    finally:
+        backfiller.cache.save()
+        if sink is not None:
+            sink.close()
+
+    print(json.dumps({
+        'timeframe': args.timeframe,
+        'symbols': len(symbols),
+        'bars': backfiller.bars_written,
+        'failed': backfiller.failed,
+    }))
+    backfiller.timer.emit()
+    if args.stats_file:
+        backfiller.metrics.write_stats_file(args.stats_file)
+
+
+if __name__ == '__main__':
+    main()
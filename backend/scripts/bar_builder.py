@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental intraday OHLCV bars from successive quote polls.
+
+Each poll updates the current 1, 5 and 15-minute bar of its symbol: the
+first price in a bar is the open, the last the close. Quote APIs report the
+day's cumulative volume (Naver "aq", KIS "acml_vol"), so a bar's volume is
+the sum of the increases between polls; a drop means a new session, and the
+new total counts from zero. Polls from sources without a real volume
+move the prices only.
+
+Bars live in a fixed-size ring per symbol and interval, stored in one flat
+array of doubles, so a symbol costs the same memory all day. Bars whose
+period has passed are handed out in bulk by flush(). Each slot counts its
+updates and remembers the count that was written, so a bar that changes
+after it went out (a quote source whose timestamps lag the clock) is handed
+out again; the database upsert overwrites it. If the ring wraps before a
+flush succeeds, the oldest unwritten bars are lost.
+"""
+
+import logging
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Callable, Container, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = (1, 5, 15)
+
+# Bars kept per symbol and interval; an hour of 1-minute bars between flushes
+CAPACITY = 64
+
+# Fields of one bar slot: the bar, how often it was updated, and the update
+# count that was last written
+_START, _OPEN, _HIGH, _LOW, _CLOSE, _VOLUME, _REVISION, _WRITTEN = range(8)
+_FIELDS = 8
+
+
+def _epoch(value: Any) -> Optional[float]:
+    """Quote timestamp as epoch seconds; naive ISO strings are local time, as in db_sink"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+class SymbolBars:
+    """Ring buffers of one symbol, one per interval, in a single array"""
+
+    __slots__ = ('data', 'heads', 'counts', 'last_ts', 'last_volume')
+
+    def __init__(self, intervals: int, capacity: int):
+        self.data = array('d', bytes(8 * _FIELDS * capacity * intervals))
+        self.heads = [-1] * intervals    # slot of the newest bar
+        self.counts = [0] * intervals
+        self.last_ts: Optional[float] = None
+        self.last_volume: Optional[int] = None
+
+
+class BarBuilder:
+    def __init__(self, intervals: Sequence[int] = INTERVALS, capacity: int = CAPACITY):
+        self.intervals = tuple(intervals)
+        self.seconds = tuple(minutes * 60 for minutes in self.intervals)
+        self.capacity = capacity
+        self.symbols: Dict[str, SymbolBars] = {}
+        self.late = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def update(self, symbol: str, ts: float, price: float, cumulative_volume: Optional[int] = 0):
+        """Fold one poll into the symbol's bars; older or repeated polls are ignored
+
+        cumulative_volume None means the source doesn't report volume.
+        """
+        bars = self.symbols.get(symbol)
+        if bars is None:
+            bars = self.symbols[symbol] = SymbolBars(len(self.intervals), self.capacity)
+        if bars.last_ts is not None and ts <= bars.last_ts:
+            self.late += 1
+            return
+        bars.last_ts = ts
+
+        if cumulative_volume is None or bars.last_volume is None:
+            # No volume from this source, or nothing to diff against yet
+            volume = 0
+        elif cumulative_volume < bars.last_volume:
+            volume = cumulative_volume
+        else:
+            volume = cumulative_volume - bars.last_volume
+        if cumulative_volume is not None:
+            bars.last_volume = cumulative_volume
+
+        data = bars.data
+        capacity = self.capacity
+        for i, seconds in enumerate(self.seconds):
+            start = ts - ts % seconds
+            head = bars.heads[i]
+            base = (i * capacity + head) * _FIELDS
+            if head >= 0 and data[base + _START] == start:
+                if price > data[base + _HIGH]:
+                    data[base + _HIGH] = price
+                if price < data[base + _LOW]:
+                    data[base + _LOW] = price
+                data[base + _CLOSE] = price
+                data[base + _VOLUME] += volume
+                data[base + _REVISION] += 1
+                continue
+
+            head = (head + 1) % capacity
+            base = (i * capacity + head) * _FIELDS
+            if bars.counts[i] == capacity and data[base + _REVISION] != data[base + _WRITTEN]:
+                self.dropped += 1
+            bars.heads[i] = head
+            bars.counts[i] = min(bars.counts[i] + 1, capacity)
+            data[base:base + _FIELDS] = array('d', (start, price, price, price, price, volume, 1, 0))
+
+    def add(self, quotes: Iterable[Dict[str, Any]], volume_sources: Optional[Container[str]] = None) -> int:
+        """Update from crawler quotes; error rows and rows without a price are skipped
+
+        With volume_sources, only quotes from those sources carry volume.
+        """
+        count = 0
+        for quote in quotes:
+            if 'error' in quote or not quote.get('symbol'):
+                continue
+            price = quote.get('currentPrice') or 0
+            ts = _epoch(quote.get('timestamp'))
+            if price <= 0 or ts is None:
+                continue
+            if volume_sources is None or quote.get('source') in volume_sources:
+                volume = int(quote.get('volume') or 0)
+            else:
+                volume = None
+            self.update(quote['symbol'], ts, float(price), volume)
+            count += 1
+        return count
+
+    def finished(self, now: Optional[float] = None) -> Tuple[List[Tuple], List[Tuple]]:
+        """Bars whose period is over and that changed since they were last written
+
+        Returns the rows (symbol, interval minutes, start as naive UTC, open,
+        high, low, close, volume) and the marks to pass to mark_flushed().
+        """
+        now = time.time() if now is None else now
+        rows = []
+        marks = []
+        capacity = self.capacity
+        for symbol, bars in self.symbols.items():
+            data = bars.data
+            for i, seconds in enumerate(self.seconds):
+                count = bars.counts[i]
+                if not count:
+                    continue
+                # Oldest to newest
+                for back in range(count - 1, -1, -1):
+                    base = (i * capacity + (bars.heads[i] - back) % capacity) * _FIELDS
+                    start = data[base + _START]
+                    if start + seconds > now:
+                        break
+                    if data[base + _REVISION] == data[base + _WRITTEN]:
+                        continue
+                    rows.append((
+                        symbol,
+                        self.intervals[i],
+                        datetime.fromtimestamp(start, timezone.utc).replace(tzinfo=None),
+                        data[base + _OPEN],
+                        data[base + _HIGH],
+                        data[base + _LOW],
+                        data[base + _CLOSE],
+                        int(data[base + _VOLUME]),
+                    ))
+                    marks.append((data, base, start, data[base + _REVISION]))
+        return rows, marks
+
+    @staticmethod
+    def mark_flushed(marks: List[Tuple]):
+        """Record the bars as written, as of the state finished() returned"""
+        for data, base, start, revision in marks:
+            # The slot may hold a newer bar by now
+            if data[base + _START] == start:
+                data[base + _WRITTEN] = revision
+
+    def flush(self, write: Callable[[List[Tuple]], Any], now: Optional[float] = None) -> int:
+        """Pass every finished bar to write() in one call
+
+        If write raises, the bars stay buffered for the next flush.
+        """
+        rows, marks = self.finished(now)
+        if not rows:
+            return 0
+        write(rows)
+        self.mark_flushed(marks)
+        if self.dropped:
+            logger.warning(f"{self.dropped} intraday bars were overwritten before they could be flushed")
+            self.dropped = 0
+        return len(rows)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Low-overhead crawler metrics.
+
+Counters, gauges and per-source latency histograms kept in plain dicts and
+lists so the hot path is a couple of dict lookups. In daemon mode they are
+served as Prometheus text exposition; CLI runs write them to a stats file.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; crawler requests range from ~50ms JSON APIs to 10s timeouts
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Consecutive failures after which a source's circuit is reported open
+CIRCUIT_FAILURE_THRESHOLD = 5
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+
+class CrawlerMetrics:
+    """Request/failure/retry counters, circuit state and latency per source"""
+
+    def __init__(self, crawler: str):
+        self.crawler = crawler
+        self.started_at = time.time()
+        self.requests: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+        self.retries: Dict[str, int] = {}
+        self.consecutive_failures: Dict[str, int] = {}
+        self.latency: Dict[str, Histogram] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced = 0
+        self.queue_depth = 0
+        self.symbols_ok = 0
+        self.symbols_failed = 0
+
+    # recording ---------------------------------------------------------------
+
+    def observe_request(self, source: str, seconds: float, ok: bool):
+        self.requests[source] = self.requests.get(source, 0) + 1
+        histogram = self.latency.get(source)
+        if histogram is None:
+            histogram = self.latency[source] = Histogram()
+        histogram.observe(seconds)
+        if ok:
+            self.consecutive_failures[source] = 0
+        else:
+            self.failures[source] = self.failures.get(source, 0) + 1
+            self.consecutive_failures[source] = self.consecutive_failures.get(source, 0) + 1
+
+    def observe_retry(self, source: str):
+        self.retries[source] = self.retries.get(source, 0) + 1
+
+    def observe_cache(self, hit: bool):
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def observe_coalesced(self):
+        self.coalesced += 1
+
+    def observe_symbol(self, ok: bool):
+        if ok:
+            self.symbols_ok += 1
+        else:
+            self.symbols_failed += 1
+
+    def circuit_open(self, source: str) -> bool:
+        return self.consecutive_failures.get(source, 0) >= CIRCUIT_FAILURE_THRESHOLD
+
+    def cache_hit_ratio(self) -> Optional[float]:
+        lookups = self.cache_hits + self.cache_misses
+        return round(self.cache_hits / lookups, 4) if lookups else None
+
+    # export ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict:
+        """Plain dict view, used for the CLI stats file"""
+        sources = sorted(set(self.requests) | set(self.retries))
+        return {
+            'crawler': self.crawler,
+            'started_at': self.started_at,
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'queue_depth': self.queue_depth,
+            'coalesced': self.coalesced,
+            'symbols': {'ok': self.symbols_ok, 'failed': self.symbols_failed},
+            'cache': {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_ratio': self.cache_hit_ratio(),
+            },
+            'sources': {
+                source: {
+                    'requests': self.requests.get(source, 0),
+                    'failures': self.failures.get(source, 0),
+                    'retries': self.retries.get(source, 0),
+                    'circuit': 'open' if self.circuit_open(source) else 'closed',
+                    'latency_seconds': {
+                        'count': self.latency[source].count,
+                        'sum': round(self.latency[source].sum, 6),
+                        'buckets': dict(self.latency[source].cumulative()),
+                    } if source in self.latency else None,
+                }
+                for source in sources
+            },
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        crawler = self.crawler
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def per_source(name: str, kind: str, help_text: str, values: Dict[str, float]):
+            family(name, kind, help_text)
+            for source, value in sorted(values.items()):
+                lines.append(f'{name}{{crawler="{crawler}",source="{source}"}} {value}')
+
+        per_source('crawler_requests_total', 'counter', 'Upstream requests per source', self.requests)
+        per_source('crawler_failures_total', 'counter', 'Failed upstream requests per source', self.failures)
+        per_source('crawler_retries_total', 'counter', 'Retried upstream requests per source', self.retries)
+        per_source('crawler_circuit_open', 'gauge',
+                   f'1 when a source failed {CIRCUIT_FAILURE_THRESHOLD}+ times in a row',
+                   {source: int(self.circuit_open(source)) for source in self.requests})
+
+        family('crawler_request_duration_seconds', 'histogram', 'Upstream request latency per source')
+        for source, histogram in sorted(self.latency.items()):
+            labels = f'crawler="{crawler}",source="{source}"'
+            for bound, count in histogram.cumulative():
+                lines.append(f'crawler_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'crawler_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'crawler_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+        family('crawler_cache_hits_total', 'counter', 'Response cache hits')
+        lines.append(f'crawler_cache_hits_total{{crawler="{crawler}"}} {self.cache_hits}')
+        family('crawler_cache_misses_total', 'counter', 'Response cache misses')
+        lines.append(f'crawler_cache_misses_total{{crawler="{crawler}"}} {self.cache_misses}')
+        family('crawler_coalesced_total', 'counter', 'Lookups served by an identical in-flight fetch')
+        lines.append(f'crawler_coalesced_total{{crawler="{crawler}"}} {self.coalesced}')
+        family('crawler_symbols_total', 'counter', 'Symbols processed by outcome')
+        lines.append(f'crawler_symbols_total{{crawler="{crawler}",outcome="ok"}} {self.symbols_ok}')
+        lines.append(f'crawler_symbols_total{{crawler="{crawler}",outcome="failed"}} {self.symbols_failed}')
+        family('crawler_queue_depth', 'gauge', 'Symbols waiting or in flight')
+        lines.append(f'crawler_queue_depth{{crawler="{crawler}"}} {self.queue_depth}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_stats_file(self, path: str):
+        """Write a JSON snapshot, or Prometheus text if the path ends in .prom"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.render_prometheus())
+            else:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        # Atomic replace so textfile collectors never see a partial file
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+        """Serve /metrics from a background thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
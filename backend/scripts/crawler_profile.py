@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+--profile support for the crawler entry points.
+
+A run is profiled twice at once: cProfile on the calling thread (which is
+the event loop thread for the asyncio crawlers) gives exact call counts in a
+.pstats file, and a sampling thread walks every thread's stack at a fixed
+interval to write a collapsed-stack .collapsed file for flamegraph.pl or
+speedscope. The sampler also sees executor threads (cloudscraper) and time
+spent idle in the event loop or in sleeps, which cProfile attributes poorly.
+"""
+
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+
+def default_profile_prefix(script: str, near: Optional[str] = None) -> str:
+    """<script>-<timestamp>, placed next to `near` (an output file) or in the cwd"""
+    stem = os.path.splitext(os.path.basename(script))[0]
+    directory = os.path.dirname(os.path.abspath(near)) if near else os.getcwd()
+    return os.path.join(directory, f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+
+
+class StackSampler(threading.Thread):
+    """Samples all thread stacks into collapsed-stack counts"""
+
+    def __init__(self, interval: float = 0.005):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f'thread-{thread_id}'))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class profile_run:
+    """Context manager writing <prefix>.pstats and <prefix>.collapsed"""
+
+    def __init__(self, prefix: str, interval: float = 0.005):
+        self.prefix = prefix
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(interval)
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.disable()
+        self.sampler.stop()
+        directory = os.path.dirname(self.prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.profiler.dump_stats(f"{self.prefix}.pstats")
+        self.sampler.write(f"{self.prefix}.collapsed")
+        print(
+            f"Profile written to {self.prefix}.pstats and {self.prefix}.collapsed "
+            f"({time.perf_counter() - self.started:.2f}s, {sum(self.sampler.samples.values())} samples)",
+            file=sys.stderr
+        )
+        return False
@@ -5,6 +5,7 @@ import requests
 import json
 import sys
 from datetime import datetime
+from symbol_master import lookup_name
 
 class DaumAPICrawler:
     def __init__(self):
@@ -31,7 +32,7 @@ class DaumAPICrawler:
                 # Extract price data
                 return {
                     "symbol": symbol,
-                    "name": data.get('name', 'Unknown'),
+                    "name": data.get('name') or lookup_name(symbol) or 'Unknown',
                     "currentPrice": int(data.get('tradePrice', 0)),
                     "previousClose": int(data.get('prevClosingPrice', 0)),
                     "change": int(data.get('change', 0)),
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bulk database sink for crawled quotes.
+
+Writes a whole batch the way CrawlerStockService.updateDatabaseWithCrawledData
+does row by row: update the price columns of the existing "Stock" rows and
+append one "StockPriceHistory" row each, skipping symbols that aren't in the
+Stock table. On Postgres that is a single statement (a data-modifying CTE),
+so a 60-symbol refresh costs one round trip plus the commit. SQLite works as
+a local stand-in with the same tables.
+
+Table and column names follow prisma/schema.prisma. Prisma fills ids and
+updatedAt on the client, so this module does too.
+"""
+
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Columns of one batch row, in VALUES order. bucket_start/bucket_end are set
+# by the history buffer: a row is only appended if its symbol has no history
+# in that window yet
+ROW_COLUMNS = ('symbol', 'history_id', 'currentPrice', 'previousClose', 'dayOpen', 'dayHigh',
+               'dayLow', 'volume', 'change', 'changePercent', 'ts', 'bucket_start', 'bucket_end')
+
+# SQLite caps bound parameters per statement (32766 since 3.32)
+SQLITE_BATCH_ROWS = 2000
+SQLITE_BAR_ROWS = 4000
+SQLITE_INTRADAY_ROWS = 3500
+
+_BASE36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+_cuid_lock = threading.Lock()
+_cuid_counter = random.randrange(36 ** 4)
+
+
+def _base36(number: int, width: int) -> str:
+    digits = []
+    while number:
+        number, digit = divmod(number, 36)
+        digits.append(_BASE36[digit])
+    return ''.join(reversed(digits)).rjust(width, '0')[-width:]
+
+
+_FINGERPRINT = _base36(os.getpid(), 2) + _base36(sum(socket.gethostname().encode()) + 36, 2)
+
+
+def new_cuid() -> str:
+    """25-character id in the layout of Prisma's cuid()
+
+    'c' + timestamp + counter + host fingerprint + random block, all base36.
+    """
+    global _cuid_counter
+    with _cuid_lock:
+        _cuid_counter = (_cuid_counter + 1) % (36 ** 4)
+        counter = _cuid_counter
+    return ('c' + _base36(int(time.time() * 1000), 8) + _base36(counter, 4)
+            + _FINGERPRINT + _base36(random.getrandbits(42), 8))
+
+
+def _utc_timestamp(value: Any) -> datetime:
+    """Quote timestamp as naive UTC, which is how Prisma stores DateTime
+
+    Crawlers emit local-time ISO strings or epoch seconds.
+    """
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        try:
+            # Naive values are local time, like new Date(...) on the Node side
+            return datetime.fromisoformat(value).astimezone(timezone.utc).replace(tzinfo=None)
+        except ValueError:
+            pass
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def quote_rows(quotes: Iterable[Dict[str, Any]]) -> List[Tuple]:
+    """Batch rows for the usable quotes, one per symbol and timestamp"""
+    rows = {}
+    for quote in quotes:
+        if 'error' in quote or not quote.get('symbol'):
+            continue
+        price = quote.get('currentPrice') or 0
+        if price <= 0:
+            continue
+        timestamp = _utc_timestamp(quote.get('timestamp'))
+        rows[quote['symbol'], timestamp] = (
+            quote['symbol'],
+            new_cuid(),
+            price,
+            quote.get('previousClose') or 0,
+            quote.get('dayOpen') or price,
+            quote.get('dayHigh') or price,
+            quote.get('dayLow') or price,
+            int(quote.get('volume') or 0),
+            quote.get('change') or 0,
+            quote.get('changePercent') or 0,
+            timestamp,
+            None,
+            None,
+        )
+    return list(rows.values())
+
+
+_DATA_CTE = 'data (symbol, history_id, "currentPrice", "previousClose", "dayOpen", "dayHigh", "dayLow", ' \
+            'volume, change, "changePercent", ts, bucket_start, bucket_end) AS (VALUES {values})'
+
+# Latest quote per symbol sets the Stock row, unless a newer one already did
+# (a replayed spool can carry old quotes)
+_SET_PRICES = '''"currentPrice" = d."currentPrice", "previousClose" = d."previousClose",
+    "dayOpen" = d."dayOpen", "dayHigh" = d."dayHigh", "dayLow" = d."dayLow", volume = d.volume,
+    change = d.change, "changePercent" = d."changePercent",
+    "lastPriceUpdate" = d.ts, "updatedAt" = {now}'''
+
+_NOT_OLDER = '(s."lastPriceUpdate" IS NULL OR s."lastPriceUpdate" <= d.ts)'
+
+_HISTORY_COLUMNS = '''(id, "stockId", symbol, "currentPrice", "previousClose", "dayOpen", "dayHigh", "dayLow",
+    volume, change, "changePercent", timestamp, source, "createdAt")'''
+
+_HISTORY_SELECT = '''SELECT d.history_id, s.id, d.symbol, d."currentPrice", d."previousClose", d."dayOpen",
+    d."dayHigh", d."dayLow", d.volume, d.change, d."changePercent", d.ts, {source}, {now}
+FROM data d JOIN "Stock" s ON s.symbol = d.symbol
+WHERE NOT EXISTS (
+    SELECT 1 FROM "StockPriceHistory" h
+    WHERE h.symbol = d.symbol AND h.timestamp >= d.bucket_start AND h.timestamp < d.bucket_end
+)'''
+
+# Prisma keeps DateTime columns as UTC timestamps without time zone
+POSTGRES_NOW = "(now() AT TIME ZONE 'UTC')"
+
+# One statement; the history INSERT joins Stock itself, so it doesn't depend
+# on the UPDATE (which a data-modifying CTE runs regardless). Replayed rows
+# keep their ids, hence ON CONFLICT DO NOTHING.
+POSTGRES_UPDATE_CTE = f''',
+updated AS (
+    UPDATE "Stock" s SET {_SET_PRICES.format(now=POSTGRES_NOW)}
+    FROM (SELECT DISTINCT ON (symbol) * FROM data ORDER BY symbol, ts DESC) d
+    WHERE s.symbol = d.symbol AND {_NOT_OLDER}
+)'''
+
+POSTGRES_SQL = f'''WITH {_DATA_CTE.format(values='%s')}{{update}}
+INSERT INTO "StockPriceHistory" {_HISTORY_COLUMNS}
+{_HISTORY_SELECT.format(source='%(source)s', now=POSTGRES_NOW)}
+ON CONFLICT (id) DO NOTHING'''
+
+POSTGRES_TEMPLATE = ('(%s, %s, %s::float8, %s::float8, %s::float8, %s::float8, %s::float8, '
+                     '%s::bigint, %s::float8, %s::float8, %s::timestamp, %s::timestamp, %s::timestamp)')
+
+# SQLite has no data-modifying CTEs, so the same work is two statements.
+# A bare column next to max() comes from the row holding the maximum.
+SQLITE_UPDATE_SQL = f'''WITH {_DATA_CTE}
+UPDATE "Stock" AS s SET {_SET_PRICES.format(now='CURRENT_TIMESTAMP')}
+FROM (SELECT *, max(ts) FROM data GROUP BY symbol) d
+WHERE s.symbol = d.symbol AND {_NOT_OLDER}'''
+
+# Prices only, for writers that buffer the history rows separately
+POSTGRES_PRICES_SQL = f'''WITH {_DATA_CTE.format(values='%s')}
+UPDATE "Stock" s SET {_SET_PRICES.format(now=POSTGRES_NOW)}
+FROM (SELECT DISTINCT ON (symbol) * FROM data ORDER BY symbol, ts DESC) d
+WHERE s.symbol = d.symbol AND {_NOT_OLDER}'''
+
+SQLITE_INSERT_SQL = f'''INSERT OR IGNORE INTO "StockPriceHistory" {_HISTORY_COLUMNS}
+WITH {_DATA_CTE}
+{_HISTORY_SELECT.format(source='?', now='CURRENT_TIMESTAMP')}'''
+
+# Daily bars; (stockId, date) is unique, so re-fetched days are overwritten
+PRICE_HISTORY_SQL = '''INSERT INTO "PriceHistory" (id, "stockId", date, open, high, low, close, volume, "createdAt")
+VALUES {values}
+ON CONFLICT ("stockId", date) DO UPDATE SET
+    open = excluded.open, high = excluded.high, low = excluded.low,
+    close = excluded.close, volume = excluded.volume'''
+
+POSTGRES_BAR_TEMPLATE = (f'(%s, %s, %s::timestamp, %s::float8, %s::float8, %s::float8, %s::float8, '
+                         f'%s::bigint, {POSTGRES_NOW})')
+
+
+# Intraday bars come keyed by symbol; symbols missing from Stock are skipped.
+# A re-flushed bar (after a restart) replaces the stored one
+INTRADAY_BAR_SQL = '''INSERT INTO "IntradayBar" (id, "stockId", interval, start, open, high, low, close, volume, "createdAt")
+WITH data (id, symbol, interval, start, open, high, low, close, volume) AS (VALUES {values})
+SELECT d.id, s.id, d.interval, d.start, d.open, d.high, d.low, d.close, d.volume, {now}
+FROM data d JOIN "Stock" s ON s.symbol = d.symbol
+WHERE true
+ON CONFLICT ("stockId", interval, start) DO UPDATE SET
+    open = excluded.open, high = excluded.high, low = excluded.low,
+    close = excluded.close, volume = excluded.volume'''
+
+POSTGRES_INTRADAY_TEMPLATE = ('(%s, %s, %s::int, %s::timestamp, %s::float8, %s::float8, %s::float8, '
+                              '%s::float8, %s::bigint)')
+
+
+# Demand per stock for the refresh scheduler: students holding it and
+# watching it, plus the inputs for volatility and staleness
+REFRESH_CANDIDATES_SQL = '''SELECT s.symbol, COALESCE(h.holders, 0), COALESCE(w.watchers, 0),
+    s."changePercent", s."lastPriceUpdate"
+FROM "Stock" s
+LEFT JOIN (SELECT "stockId", COUNT(*) AS holders FROM "Holding" WHERE quantity > 0 GROUP BY "stockId") h
+    ON h."stockId" = s.id
+LEFT JOIN (SELECT "stockId", COUNT(*) AS watchers FROM "Watchlist" GROUP BY "stockId") w
+    ON w."stockId" = s.id
+WHERE s."isActive" = {mark} AND (s."isTracked" = {mark} OR h.holders > 0 OR w.watchers > 0)
+ORDER BY s.symbol'''
+
+
+def _serialized(method: Callable) -> Callable:
+    """Run the method under the sink's lock"""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class QuoteSink:
+    """Bulk writer over a DB-API connection (psycopg2 or sqlite3)
+
+    The daemons call a sink from executor threads, several at once. Every
+    call holds the sink's lock, so each one's transaction runs alone on the
+    connection and a rollback can only undo its own work.
+    """
+
+    def __init__(self, connection, dialect: str):
+        if dialect not in ('postgres', 'sqlite'):
+            raise ValueError(f"Unsupported dialect: {dialect}")
+        self.connection = connection
+        self.dialect = dialect
+        self.lock = threading.RLock()
+
+    @classmethod
+    def connect(cls, url: Optional[str] = None) -> 'QuoteSink':
+        """postgresql://... (needs psycopg2), sqlite:///path or file:path; defaults to DATABASE_URL"""
+        url = url or os.environ.get('DATABASE_URL')
+        if not url:
+            raise ValueError("No database URL given and DATABASE_URL is not set")
+        scheme = urlsplit(url).scheme
+        if scheme in ('sqlite', 'file'):
+            # sqlite:///relative.db, sqlite:////absolute.db, or Prisma's file:./dev.db
+            path = url[len('sqlite:///'):] if scheme == 'sqlite' else url[len('file:'):]
+            # Used from executor threads, one call at a time under the lock
+            return cls(sqlite3.connect(path, check_same_thread=False), 'sqlite')
+        if scheme in ('postgres', 'postgresql'):
+            try:
+                import psycopg2
+            except ImportError:
+                raise RuntimeError("psycopg2 is required for Postgres: pip install psycopg2-binary")
+            # Prisma-style ?schema=public isn't a libpq option
+            return cls(psycopg2.connect(url.split('?', 1)[0]), 'postgres')
+        raise ValueError(f"Unsupported database URL scheme: {scheme}")
+
+    @_serialized
+    def close(self):
+        self.connection.close()
+
+    def write(self, quotes: Iterable[Dict[str, Any]], source: str = 'crawler') -> int:
+        """Update Stock and append StockPriceHistory for a batch in one transaction
+
+        Returns the number of history rows written (symbols missing from Stock
+        are skipped).
+        """
+        return self.write_rows(quote_rows(quotes), source)
+
+    @_serialized
+    def write_rows(self, rows: List[Tuple], source: str = 'crawler', update_stock: bool = True) -> int:
+        """write() for rows already in ROW_COLUMNS layout"""
+        if not rows:
+            return 0
+        started = time.perf_counter()
+        try:
+            if self.dialect == 'postgres':
+                written = self._write_postgres(rows, source, update_stock)
+            else:
+                written = self._write_sqlite(rows, source, update_stock)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        logger.info(f"Wrote {written}/{len(rows)} quotes in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return written
+
+    def _write_postgres(self, rows: List[Tuple], source: str, update_stock: bool) -> int:
+        from psycopg2.extras import execute_values
+
+        with self.connection.cursor() as cursor:
+            sql = POSTGRES_SQL.format(update=POSTGRES_UPDATE_CTE if update_stock else '')
+            # %(source)s has to survive execute_values' own formatting of %s
+            sql = sql.replace('%(source)s', cursor.mogrify('%s', (source,)).decode())
+            execute_values(cursor, sql, rows, template=POSTGRES_TEMPLATE, page_size=len(rows))
+            return cursor.rowcount
+
+    def _write_sqlite(self, rows: List[Tuple], source: str, update_stock: bool) -> int:
+        written = 0
+        cursor = self.connection.cursor()
+        # sqlite3 only opens a transaction implicitly before statements that
+        # start with INSERT/UPDATE/DELETE, and the price UPDATE starts with WITH
+        if not self.connection.in_transaction:
+            cursor.execute('BEGIN')
+        for start in range(0, len(rows), SQLITE_BATCH_ROWS):
+            values, params = self._sqlite_values(rows[start:start + SQLITE_BATCH_ROWS])
+            if update_stock:
+                cursor.execute(SQLITE_UPDATE_SQL.format(values=values), params)
+            cursor.execute(SQLITE_INSERT_SQL.format(values=values), params + [source])
+            written += cursor.rowcount
+        return written
+
+    @staticmethod
+    def _sqlite_values(chunk: List[Tuple]) -> Tuple[str, List]:
+        values = ', '.join(['(' + ', '.join('?' * len(ROW_COLUMNS)) + ')'] * len(chunk))
+        params = [value.isoformat(sep=' ', timespec='milliseconds') if isinstance(value, datetime) else value
+                  for row in chunk for value in row]
+        return values, params
+
+    @_serialized
+    def update_prices(self, rows: List[Tuple]) -> int:
+        """Only the Stock half of write_rows(): set the latest price per symbol
+
+        Returns the number of Stock rows updated.
+        """
+        if not rows:
+            return 0
+        try:
+            if self.dialect == 'postgres':
+                from psycopg2.extras import execute_values
+
+                with self.connection.cursor() as cursor:
+                    execute_values(cursor, POSTGRES_PRICES_SQL, rows, template=POSTGRES_TEMPLATE,
+                                   page_size=len(rows))
+                    updated = cursor.rowcount
+            else:
+                updated = 0
+                cursor = self.connection.cursor()
+                if not self.connection.in_transaction:
+                    cursor.execute('BEGIN')
+                for start in range(0, len(rows), SQLITE_BATCH_ROWS):
+                    values, params = self._sqlite_values(rows[start:start + SQLITE_BATCH_ROWS])
+                    cursor.execute(SQLITE_UPDATE_SQL.format(values=values), params)
+                    updated += cursor.rowcount
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return updated
+
+    @_serialized
+    def stock_ids(self, symbols: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """symbol -> Stock.id for the given symbols, or for every tracked active stock"""
+        mark = '%s' if self.dialect == 'postgres' else '?'
+        cursor = self.connection.cursor()
+        try:
+            if symbols is None:
+                cursor.execute(f'SELECT symbol, id FROM "Stock" WHERE "isTracked" = {mark} AND "isActive" = {mark} '
+                               'ORDER BY symbol', (True, True))
+            else:
+                symbols = list(symbols)
+                if not symbols:
+                    return {}
+                cursor.execute(f'SELECT symbol, id FROM "Stock" WHERE symbol IN ({", ".join([mark] * len(symbols))})',
+                               symbols)
+            return dict(cursor.fetchall())
+        finally:
+            cursor.close()
+
+    @_serialized
+    def refresh_candidates(self) -> List[Tuple]:
+        """Demand rows for the refresh scheduler
+
+        (symbol, holders, watchers, changePercent, lastPriceUpdate) for every
+        active stock that is tracked, held or on a watchlist.
+        """
+        mark = '%s' if self.dialect == 'postgres' else '?'
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(REFRESH_CANDIDATES_SQL.format(mark=mark), (True, True))
+            rows = cursor.fetchall()
+            # Don't leave the connection idle in a transaction between reloads
+            self.connection.commit()
+            return rows
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    @_serialized
+    def upsert_price_history(self, bars: List[Tuple]) -> int:
+        """Insert or overwrite daily PriceHistory bars in one transaction
+
+        bars are (stockId, date, open, high, low, close, volume) with date a
+        naive UTC midnight, as new Date('YYYY-MM-DD') gives on the Node side.
+        """
+        if not bars:
+            return 0
+        rows = [(new_cuid(),) + tuple(bar) for bar in bars]
+        try:
+            if self.dialect == 'postgres':
+                from psycopg2.extras import execute_values
+
+                with self.connection.cursor() as cursor:
+                    execute_values(cursor, PRICE_HISTORY_SQL.format(values='%s'), rows,
+                                   template=POSTGRES_BAR_TEMPLATE, page_size=len(rows))
+            else:
+                cursor = self.connection.cursor()
+                for start in range(0, len(rows), SQLITE_BAR_ROWS):
+                    chunk = rows[start:start + SQLITE_BAR_ROWS]
+                    values = ', '.join(['(?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)'] * len(chunk))
+                    params = [value.isoformat(sep=' ', timespec='milliseconds') if isinstance(value, datetime)
+                              else value for row in chunk for value in row]
+                    cursor.execute(PRICE_HISTORY_SQL.format(values=values), params)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return len(rows)
+
+    @_serialized
+    def upsert_intraday_bars(self, bars: List[Tuple]) -> int:
+        """Insert or overwrite IntradayBar rows in one transaction
+
+        bars are (symbol, interval minutes, start, open, high, low, close,
+        volume) with start as naive UTC. Returns the rows written.
+        """
+        if not bars:
+            return 0
+        rows = [(new_cuid(),) + tuple(bar) for bar in bars]
+        try:
+            if self.dialect == 'postgres':
+                from psycopg2.extras import execute_values
+
+                with self.connection.cursor() as cursor:
+                    execute_values(cursor, INTRADAY_BAR_SQL.format(values='%s', now=POSTGRES_NOW), rows,
+                                   template=POSTGRES_INTRADAY_TEMPLATE, page_size=len(rows))
+                    written = cursor.rowcount
+            else:
+                written = 0
+                cursor = self.connection.cursor()
+                for start in range(0, len(rows), SQLITE_INTRADAY_ROWS):
+                    chunk = rows[start:start + SQLITE_INTRADAY_ROWS]
+                    values = ', '.join(['(?, ?, ?, ?, ?, ?, ?, ?, ?)'] * len(chunk))
+                    params = [value.isoformat(sep=' ', timespec='milliseconds') if isinstance(value, datetime)
+                              else value for row in chunk for value in row]
+                    cursor.execute(INTRADAY_BAR_SQL.format(values=values, now='CURRENT_TIMESTAMP'), params)
+                    written += cursor.rowcount
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return written
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Delta-only emission for crawler results.
+
+Keeps the last emitted quote per symbol and lets a quote through only when
+one of its price fields or its volume moved by more than a relative epsilon,
+or when the symbol hasn't been emitted for `heartbeat` seconds. Outside
+trading hours and in midday lulls most polls return identical quotes; they
+stop turning into Stock updates, history rows, cache invalidations and
+leaderboard recomputes downstream.
+
+Error rows always pass. State is persisted between runs, like the
+last-good prices, in one file per consumer: what one pipeline emitted says
+nothing about what another one's downstream has seen.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from http_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+COMPARED_FIELDS = ('currentPrice', 'previousClose', 'dayOpen', 'dayHigh', 'dayLow', 'volume')
+
+# Re-emit an unchanged symbol this often, so consumers see it is still live
+HEARTBEAT_SECONDS = 900.0
+
+
+def default_state_path(consumer: str) -> str:
+    """.cache/last_emitted.<consumer>.json; consumer may be a script path"""
+    stem = os.path.splitext(os.path.basename(consumer))[0]
+    return os.path.join(DEFAULT_CACHE_DIR, f'last_emitted.{stem}.json')
+
+
+class DeltaFilter:
+    def __init__(self, epsilon: float = 0.0, heartbeat: float = HEARTBEAT_SECONDS, path: Optional[str] = None):
+        self.epsilon = epsilon
+        self.heartbeat = heartbeat
+        self.path = path or default_state_path('crawler')
+        # symbol -> [values of COMPARED_FIELDS..., emitted at (epoch seconds)]
+        self.last: Dict[str, List[float]] = {}
+        # Symbols emitted since the last save
+        self.changed: Set[str] = set()
+        self.suppressed = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.last = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable emission state {self.path}: {e}")
+
+    def _moved(self, previous: List[float], current: List[float]) -> bool:
+        for old, new in zip(previous, current):
+            if old == new:
+                continue
+            if abs(new - old) > self.epsilon * max(abs(old), abs(new)):
+                return True
+        return False
+
+    def filter(self, quotes: Iterable[Dict[str, Any]], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """The quotes worth emitting; records them as emitted"""
+        now = time.time() if now is None else now
+        emitted = []
+        for quote in quotes:
+            symbol = quote.get('symbol')
+            if 'error' in quote or not symbol:
+                emitted.append(quote)
+                continue
+            values = [float(quote.get(field) or 0) for field in COMPARED_FIELDS]
+            previous = self.last.get(symbol)
+            if (previous is not None and now - previous[-1] < self.heartbeat
+                    and not self._moved(previous[:-1], values)):
+                self.suppressed += 1
+                continue
+            self.last[symbol] = values + [now]
+            self.changed.add(symbol)
+            emitted.append(quote)
+        return emitted
+
+    def save(self):
+        if not self.changed:
+            return
+        changed = {symbol: self.last[symbol] for symbol in self.changed}
+        self.changed = set()
+        # Another run sharing the file may have emitted other symbols meanwhile
+        merged = changed
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                merged = {**json.load(f), **changed}
+        except (OSError, ValueError):
+            pass
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(merged, f)
+        os.replace(tmp_path, self.path)
@@ -5,7 +5,12 @@ import requests
 import json
 import sys
 from datetime import datetime
+import pandas as pd
 import yfinance as yf
+from symbol_master import default_master, lookup_name
+
+# Yahoo 시장 접미사
+MARKET_SUFFIXES = {'KOSPI': '.KS', 'KOSDAQ': '.KQ'}
 
 def get_stock_from_yahoo(symbol):
     """Yahoo Finance에서 주식 정보 가져오기"""
@@ -61,6 +66,81 @@ def get_stock_from_yahoo(symbol):
     
     return None
 
+def download_quotes(tickers):
+    """yfinance 일괄 다운로드 한 번으로 티커별 시세 계산 (2일치로 전일 종가까지)"""
+    data = yf.download(tickers, period="2d", auto_adjust=False, progress=False, threads=True)
+    if data is None or data.empty:
+        return pd.DataFrame()
+    if not isinstance(data.columns, pd.MultiIndex):
+        # 구버전 yfinance는 티커가 하나면 단일 레벨 컬럼으로 돌려줌
+        data.columns = pd.MultiIndex.from_product([data.columns, tickers])
+    
+    close = data['Close']
+    # 거래정지 종목은 마지막 행이 NaN이므로 먼저 제외 (round(NaN)은 ValueError)
+    current = close.iloc[-1].dropna()
+    previous = close.iloc[-2].reindex(current.index).fillna(current) if len(close) > 1 else current
+    change = current - previous
+    
+    def last(field):
+        return data[field].iloc[-1].reindex(current.index)
+    
+    quotes = pd.DataFrame({
+        'currentPrice': current,
+        'previousClose': previous,
+        'change': change,
+        'changePercent': (change / previous * 100).where(previous > 0, 0),
+        'dayOpen': last('Open').fillna(current),
+        'dayHigh': last('High').fillna(current),
+        'dayLow': last('Low').fillna(current),
+        'volume': last('Volume').fillna(0),
+    })
+    # 티커가 인덱스, 가격이 없는 티커는 제외
+    return quotes[quotes['currentPrice'] > 0]
+
+def get_stocks_from_yahoo_batch(symbols):
+    """전 종목을 한 번에 받고, 시장을 모르는 종목 중 빠진 것만 .KQ로 한 번 더 (ticker.info 호출 없음)"""
+    master = default_master()
+    # 심볼 마스터로 시장을 알면 접미사를 추측할 필요가 없음
+    known = {}
+    for symbol in symbols:
+        market = master.market(symbol) if master else None
+        if market in MARKET_SUFFIXES:
+            known[symbol] = MARKET_SUFFIXES[market]
+    
+    found = {}
+    passes = [
+        {symbol: known.get(symbol, '.KS') for symbol in symbols},
+        {symbol: '.KQ' for symbol in symbols if symbol not in known},
+    ]
+    for tickers in passes:
+        tickers = {f"{symbol}{suffix}": symbol for symbol, suffix in tickers.items() if symbol not in found}
+        if not tickers:
+            continue
+        try:
+            quotes = download_quotes(list(tickers))
+        except Exception as e:
+            print(f"Yahoo Finance batch error: {e}", file=sys.stderr)
+            continue
+        
+        timestamp = datetime.now().isoformat()
+        for ticker, row in zip(quotes.index, quotes.itertuples(index=False)):
+            symbol = tickers[ticker]
+            found[symbol] = {
+                "symbol": symbol,
+                "name": lookup_name(symbol) or symbol,
+                "currentPrice": round(row.currentPrice),
+                "previousClose": round(row.previousClose),
+                "change": round(row.change),
+                "changePercent": round(row.changePercent, 2),
+                "dayOpen": round(row.dayOpen),
+                "dayHigh": round(row.dayHigh),
+                "dayLow": round(row.dayLow),
+                "volume": int(row.volume),
+                "timestamp": timestamp,
+                "source": "yahoo_finance"
+            }
+    return found
+
 def get_stock_from_investing(symbol):
     """Investing.com API 사용 (백업)"""
     try:
@@ -111,17 +191,30 @@ def get_realtime_stock_price(symbol):
         "timestamp": datetime.now().isoformat()
     }
 
+def get_realtime_stock_prices(symbols):
+    """여러 종목을 일괄 다운로드로 조회, 빠진 종목만 대체 소스 시도"""
+    found = get_stocks_from_yahoo_batch(symbols)
+    results = []
+    for symbol in symbols:
+        result = found.get(symbol)
+        if not result:
+            result = get_stock_from_investing(symbol)
+        if not result:
+            result = {
+                "error": "Failed to fetch real-time price",
+                "symbol": symbol,
+                "timestamp": datetime.now().isoformat()
+            }
+        results.append(result)
+    return results
+
 def main():
     if len(sys.argv) < 2:
         print(json.dumps([{"error": "No stock codes provided"}]))
         sys.exit(1)
     
-    stock_codes = sys.argv[1].split(",")
-    results = []
-    
-    for code in stock_codes:
-        result = get_realtime_stock_price(code)
-        results.append(result)
+    stock_codes = list(dict.fromkeys(code.strip() for code in sys.argv[1].split(",") if code.strip()))
+    results = get_realtime_stock_prices(stock_codes)
     
     print(json.dumps(results, ensure_ascii=False))
 
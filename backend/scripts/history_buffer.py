@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Write-behind buffer for StockPriceHistory rows.
+
+Stock prices are written as soon as quotes arrive; only the history rows
+wait. They are collected in memory, keyed by (symbol, 5-minute bucket) so a
+symbol gets at most one history row per bucket, the same granularity as the
+Node priceHistoryCollector. The buffer is written through QuoteSink in one
+batch when it holds max_rows rows or its oldest row is max_age seconds old.
+Buckets that already have a row in the database are skipped, so crawls
+never duplicate the collector's rows.
+
+Every accepted row is appended to an NDJSON spool file and fsynced before
+add() returns. The spool is truncated only after a batch commits, and a new
+buffer replays whatever an earlier process left behind. Replayed rows keep
+their history ids, so a crash between commit and truncation can't insert
+them twice. A buffer holds an flock on its spool so no other process
+truncates its rows; when the shared spool is taken it spools to a private
+per-process file instead of waiting, and adopts the files of processes that
+have exited.
+"""
+
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db_sink import QuoteSink, quote_rows
+from http_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 300
+
+# Index of the timestamp and bucket columns in a db_sink row
+_TS, _BUCKET_START, _BUCKET_END = 10, 11, 12
+
+
+def _bucket(ts: datetime, bucket_seconds: int) -> datetime:
+    return datetime.min + timedelta(seconds=int((ts - datetime.min).total_seconds()) // bucket_seconds * bucket_seconds)
+
+
+def _encode(row: Tuple) -> str:
+    return json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in row])
+
+
+def _decode(line: str) -> Tuple:
+    row = json.loads(line)
+    for i in (_TS, _BUCKET_START, _BUCKET_END):
+        row[i] = datetime.fromisoformat(row[i])
+    return tuple(row)
+
+
+class HistoryBuffer:
+    def __init__(self, sink: Optional[QuoteSink], spool_path: Optional[str] = None, max_rows: int = 500,
+                 max_age: float = 30.0, bucket_seconds: int = BUCKET_SECONDS,
+                 update_stock: bool = True, source: str = 'crawler'):
+        self.sink = sink
+        self.spool_path = spool_path or os.path.join(DEFAULT_CACHE_DIR, 'history_spool.ndjson')
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.bucket_seconds = bucket_seconds
+        self.update_stock = update_stock
+        self.source = source
+        self.pending: Dict[Tuple[str, datetime], Tuple] = {}
+        self.oldest: Optional[float] = None
+        self.flushed_rows = 0
+        # Set when rows reached the buffer without their Stock update (replayed,
+        # or the immediate update failed), so the next flush sets prices too
+        self.stale_prices = False
+
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        self.shared_path = self.spool_path
+        self.spool = self._lock(self.shared_path)
+        if self.spool is None:
+            root, ext = os.path.splitext(self.shared_path)
+            self.spool_path = f'{root}.{os.getpid()}{ext}'
+            self.spool = self._lock(self.spool_path)
+            logger.info(f"{self.shared_path} is in use, spooling to {self.spool_path}")
+        replayed = self._replay(self.spool_path)
+        for path in self._orphans():
+            replayed += self._adopt(path)
+        if replayed:
+            self.stale_prices = True
+            logger.info(f"Replayed {replayed} spooled history rows into {self.spool_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.pending)
+
+    @staticmethod
+    def _lock(path: str):
+        """The spool opened for appending and flocked, or None if another process holds it"""
+        spool = open(path, 'a', encoding='utf-8')
+        try:
+            fcntl.flock(spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            spool.close()
+            return None
+        return spool
+
+    @property
+    def private(self) -> bool:
+        return self.spool_path != self.shared_path
+
+    def _orphans(self) -> List[str]:
+        """Other processes' private spools, and the shared one if we aren't on it"""
+        root, ext = os.path.splitext(self.shared_path)
+        paths = [path for path in glob.glob(f'{glob.escape(root)}.*{ext}')
+                 if path[len(root) + 1:len(path) - len(ext)].isdigit() and path != self.spool_path]
+        if self.private:
+            paths.append(self.shared_path)
+        return paths
+
+    def _adopt(self, path: str) -> int:
+        """Move the rows of a spool nobody holds into ours"""
+        try:
+            spool = self._lock(path)
+        except OSError:
+            return 0
+        if spool is None:
+            return 0
+        try:
+            lines = self._read(path)
+            if lines:
+                self._append(''.join(line for line, _ in lines))
+            for _, row in lines:
+                self._put(row)
+            spool.truncate(0)
+            # The shared spool stays for the next process to claim
+            if path != self.shared_path:
+                os.unlink(path)
+        finally:
+            spool.close()
+        return len(lines)
+
+    @staticmethod
+    def _read(path: str) -> List[Tuple[str, Tuple]]:
+        """The spool's decodable lines with their rows"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        readable = []
+        for line in lines:
+            try:
+                row = _decode(line)
+            except (ValueError, TypeError, IndexError):
+                # A write cut short by the crash; everything before it is intact
+                logger.warning(f"Skipping unreadable spool line: {line[:80]!r}")
+                continue
+            readable.append((line if line.endswith('\n') else line + '\n', row))
+        return readable
+
+    def _replay(self, path: str) -> int:
+        lines = self._read(path)
+        for _, row in lines:
+            self._put(row)
+        return len(lines)
+
+    def _append(self, text: str):
+        self.spool.write(text)
+        self.spool.flush()
+        os.fsync(self.spool.fileno())
+
+    def _put(self, row: Tuple):
+        key = (row[0], row[_BUCKET_START])
+        current = self.pending.get(key)
+        # Latest quote in the bucket wins; it keeps the bucket's history id
+        if current is None or row[_TS] >= current[_TS]:
+            if current is not None:
+                row = (row[0], current[1]) + row[2:]
+            self.pending[key] = row
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+    def add(self, quotes: Iterable[Dict[str, Any]]) -> int:
+        """Set Stock prices for a batch of crawler quotes and buffer their history rows
+
+        Error rows are ignored. Returns how many rows were accepted. Flushes if
+        a threshold is hit.
+        """
+        rows = []
+        for row in quote_rows(quotes):
+            start = _bucket(row[_TS], self.bucket_seconds)
+            rows.append(row[:_BUCKET_START] + (start, start + timedelta(seconds=self.bucket_seconds)))
+        if not rows:
+            return 0
+
+        self._append(''.join(_encode(row) + '\n' for row in rows))
+        for row in rows:
+            self._put(row)
+
+        if self.update_stock and self.sink is not None:
+            try:
+                self.sink.update_prices(rows)
+            except Exception as e:
+                logger.error(f"Price update of {len(rows)} quotes failed, retrying with the history flush: {e}")
+                self.stale_prices = True
+
+        self.maybe_flush()
+        return len(rows)
+
+    def due(self) -> bool:
+        if not self.pending:
+            return False
+        return len(self.pending) >= self.max_rows or time.monotonic() - self.oldest >= self.max_age
+
+    def maybe_flush(self) -> int:
+        """Flush if a size or time threshold is reached; call periodically when idle"""
+        return self.flush() if self.due() else 0
+
+    def flush(self) -> int:
+        """Write everything pending in one batch; keeps it buffered on failure"""
+        if not self.pending or self.sink is None:
+            return 0
+        rows: List[Tuple] = list(self.pending.values())
+        try:
+            written = self.sink.write_rows(rows, self.source, update_stock=self.update_stock and self.stale_prices)
+        except Exception as e:
+            logger.error(f"History flush of {len(rows)} rows failed, keeping them spooled: {e}")
+            return 0
+
+        self.pending.clear()
+        self.oldest = None
+        self.stale_prices = False
+        self.flushed_rows += written
+        self.spool.truncate(0)
+        self.spool.flush()
+        os.fsync(self.spool.fileno())
+        return written
+
+    def close(self):
+        self.flush()
+        # Closing releases the lock; an emptied private spool isn't needed
+        if self.private and not self.pending:
+            os.unlink(self.spool_path)
+        self.spool.close()
+
+
+def write_results(quotes: Iterable[Dict[str, Any]], url: Optional[str] = None,
+                  source: str = 'crawler') -> Optional[int]:
+    """One-shot buffered write for CLI runs; logs and returns None instead of raising
+
+    Rows are spooled first, so if the database is unreachable they are kept
+    and go out with the next run's batch.
+    """
+    sink = None
+    try:
+        sink = QuoteSink.connect(url)
+    except Exception as e:
+        logger.error(f"Database sink unavailable, spooling history only: {e}")
+    try:
+        with HistoryBuffer(sink, source=source) as buffer:
+            buffer.add(quotes)
+        return buffer.flushed_rows if sink is not None else None
+    finally:
+        if sink is not None:
+            sink.close()
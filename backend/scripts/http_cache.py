@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP validator cache for crawled pages.
+
+Stores the ETag / Last-Modified validators of each URL together with the
+result parsed from that response. The next request sends If-None-Match /
+If-Modified-Since; on 304 Not Modified the stored result is reused, so an
+unchanged page costs one small round trip with no body and no parsing.
+
+The cache is a JSON file so short-lived CLI runs share it; works with both
+requests and aiohttp responses.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'CRAWLER_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+)
+
+
+def _status(response) -> int:
+    return getattr(response, 'status_code', None) or getattr(response, 'status', 0)
+
+
+class ValidatorCache:
+    def __init__(self, path: Optional[str] = None, max_entries: int = 5000, metrics=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'http_validators.json')
+        self.max_entries = max_entries
+        self.metrics = metrics
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable HTTP cache {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        if len(self.entries) > self.max_entries:
+            newest = sorted(self.entries.items(), key=lambda item: item[1]['stored_at'], reverse=True)
+            self.entries = dict(newest[:self.max_entries])
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since for a URL we have a parsed result for"""
+        entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidated(self, url: str, response) -> Optional[Any]:
+        """Stored result if the response is a 304 for it, else None"""
+        entry = self.entries.get(url)
+        hit = _status(response) == 304 and entry is not None
+        if self.metrics is not None:
+            self.metrics.observe_cache(hit)
+        if not hit:
+            return None
+        entry['stored_at'] = time.time()
+        self.dirty = True
+        return entry['result']
+
+    def store(self, url: str, response, result: Any):
+        """Remember the validators of a 200 response with its parsed result"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            # Nothing to revalidate against next time
+            if self.entries.pop(url, None) is not None:
+                self.dirty = True
+            return
+        self.entries[url] = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'result': result,
+            'stored_at': time.time(),
+        }
+        self.dirty = True
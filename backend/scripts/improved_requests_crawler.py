@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import requests
 import json
 import sys
@@ -8,9 +9,176 @@ import re
 import time
 import random
 from urllib.parse import quote
+from request_timing import RequestTimer
+from http_cache import ValidatorCache
+from crawler_metrics import CrawlerMetrics
+from html_scanner import StreamingFieldScanner, scan_response
+from crawler_profile import default_profile_prefix, profile_run
+from connection_warmup import install_dns_cache, prewarm_requests
+from contextlib import nullcontext
 
-def get_stock_price_naver(symbol, max_retries=3):
-    """네이버 금융에서 주식 가격 조회 (재시도 로직 포함)"""
+# 요청별 구간 타이밍 (실행 종료 시 stderr로 요약 출력)
+timer = RequestTimer()
+
+# 캐시 적중률과 종목 성공/실패 집계 (--stats-file로 기록)
+metrics = CrawlerMetrics('improved_requests_crawler')
+
+# ETag/Last-Modified 검증 캐시 (실행 간 공유)
+http_cache = ValidatorCache(metrics=metrics)
+
+# 재시도 간 keep-alive 연결 재사용 (시작 시 미리 연결)
+session = requests.Session()
+
+# 시세 필드 추출 패턴 (우선순위 순)
+NAME_PATTERNS = [
+    r'<title>([^(]+)\([^)]+\)[^<]*</title>',
+    r'<h2[^>]*class="h_company"[^>]*><a[^>]*>([^<]+)</a></h2>',
+    r'class="wrap_company"[^>]*>.*?<h2[^>]*>([^<]+)</h2>'
+]
+
+PRICE_PATTERNS = [
+    r'<strong[^>]*class="tah p11"[^>]*id="_nowVal"[^>]*>([0-9,]+)</strong>',
+    r'id="_nowVal"[^>]*>([0-9,]+)</.*?>',
+    r'class="tah p11"[^>]*>([0-9,]+)</strong>'
+]
+
+CHANGE_PATTERNS = [
+    r'<strong[^>]*class="tah p11"[^>]*>\s*<span[^>]*>([+-]?[0-9,]+)</span>',
+    r'전일대비[^>]*>.*?([+-]?[0-9,]+)',
+    r'class="tah p11"[^>]*>\s*([+-][0-9,]+)'
+]
+
+CHANGE_PERCENT_PATTERNS = [
+    r'<strong[^>]*class="tah p11"[^>]*>\s*<span[^>]*>([+-]?[0-9.,]+)%</span>',
+    r'등락률[^>]*>.*?([+-]?[0-9.,]+)%',
+    r'class="tah p11"[^>]*>.*?([+-][0-9.,]+)%'
+]
+
+TABLE_PATTERN = r'<table[^>]*class="no_info"[^>]*>(.*?)</table>'
+
+# 스트리밍 모드에서 이 필드들이 모두 보이면 나머지 본문 다운로드를 중단
+SISE_MARKERS = {
+    'name': [re.compile(pattern, re.DOTALL) for pattern in NAME_PATTERNS],
+    'price': PRICE_PATTERNS,
+    'change': CHANGE_PATTERNS,
+    'change_percent': CHANGE_PERCENT_PATTERNS,
+    'no_info': [re.compile(TABLE_PATTERN, re.DOTALL)],
+}
+
+def parse_sise_html(symbol, html):
+    """sise.naver 페이지 HTML에서 종목명과 시세 필드 추출"""
+    # 종목명 추출 (여러 패턴 시도)
+    name = symbol
+    for pattern in NAME_PATTERNS:
+        name_match = re.search(pattern, html, re.DOTALL)
+        if name_match:
+            name = name_match.group(1).strip()
+            break
+
+    # 현재가 추출 (여러 패턴 시도)
+    current_price = None
+    for pattern in PRICE_PATTERNS:
+        price_match = re.search(pattern, html)
+        if price_match:
+            current_price = int(price_match.group(1).replace(',', ''))
+            break
+
+    if current_price is None:
+        raise ValueError(f"Could not find current price for {symbol}")
+
+    # 전일 대비 변동가 추출
+    change = 0
+    for pattern in CHANGE_PATTERNS:
+        change_match = re.search(pattern, html)
+        if change_match:
+            change_str = change_match.group(1).replace(',', '')
+            if change_str.startswith('+'):
+                change = int(change_str[1:])
+            elif change_str.startswith('-'):
+                change = -int(change_str[1:])
+            else:
+                try:
+                    change = int(change_str)
+                except:
+                    change = 0
+            break
+
+    previous_close = current_price - change
+
+    # 변동률 추출
+    change_percent = 0.0
+    for pattern in CHANGE_PERCENT_PATTERNS:
+        change_percent_match = re.search(pattern, html)
+        if change_percent_match:
+            change_percent_str = change_percent_match.group(1).replace(',', '')
+            try:
+                if change_percent_str.startswith('+'):
+                    change_percent = float(change_percent_str[1:])
+                elif change_percent_str.startswith('-'):
+                    change_percent = -float(change_percent_str[1:])
+                else:
+                    change_percent = float(change_percent_str)
+            except:
+                change_percent = 0.0
+            break
+
+    # 시가, 고가, 저가, 거래량 추출
+    table_match = re.search(TABLE_PATTERN, html, re.DOTALL)
+
+    day_open = current_price
+    day_high = current_price  
+    day_low = current_price
+    volume = 0
+
+    if table_match:
+        table_html = table_match.group(1)
+
+        # 시가
+        open_pattern = r'>시가</th>\s*<td[^>]*>([0-9,]+)</td>'
+        open_match = re.search(open_pattern, table_html)
+        if open_match:
+            day_open = int(open_match.group(1).replace(',', ''))
+
+        # 고가
+        high_pattern = r'>고가</th>\s*<td[^>]*>([0-9,]+)</td>'
+        high_match = re.search(high_pattern, table_html)
+        if high_match:
+            day_high = int(high_match.group(1).replace(',', ''))
+
+        # 저가
+        low_pattern = r'>저가</th>\s*<td[^>]*>([0-9,]+)</td>'
+        low_match = re.search(low_pattern, table_html)
+        if low_match:
+            day_low = int(low_match.group(1).replace(',', ''))
+
+        # 거래량
+        volume_patterns = [
+            r'>거래량</th>\s*<td[^>]*>([0-9,]+)</td>',
+            r'>거래량</th>\s*<td[^>]*><span[^>]*>([0-9,]+)</span></td>'
+        ]
+        for vol_pattern in volume_patterns:
+            volume_match = re.search(vol_pattern, table_html)
+            if volume_match:
+                volume = int(volume_match.group(1).replace(',', ''))
+                break
+
+    return {
+        "name": name,
+        "currentPrice": current_price,
+        "previousClose": previous_close,
+        "change": change,
+        "changePercent": change_percent,
+        "dayOpen": day_open,
+        "dayHigh": day_high,
+        "dayLow": day_low,
+        "volume": volume
+    }
+
+def get_stock_price_naver(symbol, max_retries=3, stream=True):
+    """네이버 금융에서 주식 가격 조회 (재시도 로직 포함)
+
+    stream=True이면 필요한 시세 필드가 모두 나오는 즉시 다운로드를 중단합니다.
+    """
     for attempt in range(max_retries):
         try:
             # User-Agent 로테이션
@@ -40,145 +208,31 @@ def get_stock_price_naver(symbol, max_retries=3):
             # 네이버 금융 페이지 요청
             url = f"https://finance.naver.com/item/sise.naver?code={symbol}"
             
-            session = requests.Session()
-            session.headers.update(headers)
+            headers.update(http_cache.conditional_headers(url))
             
-            response = session.get(url, timeout=15)
-            response.raise_for_status()
-            
-            html = response.text
-            
-            # 종목명 추출 (여러 패턴 시도)
-            name_patterns = [
-                r'<title>([^(]+)\([^)]+\)[^<]*</title>',
-                r'<h2[^>]*class="h_company"[^>]*><a[^>]*>([^<]+)</a></h2>',
-                r'class="wrap_company"[^>]*>.*?<h2[^>]*>([^<]+)</h2>'
-            ]
-            
-            name = symbol
-            for pattern in name_patterns:
-                name_match = re.search(pattern, html, re.DOTALL)
-                if name_match:
-                    name = name_match.group(1).strip()
-                    break
-            
-            # 현재가 추출 (여러 패턴 시도)
-            price_patterns = [
-                r'<strong[^>]*class="tah p11"[^>]*id="_nowVal"[^>]*>([0-9,]+)</strong>',
-                r'id="_nowVal"[^>]*>([0-9,]+)</.*?>',
-                r'class="tah p11"[^>]*>([0-9,]+)</strong>'
-            ]
-            
-            current_price = None
-            for pattern in price_patterns:
-                price_match = re.search(pattern, html)
-                if price_match:
-                    current_price = int(price_match.group(1).replace(',', ''))
-                    break
-            
-            if current_price is None:
-                raise ValueError(f"Could not find current price for {symbol}")
-            
-            # 전일 대비 변동가 추출
-            change_patterns = [
-                r'<strong[^>]*class="tah p11"[^>]*>\s*<span[^>]*>([+-]?[0-9,]+)</span>',
-                r'전일대비[^>]*>.*?([+-]?[0-9,]+)',
-                r'class="tah p11"[^>]*>\s*([+-][0-9,]+)'
-            ]
-            
-            change = 0
-            for pattern in change_patterns:
-                change_match = re.search(pattern, html)
-                if change_match:
-                    change_str = change_match.group(1).replace(',', '')
-                    if change_str.startswith('+'):
-                        change = int(change_str[1:])
-                    elif change_str.startswith('-'):
-                        change = -int(change_str[1:])
-                    else:
-                        try:
-                            change = int(change_str)
-                        except:
-                            change = 0
-                    break
-            
-            previous_close = current_price - change
-            
-            # 변동률 추출
-            change_percent_patterns = [
-                r'<strong[^>]*class="tah p11"[^>]*>\s*<span[^>]*>([+-]?[0-9.,]+)%</span>',
-                r'등락률[^>]*>.*?([+-]?[0-9.,]+)%',
-                r'class="tah p11"[^>]*>.*?([+-][0-9.,]+)%'
-            ]
-            
-            change_percent = 0.0
-            for pattern in change_percent_patterns:
-                change_percent_match = re.search(pattern, html)
-                if change_percent_match:
-                    change_percent_str = change_percent_match.group(1).replace(',', '')
-                    try:
-                        if change_percent_str.startswith('+'):
-                            change_percent = float(change_percent_str[1:])
-                        elif change_percent_str.startswith('-'):
-                            change_percent = -float(change_percent_str[1:])
-                        else:
-                            change_percent = float(change_percent_str)
-                    except:
-                        change_percent = 0.0
-                    break
-            
-            # 시가, 고가, 저가, 거래량 추출
-            table_pattern = r'<table[^>]*class="no_info"[^>]*>(.*?)</table>'
-            table_match = re.search(table_pattern, html, re.DOTALL)
-            
-            day_open = current_price
-            day_high = current_price  
-            day_low = current_price
-            volume = 0
-            
-            if table_match:
-                table_html = table_match.group(1)
-                
-                # 시가
-                open_pattern = r'>시가</th>\s*<td[^>]*>([0-9,]+)</td>'
-                open_match = re.search(open_pattern, table_html)
-                if open_match:
-                    day_open = int(open_match.group(1).replace(',', ''))
+            with timer.track('naver_requests', symbol, url) as record:
+                response = session.get(url, headers=headers, timeout=15, stream=True)
+                record.mark_headers(response)
                 
-                # 고가
-                high_pattern = r'>고가</th>\s*<td[^>]*>([0-9,]+)</td>'
-                high_match = re.search(high_pattern, table_html)
-                if high_match:
-                    day_high = int(high_match.group(1).replace(',', ''))
-                
-                # 저가
-                low_pattern = r'>저가</th>\s*<td[^>]*>([0-9,]+)</td>'
-                low_match = re.search(low_pattern, table_html)
-                if low_match:
-                    day_low = int(low_match.group(1).replace(',', ''))
-                
-                # 거래량
-                volume_patterns = [
-                    r'>거래량</th>\s*<td[^>]*>([0-9,]+)</td>',
-                    r'>거래량</th>\s*<td[^>]*><span[^>]*>([0-9,]+)</span></td>'
-                ]
-                for vol_pattern in volume_patterns:
-                    volume_match = re.search(vol_pattern, table_html)
-                    if volume_match:
-                        volume = int(volume_match.group(1).replace(',', ''))
-                        break
+                # 변경 없는 페이지는 304로 받고 저장된 파싱 결과 재사용
+                fields = http_cache.revalidated(url, response)
+                if fields is None:
+                    response.raise_for_status()
+                    if stream:
+                        # 시세 블록까지만 받고 연결 종료
+                        scanner = StreamingFieldScanner(SISE_MARKERS, response.encoding or 'euc-kr')
+                        html = scan_response(response, scanner, record)
+                    else:
+                        html = response.text
+                        record.add_bytes(len(response.content))
+                    fields = parse_sise_html(symbol, html)
+                    http_cache.store(url, response, fields)
+                else:
+                    response.close()
             
             result = {
                 "symbol": symbol,
-                "name": name,
-                "currentPrice": current_price,
-                "previousClose": previous_close,
-                "change": change,
-                "changePercent": change_percent,
-                "dayOpen": day_open,
-                "dayHigh": day_high,
-                "dayLow": day_low,
-                "volume": volume,
+                **fields,
                 "source": "naver_requests",
                 "timestamp": int(time.time()),
                 "success": True,
@@ -215,9 +269,32 @@ def get_stock_price_naver(symbol, max_retries=3):
     return None
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
+    # DNS 조회와 TCP/TLS 연결을 인자 파싱, 첫 요청 전 딜레이와 겹치도록 먼저 시작
+    install_dns_cache()
+    prewarm_requests(session, ['https://finance.naver.com/'])
+    
+    parser = argparse.ArgumentParser(description='네이버 금융 주가 크롤러')
+    parser.add_argument('symbol', nargs='?')
+    parser.add_argument('--stats-file',
+                        help='Write run metrics here when done (JSON, or Prometheus text for *.prom)')
+    parser.add_argument('--profile', nargs='?', const='', metavar='PREFIX',
+                        help='Profile the run into PREFIX.pstats and PREFIX.collapsed')
+    parser.add_argument('--full-page', action='store_true',
+                        help='Download the whole page instead of stopping after the price block')
+    args = parser.parse_args()
+    
+    if not args.symbol:
         print(json.dumps({"success": False, "error": "Usage: python3 improved_requests_crawler.py <stock_symbol>"}, ensure_ascii=False))
         sys.exit(1)
     
-    symbol = sys.argv[1]
-    get_stock_price_naver(symbol)
\ No newline at end of file
+    profiler = nullcontext()
+    if args.profile is not None:
+        profiler = profile_run(args.profile or default_profile_prefix(__file__, args.stats_file))
+    
+    with profiler:
+        result = get_stock_price_naver(args.symbol, stream=not args.full_page)
+    metrics.observe_symbol(result is not None)
+    http_cache.save()
+    timer.emit()
+    if args.stats_file:
+        metrics.write_stats_file(args.stats_file)
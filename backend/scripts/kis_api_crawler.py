@@ -4,20 +4,49 @@
 import requests
 import json
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from rate_limit import RateLimiter
+from symbol_master import lookup_name
 
 # Load environment variables
 load_dotenv()
 
+# Watchlist (multi-item) quote transaction, up to 30 codes per call
+MULTI_PRICE_TR_ID = "FHKST11300006"
+MULTI_PRICE_CODES = 30
+
+# Requests per second KIS allows an account (real / paper); KIS_TPS overrides
+DEFAULT_TPS = 2 if os.getenv('KIS_IS_PAPER') == 'true' else 20
+
+def _int(value):
+    return int(value or 0)
+
 class KISAPICrawler:
-    def __init__(self):
+    def __init__(self, tps=None):
         self.app_key = os.getenv('KIS_APP_KEY')
         self.app_secret = os.getenv('KIS_APP_SECRET')
         self.access_token = None
         self.base_url = "https://openapi.koreainvestment.com:9443"
+        self.tps = tps or float(os.getenv('KIS_TPS') or DEFAULT_TPS)
+        self.limiter = RateLimiter(self.tps)
+        
+        # One keep-alive session shared by all worker threads
+        self.session = requests.Session()
+        workers = max(1, int(self.tps))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        
+    def _headers(self, tr_id):
+        return {
+            "content-type": "application/json",
+            "authorization": f"Bearer {self.access_token}",
+            "appkey": self.app_key,
+            "appsecret": self.app_secret,
+            "tr_id": tr_id
+        }
         
     def get_access_token(self):
         """Get access token from KIS API"""
@@ -32,7 +61,7 @@ class KISAPICrawler:
         }
         
         try:
-            response = requests.post(url, json=data)
+            response = self.session.post(url, json=data)
             if response.status_code == 200:
                 self.access_token = response.json().get("access_token")
                 return self.access_token
@@ -49,14 +78,7 @@ class KISAPICrawler:
             return {"error": "No access token", "symbol": stock_code}
             
         url = f"{self.base_url}/uapi/domestic-stock/v1/quotations/inquire-price"
-        
-        headers = {
-            "content-type": "application/json",
-            "authorization": f"Bearer {self.access_token}",
-            "appkey": self.app_key,
-            "appsecret": self.app_secret,
-            "tr_id": "FHKST01010100"
-        }
+        headers = self._headers("FHKST01010100")
         
         params = {
             "fid_cond_mrkt_div_code": "J",
@@ -64,14 +86,15 @@ class KISAPICrawler:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            with self.limiter:
+                response = self.session.get(url, headers=headers, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 output = data.get("output", {})
                 
                 return {
                     "symbol": stock_code,
-                    "name": output.get("prdt_abrv_name", "Unknown"),
+                    "name": output.get("prdt_abrv_name") or lookup_name(stock_code) or "Unknown",
                     "currentPrice": int(output.get("stck_prpr", 0)),
                     "previousClose": int(output.get("stck_sdpr", 0)),
                     "change": int(output.get("prdy_vrss", 0)),
@@ -95,23 +118,78 @@ class KISAPICrawler:
                 "symbol": stock_code
             }
 
+    def get_multi_prices(self, stock_codes):
+        """Quotes for up to MULTI_PRICE_CODES codes in one watchlist call, keyed by code
+        
+        Raises on HTTP or API errors so the caller can fall back to single calls.
+        """
+        url = f"{self.base_url}/uapi/domestic-stock/v1/quotations/intstock-multprice"
+        params = {}
+        for i, code in enumerate(stock_codes, 1):
+            params[f"FID_COND_MRKT_DIV_CODE_{i}"] = "J"
+            params[f"FID_INPUT_ISCD_{i}"] = code
+        
+        with self.limiter:
+            response = self.session.get(url, headers=self._headers(MULTI_PRICE_TR_ID), params=params, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("rt_cd") != "0":
+            raise RuntimeError(f"{data.get('msg_cd')}: {data.get('msg1')}")
+        
+        timestamp = datetime.now().isoformat()
+        results = {}
+        for output in data.get("output") or []:
+            code = output.get("inter_shrn_iscd", "").strip()
+            if not code or not _int(output.get("inter2_prpr")):
+                continue
+            results[code] = {
+                "symbol": code,
+                "name": output.get("inter_kor_isnm") or lookup_name(code) or "Unknown",
+                "currentPrice": _int(output.get("inter2_prpr")),
+                "previousClose": _int(output.get("inter2_prdy_clpr") or output.get("inter2_sdpr")),
+                "change": _int(output.get("inter2_prdy_vrss")),
+                "changePercent": float(output.get("prdy_ctrt") or 0),
+                "dayOpen": _int(output.get("inter2_oprc")),
+                "dayHigh": _int(output.get("inter2_hgpr")),
+                "dayLow": _int(output.get("inter2_lwpr")),
+                "volume": _int(output.get("acml_vol")),
+                "timestamp": timestamp,
+                "source": "kis_api"
+            }
+        return results
+        
+    def _get_chunk(self, stock_codes):
+        try:
+            found = self.get_multi_prices(stock_codes)
+        except Exception as e:
+            print(f"Multi-price call failed, falling back to single quotes: {e}", file=sys.stderr)
+            found = {}
+        # Codes the batch missed get the single-item call
+        return [found.get(code) or self.get_stock_price(code) for code in stock_codes]
+        
+    def get_stock_prices(self, stock_codes):
+        """Quotes for any number of codes: 30 per call, calls in parallel up to the TPS limit"""
+        if not self.access_token:
+            self.get_access_token()
+            
+        if not self.access_token:
+            return [{"error": "No access token", "symbol": code} for code in stock_codes]
+            
+        chunks = [stock_codes[i:i + MULTI_PRICE_CODES] for i in range(0, len(stock_codes), MULTI_PRICE_CODES)]
+        workers = max(1, min(len(chunks), int(self.tps)))
+        with ThreadPoolExecutor(workers) as pool:
+            return [result for chunk in pool.map(self._get_chunk, chunks) for result in chunk]
+
 def main():
     if len(sys.argv) < 2:
         print(json.dumps([{"error": "No stock codes provided"}]))
         sys.exit(1)
     
-    stock_codes = sys.argv[1].split(",")
+    stock_codes = list(dict.fromkeys(code.strip() for code in sys.argv[1].split(",") if code.strip()))
     crawler = KISAPICrawler()
-    results = []
-    
-    for i, code in enumerate(stock_codes):
-        print(f"Crawling {code}... ({i+1}/{len(stock_codes)})", file=sys.stderr)
-        result = crawler.get_stock_price(code)
-        results.append(result)
-        
-        # Small delay to avoid rate limiting
-        if i < len(stock_codes) - 1:
-            time.sleep(0.5)
+    print(f"Crawling {len(stock_codes)} codes in {-(-len(stock_codes) // MULTI_PRICE_CODES)} batches...",
+          file=sys.stderr)
+    results = crawler.get_stock_prices(stock_codes)
     
     print(json.dumps(results, ensure_ascii=False))
 
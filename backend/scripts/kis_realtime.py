@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+KIS real-time execution feed (H0STCNT0) as a push source for the quote pipeline.
+
+Keeps one WebSocket to KIS open and registers the symbols students hold or
+watch, hottest first, up to the per-connection limit. Every execution tick
+updates that symbol's latest quote and its intraday bars; once a second the
+latest quotes go out like a poller's batch: to stdout, the price history
+buffer (which also updates Stock), the quote board and Redis, whichever are
+configured. The registrations follow the demand as it changes, and the
+connection is re-established with backoff when it drops.
+
+    kis_realtime.py subscribe --db-url
+    kis_realtime.py subscribe --symbols 005930,000660 --record ticks.ndjson
+    kis_realtime.py replay ticks.ndjson --port 21000     # local stand-in for the feed
+    kis_realtime.py subscribe --symbols 005930 --ws-url ws://localhost:21000 --approval-key test
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+from datetime import datetime, time as day_time, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+
+from bar_builder import BarBuilder
+from db_sink import QuoteSink
+from history_buffer import HistoryBuffer
+from http_cache import DEFAULT_CACHE_DIR
+from output_format import FORMATS, emit_results
+from quote_board import DEFAULT_BOARD_PATH, QuoteBoard
+from redis_sink import RedisSink
+from refresh_scheduler import HOLDER_WEIGHT, WATCHER_WEIGHT, refreshable
+from symbol_master import lookup_name
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PAPER = os.getenv('KIS_IS_PAPER') == 'true'
+REST_URL = 'https://openapivts.koreainvestment.com:29443' if PAPER else 'https://openapi.koreainvestment.com:9443'
+WS_URL = 'ws://ops.koreainvestment.com:31000' if PAPER else 'ws://ops.koreainvestment.com:21000'
+
+TICK_TR_ID = 'H0STCNT0'
+# KIS accepts 41 registrations per connection
+MAX_SUBSCRIPTIONS = 40
+
+# Positions in a '^'-separated H0STCNT0 record
+_CODE, _TIME, _PRICE, _CHANGE, _CHANGE_PERCENT, _OPEN, _HIGH, _LOW, _VOLUME = 0, 1, 2, 4, 5, 7, 8, 9, 13
+
+# The pollers' scheduler has the database spool; this feed keeps its own
+SPOOL_PATH = os.path.join(DEFAULT_CACHE_DIR, 'kis_realtime_spool.ndjson')
+
+FLUSH_SECONDS = 1.0
+BAR_FLUSH_SECONDS = 15
+RELOAD_SECONDS = 300.0
+RECONNECT_MAX_SECONDS = 60.0
+
+# Execution times are KST whatever the host's zone; Korea has no DST, so the
+# fixed offset stands in where the tz database isn't installed
+try:
+    KST = ZoneInfo('Asia/Seoul')
+except ZoneInfoNotFoundError:
+    KST = timezone(timedelta(hours=9), 'KST')
+
+
+def parse_ticks(frame: str) -> List[Dict[str, Any]]:
+    """Quotes from a data frame: 0|H0STCNT0|<record count>|<records, fields '^'-separated>
+
+    Timestamps carry the +09:00 offset, so the sinks store the right instant
+    on a host in any time zone.
+    """
+    parts = frame.split('|', 3)
+    if len(parts) < 4 or parts[0] != '0' or parts[1] != TICK_TR_ID:
+        return []
+    fields = parts[3].split('^')
+    count = int(parts[2])
+    if count <= 0 or len(fields) < count * (_VOLUME + 1):
+        raise ValueError(f"{len(fields)} fields for {count} records")
+    width = len(fields) // count
+    today = datetime.now(KST).date()
+    quotes = []
+    for start in range(0, count * width, width):
+        record = fields[start:start + width]
+        code, hhmmss = record[_CODE], record[_TIME]
+        price, change = int(record[_PRICE]), int(record[_CHANGE])
+        executed = datetime.combine(today, day_time(int(hhmmss[:2]), int(hhmmss[2:4]), int(hhmmss[4:6]), tzinfo=KST))
+        quotes.append({
+            'symbol': code,
+            'name': lookup_name(code) or code,
+            'currentPrice': price,
+            'previousClose': price - change,
+            'change': change,
+            'changePercent': float(record[_CHANGE_PERCENT]),
+            'dayOpen': int(record[_OPEN]),
+            'dayHigh': int(record[_HIGH]),
+            'dayLow': int(record[_LOW]),
+            'volume': int(record[_VOLUME]),
+            'timestamp': executed.isoformat(),
+            'source': 'kis_realtime',
+        })
+    return quotes
+
+
+class KISRealtime:
+    def __init__(self, ws_url: str = WS_URL, approval_key: Optional[str] = None, record_path: Optional[str] = None):
+        self.ws_url = ws_url
+        self.app_key = os.getenv('KIS_APP_KEY')
+        self.app_secret = os.getenv('KIS_APP_SECRET')
+        self.approval_key = approval_key
+        self.current_key = None
+        self.record = open(record_path, 'a', encoding='utf-8') if record_path else None
+        self.ws = None
+        self.desired: List[str] = []
+        self.subscribed: Set[str] = set()
+        # Latest quote per symbol since the last take()
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.bars = BarBuilder()
+        self.ticks = 0
+        self.malformed = 0
+
+    async def approve(self, session: aiohttp.ClientSession) -> str:
+        """WebSocket approval key (valid for a day; fetched per connection)"""
+        if self.approval_key:
+            return self.approval_key
+        if not self.app_key or not self.app_secret:
+            raise RuntimeError("KIS_APP_KEY and KIS_APP_SECRET are required for an approval key")
+        payload = {'grant_type': 'client_credentials', 'appkey': self.app_key, 'secretkey': self.app_secret}
+        async with session.post(f'{REST_URL}/oauth2/Approval', json=payload) as response:
+            data = await response.json(content_type=None)
+        key = data.get('approval_key')
+        if not key:
+            raise RuntimeError(f"No approval key in response: {data}")
+        return key
+
+    async def _register(self, approval_key: str, code: str, subscribe: bool):
+        await self.ws.send_str(json.dumps({
+            'header': {'approval_key': approval_key, 'custtype': 'P', 'tr_type': '1' if subscribe else '2',
+                       'content-type': 'utf-8'},
+            'body': {'input': {'tr_id': TICK_TR_ID, 'tr_key': code}},
+        }))
+
+    async def _sync(self):
+        """Bring the registrations on the open connection in line with `desired`"""
+        if self.ws is None or self.ws.closed:
+            return
+        wanted = set(self.desired)
+        for code in sorted(self.subscribed - wanted):
+            await self._register(self.current_key, code, False)
+            self.subscribed.discard(code)
+        for code in self.desired:
+            if code not in self.subscribed:
+                await self._register(self.current_key, code, True)
+                self.subscribed.add(code)
+
+    async def set_symbols(self, symbols: Iterable[str]):
+        self.desired = list(dict.fromkeys(symbols))[:MAX_SUBSCRIPTIONS]
+        await self._sync()
+
+    def handle(self, frame: str) -> Optional[str]:
+        """Apply one text frame; returns a frame to send back, if any
+
+        A frame that can't be parsed is logged and skipped, so one bad frame
+        doesn't take the connection down.
+        """
+        try:
+            return self._apply(frame)
+        except (ValueError, IndexError, TypeError, AttributeError, ZeroDivisionError) as e:
+            self.malformed += 1
+            logger.warning(f"Skipping malformed frame ({type(e).__name__}: {e}): {frame[:120]!r}")
+            return None
+
+    def _apply(self, frame: str) -> Optional[str]:
+        if frame[:1] in ('0', '1'):
+            # Parsed in full before anything is applied
+            for quote in parse_ticks(frame):
+                self.ticks += 1
+                self.latest[quote['symbol']] = quote
+                self.bars.update(quote['symbol'], datetime.fromisoformat(quote['timestamp']).timestamp(),
+                                 quote['currentPrice'], quote['volume'])
+            return None
+
+        message = json.loads(frame)
+        header = message.get('header') or {}
+        if header.get('tr_id') == 'PINGPONG':
+            # The server drops connections that don't echo its keepalive
+            return frame
+        body = message.get('body') or {}
+        if body.get('rt_cd') not in (None, '0'):
+            logger.warning(f"{header.get('tr_id')} {header.get('tr_key')}: {body.get('msg1')}")
+        return None
+
+    def take(self) -> List[Dict[str, Any]]:
+        quotes = list(self.latest.values())
+        self.latest.clear()
+        return quotes
+
+    async def connect_once(self, session: aiohttp.ClientSession):
+        self.current_key = await self.approve(session)
+        async with session.ws_connect(self.ws_url) as ws:
+            logger.info(f"Connected to {self.ws_url}")
+            self.ws = ws
+            self.subscribed = set()
+            await self._sync()
+            started = time.monotonic()
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.ERROR:
+                    break
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                if self.record is not None:
+                    self.record.write(json.dumps({'t': round(time.monotonic() - started, 3),
+                                                  'frame': message.data}, ensure_ascii=False) + '\n')
+                reply = self.handle(message.data)
+                if reply is not None:
+                    await ws.send_str(reply)
+        self.ws = None
+
+    async def run_forever(self, session: aiohttp.ClientSession):
+        delay = 1.0
+        while True:
+            connected = time.monotonic()
+            try:
+                await self.connect_once(session)
+                logger.warning("Feed connection closed")
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                logger.error(f"Feed connection failed: {e}")
+            self.ws = None
+            if time.monotonic() - connected > RECONNECT_MAX_SECONDS:
+                delay = 1.0
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    def close(self):
+        if self.record is not None:
+            self.record.close()
+
+
+def demand_symbols(sink: QuoteSink, limit: int = MAX_SUBSCRIPTIONS) -> List[str]:
+    """Held or watched KRX symbols, weighted like the refresh scheduler's priority"""
+    rows = [row for row in sink.refresh_candidates() if refreshable(row[0])]
+    rows.sort(key=lambda row: HOLDER_WEIGHT * math.log1p(row[1]) + WATCHER_WEIGHT * math.log1p(row[2]),
+              reverse=True)
+    return [row[0] for row in rows[:limit]]
+
+
+async def run_subscriber(args):
+    if not args.symbols and args.db_url is None:
+        raise SystemExit("Give --symbols, or --db-url to follow the tracked and watched symbols")
+
+    sink = QuoteSink.connect(args.db_url or None) if args.db_url is not None else None
+    cache = RedisSink.connect(args.redis_url or None) if args.redis_url is not None else None
+    board = QuoteBoard.for_master(args.board or DEFAULT_BOARD_PATH) if args.board is not None else None
+    history = HistoryBuffer(sink, spool_path=SPOOL_PATH, source='kis_realtime') if sink is not None else None
+    feed = KISRealtime(args.ws_url, args.approval_key or os.getenv('KIS_APPROVAL_KEY'), args.record)
+    loop = asyncio.get_event_loop()
+
+    def symbols() -> List[str]:
+        if args.symbols:
+            return [code.strip() for code in args.symbols.split(',') if code.strip()]
+        return demand_symbols(sink, args.max_symbols)
+
+    def write(quotes: List[Dict[str, Any]]):
+        # Runs on one executor thread at a time; flush_quotes awaits it
+        if history is not None:
+            history.add(quotes)
+            history.maybe_flush()
+        if board is not None:
+            board.update(quotes)
+        if cache is not None:
+            try:
+                cache.publish(quotes)
+            except Exception as e:
+                logger.error(f"Publishing {len(quotes)} quotes to Redis failed: {e}")
+
+    async def flush_quotes():
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            quotes = feed.take()
+            if quotes:
+                emit_results(quotes, args.format, framed=True)
+                await loop.run_in_executor(None, write, quotes)
+
+    async def flush_bars():
+        while True:
+            await asyncio.sleep(BAR_FLUSH_SECONDS)
+            rows, marks = feed.bars.finished()
+            if not rows:
+                continue
+            try:
+                await loop.run_in_executor(None, sink.upsert_intraday_bars, rows)
+            except Exception as e:
+                logger.error(f"Writing {len(rows)} intraday bars failed, keeping them buffered: {e}")
+                continue
+            feed.bars.mark_flushed(marks)
+
+    async def follow_demand():
+        while True:
+            await feed.set_symbols(await loop.run_in_executor(None, symbols))
+            logger.info(f"Subscribed to {len(feed.desired)} symbols, {feed.ticks} ticks so far")
+            await asyncio.sleep(RELOAD_SECONDS)
+
+    tasks = [follow_demand(), flush_quotes()]
+    if sink is not None:
+        tasks.append(flush_bars())
+    try:
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(feed.run_forever(session), *tasks)
+    finally:
+        feed.close()
+        if history is not None:
+            history.close()
+        if board is not None:
+            board.close()
+        if cache is not None:
+            cache.close()
+        if sink is not None:
+            sink.close()
+
+
+def read_recording(path: str) -> List[Dict[str, Any]]:
+    """Entries of a --record file: {"t": seconds since connecting, "frame": raw text}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay_app(frames: List[Dict[str, Any]], speed: float = 1.0, loop: bool = False) -> web.Application:
+    """Serve recorded frames to subscribers, like the KIS feed would
+
+    Registrations are acknowledged, and data frames only go to connections
+    registered for their symbol, at the recorded pace scaled by speed. Play
+    starts with the first registration, as a live feed's data would.
+    """
+    origin = frames[0]['t'] if frames else 0
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        registered: Set[str] = set()
+
+        async def play():
+            while True:
+                started = time.monotonic()
+                for entry in frames:
+                    delay = (entry['t'] - origin) / speed - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    frame = entry['frame']
+                    if frame[:1] in ('0', '1') and frame.split('|', 3)[-1].split('^', 1)[0] not in registered:
+                        continue
+                    await ws.send_str(frame)
+                if not loop:
+                    break
+
+        player = None
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                request_frame = json.loads(message.data)
+                header = request_frame.get('header') or {}
+                request_input = (request_frame.get('body') or {}).get('input')
+                if not request_input:
+                    # Echoed keepalives
+                    continue
+                tr_id, tr_key = request_input.get('tr_id'), request_input.get('tr_key')
+                subscribe = header.get('tr_type') == '1'
+                if subscribe:
+                    registered.add(tr_key)
+                    if player is None:
+                        player = asyncio.ensure_future(play())
+                else:
+                    registered.discard(tr_key)
+                await ws.send_str(json.dumps({
+                    'header': {'tr_id': tr_id, 'tr_key': tr_key, 'encrypt': 'N'},
+                    'body': {'rt_cd': '0', 'msg_cd': 'OPSP0000',
+                             'msg1': 'SUBSCRIBE SUCCESS' if subscribe else 'UNSUBSCRIBE SUCCESS'},
+                }))
+        finally:
+            if player is not None:
+                player.cancel()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handler)
+    return app
+
+
+async def run_replay(args):
+    frames = read_recording(args.file)
+    runner = web.AppRunner(replay_app(frames, args.speed, args.loop))
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    logger.info(f"Replaying {len(frames)} frames on ws://{args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='KIS real-time execution feed')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    subscribe = commands.add_parser('subscribe', help='Stream ticks of the demanded symbols into the pipeline')
+    subscribe.add_argument('--symbols', help='Comma-separated codes instead of the held and watched ones')
+    subscribe.add_argument('--max-symbols', type=int, default=MAX_SUBSCRIPTIONS,
+                           help='Most symbols registered at once (KIS allows 41 per connection)')
+    subscribe.add_argument('--db-url', nargs='?', const='', metavar='URL',
+                           help='Pick symbols from and write history and bars to this database (default DATABASE_URL)')
+    subscribe.add_argument('--redis-url', nargs='?', const='', metavar='URL',
+                           help='Also publish the quotes to the Redis price cache (default REDIS_URL)')
+    subscribe.add_argument('--board', nargs='?', const='', metavar='PATH',
+                           help='Also keep the shared-memory quote board current (default QUOTE_BOARD_PATH)')
+    subscribe.add_argument('--format', choices=FORMATS, default='json',
+                           help='Output encoding (msgpack needs msgpack, arrow needs pyarrow)')
+    subscribe.add_argument('--ws-url', default=WS_URL, help='Feed URL, e.g. a local replay')
+    subscribe.add_argument('--approval-key', help='Use this approval key instead of requesting one (KIS_APPROVAL_KEY)')
+    subscribe.add_argument('--record', metavar='FILE', help='Append the raw frames here, for replay')
+
+    replay = commands.add_parser('replay', help='Serve a recording as a local stand-in for the feed')
+    replay.add_argument('file')
+    replay.add_argument('--host', default='127.0.0.1')
+    replay.add_argument('--port', type=int, default=21000)
+    replay.add_argument('--speed', type=float, default=1.0, help='Playback speed factor')
+    replay.add_argument('--loop', action='store_true', help='Start over at the end of the recording')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    try:
+        asyncio.run(run_subscriber(args) if args.command == 'subscribe' else run_replay(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
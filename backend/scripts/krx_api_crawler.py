@@ -5,6 +5,7 @@ import requests
 import json
 import sys
 from datetime import datetime
+from symbol_master import default_master
 
 class KRXAPICrawler:
     def __init__(self):
@@ -19,6 +20,14 @@ class KRXAPICrawler:
             'Referer': 'http://data.krx.co.kr/contents/MDC/MDI/mdiLoader/index.cmd?menuId=MDC0201020502',
         }
     
+    def identity(self, symbol):
+        """(ISIN, name) from the symbol master; the ISIN pattern only fits common stock"""
+        master = default_master()
+        listing = master.get(symbol) if master else None
+        if listing and listing.isin:
+            return listing.isin, listing.name
+        return f'KR7{symbol}003', None
+    
     def get_stock_data(self, symbol):
         """Get stock data from KRX API"""
         try:
@@ -27,15 +36,16 @@ class KRXAPICrawler:
             
             # Current date for query
             today = datetime.now().strftime('%Y%m%d')
+            isin, name = self.identity(symbol)
             
             # Form data for the request
             data = {
                 'bld': 'dbms/MDC/STAT/standard/MDCSTAT01501',
                 'locale': 'ko_KR',
                 'tboxisuCd_finder_stkisu0_0': f'{symbol}/주식',
-                'isuCd': f'KR7{symbol}003',
-                'isuCd2': f'KR7{symbol}003',
-                'codeNmisuCd_finder_stkisu0_0': '삼성전자/005930',
+                'isuCd': isin,
+                'isuCd2': isin,
+                'codeNmisuCd_finder_stkisu0_0': f'{name or symbol}/{symbol}',
                 'param1isuCd_finder_stkisu0_0': '',
                 'strtDd': today,
                 'endDd': today,
@@ -58,7 +68,7 @@ class KRXAPICrawler:
                     
                     return {
                         "symbol": symbol,
-                        "name": stock_data.get('ISU_ABBRV', 'Unknown'),
+                        "name": stock_data.get('ISU_ABBRV') or name or 'Unknown',
                         "currentPrice": current_price,
                         "previousClose": prev_close,
                         "change": current_price - prev_close,
@@ -83,10 +93,11 @@ class KRXAPICrawler:
             # Alternative endpoint
             url = "http://data.krx.co.kr/comm/bldAttendant/getJsonData.cmd"
             
+            isin, name = self.identity(symbol)
             data = {
                 'bld': 'dbms/MDC/STAT/standard/MDCSTAT01901',
                 'locale': 'ko_KR',
-                'isuCd': f'KR7{symbol}003',
+                'isuCd': isin,
                 'strtDd': datetime.now().strftime('%Y%m%d'),
                 'endDd': datetime.now().strftime('%Y%m%d'),
             }
@@ -100,7 +111,7 @@ class KRXAPICrawler:
                     
                     return {
                         "symbol": symbol,
-                        "name": item.get('ISU_NM', 'Unknown'),
+                        "name": item.get('ISU_NM') or name or 'Unknown',
                         "currentPrice": int(float(item.get('TDD_CLSPRC', '0').replace(',', ''))),
                         "previousClose": int(float(item.get('PRVDD_CLSPRC', '0').replace(',', ''))),
                         "change": int(float(item.get('FLUC_TP_CD', '0').replace(',', ''))),
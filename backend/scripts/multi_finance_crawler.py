@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import requests
 from bs4 import BeautifulSoup
 import json
@@ -11,10 +12,37 @@ from datetime import datetime
 from urllib.parse import quote
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from request_timing import RequestTimer
+from crawler_metrics import CrawlerMetrics
+from crawler_profile import default_profile_prefix, profile_run
+from quote_endpoints import ENDPOINT_HOSTS, JSON_ENDPOINTS, fetch_naver_polling, json_planner
+from connection_warmup import install_dns_cache, prewarm_requests
+from quote_validation import LastGoodPrices, validate_quotes
+from history_buffer import write_results
+from redis_sink import publish_results
+from delta_filter import HEARTBEAT_SECONDS, DeltaFilter, default_state_path
+from output_format import FORMATS, emit_results
+from contextlib import nullcontext
+
+# Rough bytes per page for the HTML scrapers, until measured
+HTML_PAGE_BYTES = {
+    'investing_com': 600_000,
+    'google_finance': 900_000,
+    'yahoo_finance': 1_500_000,
+}
+
+SOURCE_HOSTS = {
+    **ENDPOINT_HOSTS,
+    'investing_com': 'https://www.investing.com/',
+    'google_finance': 'https://www.google.com/',
+    'yahoo_finance': 'https://finance.yahoo.com/',
+}
 
 class MultiFinanceCrawler:
     def __init__(self):
         self.session = requests.Session()
+        self.timer = RequestTimer()
+        self.metrics = CrawlerMetrics('multi_finance_crawler')
         # Rotate user agents
         self.user_agents = [
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -47,6 +75,26 @@ class MultiFinanceCrawler:
         )
         adapter = HTTPAdapter(max_retries=retry_strategy)
         self.session.mount("http://", adapter)
+        
+        # Source name -> crawl method; the planner decides the order
+        self.sources = {
+            name: (lambda symbol, fetch=fetch: fetch(self.session, symbol, self.timer))
+            for name, (fetch, _) in JSON_ENDPOINTS.items()
+        }
+        self.sources.update({
+            'google_finance': self.crawl_google_finance,
+            'yahoo_finance': self.crawl_yahoo_finance,
+            'investing_com': self.crawl_investing_com,
+        })
+        self.planner = json_planner(HTML_PAGE_BYTES)
+    
+    @property
+    def headers(self):
+        """Request headers with a rotated user agent"""
+        return {
+            'User-Agent': random.choice(self.user_agents),
+            'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
+        }
     
     def parse_number(self, text):
         """Parse number from various formats"""
@@ -76,7 +124,7 @@ class MultiFinanceCrawler:
             google_symbol = f"KRX:{symbol}"
             url = f"https://www.google.com/finance/quote/{google_symbol}"
             
-            response = self.session.get(url, headers=self.headers, timeout=10)
+            response = self.timer.get(self.session, url, 'google_finance', symbol, headers=self.headers, timeout=10)
             if response.status_code != 200:
                 return None
             
@@ -141,12 +189,12 @@ class MultiFinanceCrawler:
             yahoo_symbol = f"{symbol}.KS"
             url = f"https://finance.yahoo.com/quote/{yahoo_symbol}"
             
-            response = self.session.get(url, headers=self.headers, timeout=10)
+            response = self.timer.get(self.session, url, 'yahoo_finance', symbol, headers=self.headers, timeout=10)
             if response.status_code != 200:
                 # Try KOSDAQ
                 yahoo_symbol = f"{symbol}.KQ"
                 url = f"https://finance.yahoo.com/quote/{yahoo_symbol}"
-                response = self.session.get(url, headers=self.headers, timeout=10)
+                response = self.timer.get(self.session, url, 'yahoo_finance', symbol, headers=self.headers, timeout=10)
             
             if response.status_code != 200:
                 return None
@@ -236,7 +284,7 @@ class MultiFinanceCrawler:
             
             url = f"https://www.investing.com/equities/{symbol_mapping[symbol]}"
             
-            response = self.session.get(url, headers=self.headers, timeout=10)
+            response = self.timer.get(self.session, url, 'investing_com', symbol, headers=self.headers, timeout=10)
             if response.status_code != 200:
                 return None
             
@@ -302,70 +350,30 @@ class MultiFinanceCrawler:
     
     def crawl_naver_finance_api(self, symbol):
         """네이버 금융 API 사용 (더 안정적)"""
-        try:
-            # 네이버 증권 API 엔드포인트
-            url = f"https://polling.finance.naver.com/api/realtime/domestic/stock/{symbol}"
-            
-            headers = self.headers.copy()
-            headers['Referer'] = f'https://finance.naver.com/item/main.naver?code={symbol}'
-            
-            response = self.session.get(url, headers=headers, timeout=10)
-            if response.status_code != 200:
-                return None
-            
-            data = response.json()
-            if not data or 'datas' not in data or not data['datas']:
-                return None
-            
-            stock_data = data['datas'][0]
-            
-            return {
-                "symbol": symbol,
-                "name": stock_data.get('nm', 'Unknown'),
-                "currentPrice": int(stock_data.get('nv', 0)),
-                "previousClose": int(stock_data.get('pcv', 0)),
-                "change": int(stock_data.get('cv', 0)),
-                "changePercent": float(stock_data.get('cr', 0)),
-                "dayOpen": int(stock_data.get('ov', 0)),
-                "dayHigh": int(stock_data.get('hv', 0)),
-                "dayLow": int(stock_data.get('lv', 0)),
-                "volume": int(stock_data.get('aq', 0)),
-                "timestamp": datetime.now().isoformat(),
-                "source": "naver_finance_api"
-            }
-            
-        except Exception as e:
-            print(f"Naver Finance API error for {symbol}: {e}", file=sys.stderr)
-            return None
+        return fetch_naver_polling(self.session, symbol, self.timer)
+    
+    def prewarm(self, count=2):
+        """Connect to the hosts of the first planned sources in the background"""
+        install_dns_cache()
+        return prewarm_requests(self.session, [SOURCE_HOSTS[source] for source in self.planner.plan()[:count]])
+    
+    def _try_source(self, source, crawl_method, symbol):
+        """Run one source and record its latency, outcome and bytes spent"""
+        started = time.perf_counter()
+        result = self.planner.attempt(source, lambda: crawl_method(symbol), self.timer)
+        self.metrics.observe_request(source, time.perf_counter() - started, result is not None)
+        return result
     
     def crawl_stock(self, symbol):
-        """Try multiple sources with fallback"""
-        # Try Naver API first (most reliable for Korean stocks)
-        result = self.crawl_naver_finance_api(symbol)
-        if result and result['currentPrice'] > 0:
-            return result
-        
-        # Random delay to avoid being blocked
-        time.sleep(random.uniform(0.5, 1.5))
-        
-        # Try Google Finance
-        result = self.crawl_google_finance(symbol)
-        if result and result['currentPrice'] > 0:
-            return result
-        
-        time.sleep(random.uniform(0.5, 1.5))
-        
-        # Try Yahoo Finance
-        result = self.crawl_yahoo_finance(symbol)
-        if result and result['currentPrice'] > 0:
-            return result
-        
-        time.sleep(random.uniform(0.5, 1.5))
-        
-        # Try Investing.com
-        result = self.crawl_investing_com(symbol)
-        if result and result['currentPrice'] > 0:
-            return result
+        """Try sources cheapest-bytes first, so HTML scraping is the last resort"""
+        for i, source in enumerate(self.planner.plan(list(self.sources))):
+            if i and source in HTML_PAGE_BYTES:
+                # Random delay to avoid being blocked by the scraped sites
+                time.sleep(random.uniform(0.5, 1.5))
+            
+            result = self._try_source(source, self.sources[source], symbol)
+            if result:
+                return result
         
         # All failed
         return {
@@ -375,24 +383,82 @@ class MultiFinanceCrawler:
         }
 
 def main():
-    if len(sys.argv) < 2:
+    # Connection setup to the planned hosts overlaps argument parsing
+    crawler = MultiFinanceCrawler()
+    crawler.prewarm()
+    
+    parser = argparse.ArgumentParser(description='Multi-source Korean stock crawler')
+    parser.add_argument('codes', nargs='?', help='Comma-separated stock codes')
+    parser.add_argument('--stats-file',
+                        help='Write run metrics here when done (JSON, or Prometheus text for *.prom)')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='Output encoding (msgpack needs msgpack, arrow needs pyarrow)')
+    parser.add_argument('--db-url', nargs='?', const='', metavar='URL',
+                        help='Also bulk-write the results to this database (default DATABASE_URL)')
+    parser.add_argument('--redis-url', nargs='?', const='', metavar='URL',
+                        help='Also publish the results to the Redis price cache (default REDIS_URL)')
+    parser.add_argument('--changed-only', nargs='?', type=float, const=0.0, metavar='EPSILON',
+                        help='Only emit symbols whose quote moved by more than EPSILON (relative) '
+                             'since it was last emitted')
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_SECONDS,
+                        help='With --changed-only, re-emit unchanged symbols after this many seconds')
+    parser.add_argument('--delta-state', metavar='PATH',
+                        help='With --changed-only, where to keep the last emitted quotes '
+                             '(default .cache/last_emitted.<script>.json)')
+    parser.add_argument('--profile', nargs='?', const='', metavar='PREFIX',
+                        help='Profile the run into PREFIX.pstats and PREFIX.collapsed')
+    args = parser.parse_args()
+    
+    if not args.codes:
         print(json.dumps([{"error": "No stock codes provided"}]))
         sys.exit(1)
     
-    stock_codes = sys.argv[1].split(",")
-    crawler = MultiFinanceCrawler()
+    profiler = nullcontext()
+    if args.profile is not None:
+        profiler = profile_run(args.profile or default_profile_prefix(__file__, args.stats_file))
+    
+    with profiler:
+        run_crawler(args, crawler)
+
+def run_crawler(args, crawler):
+    # Duplicate codes would only repeat the same upstream requests
+    stock_codes = list(dict.fromkeys(code.strip() for code in args.codes.split(",") if code.strip()))
+    crawler.metrics.queue_depth = len(stock_codes)
     results = []
     
     for i, code in enumerate(stock_codes):
         print(f"Crawling {code}... ({i+1}/{len(stock_codes)})", file=sys.stderr)
         result = crawler.crawl_stock(code)
         results.append(result)
+        crawler.metrics.queue_depth -= 1
+        crawler.metrics.observe_symbol('error' not in result)
         
         # Delay between requests
         if i < len(stock_codes) - 1:
             time.sleep(random.uniform(1, 2))
     
-    print(json.dumps(results, ensure_ascii=False))
+    # Inconsistent quotes get warnings, implausible prices are turned into errors
+    last_good = LastGoodPrices()
+    results, _ = validate_quotes(results, last_good)
+    last_good.save()
+    
+    if args.changed_only is not None:
+        # Unchanged quotes would only rewrite the same Stock rows downstream
+        delta = DeltaFilter(args.changed_only, args.heartbeat, args.delta_state or default_state_path(__file__))
+        results = delta.filter(results)
+        delta.save()
+        print(f"Suppressed {delta.suppressed} unchanged quotes", file=sys.stderr)
+    
+    emit_results(results, args.format)
+    if args.db_url is not None:
+        write_results(results, args.db_url or None)
+    if args.redis_url is not None:
+        publish_results(results, args.redis_url or None)
+    crawler.timer.emit()
+    crawler.planner.save()
+    print(json.dumps({'source_bytes': crawler.planner.summary()}), file=sys.stderr)
+    if args.stats_file:
+        crawler.metrics.write_stats_file(args.stats_file)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
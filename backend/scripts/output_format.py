@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Result encodings for the crawler CLIs' stdout.
+
+- json: the existing output, one JSON array (one line per batch in daemon mode)
+- msgpack: the same list of quote dicts as MessagePack; needs msgpack
+- arrow: an Arrow IPC stream holding one QuoteBatch record batch, prices in
+  fixed point (schema metadata price_scale); needs pyarrow
+
+Binary payloads can't be newline-delimited, so in daemon mode each one is
+written as a frame: a 4-byte big-endian length followed by the payload.
+"""
+
+import json
+import struct
+import sys
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from quote_batch import QuoteBatch
+
+FORMATS = ('json', 'msgpack', 'arrow')
+
+_FRAME_HEADER = struct.Struct('>I')
+
+
+def encode(quotes: List[Dict[str, Any]], fmt: str) -> bytes:
+    if fmt == 'json':
+        return json.dumps(quotes, ensure_ascii=False).encode('utf-8')
+    if fmt == 'msgpack':
+        try:
+            import msgpack
+        except ImportError:
+            raise RuntimeError("msgpack is required for MessagePack output: pip install msgpack")
+        return msgpack.packb(quotes, use_bin_type=True)
+    if fmt == 'arrow':
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError("pyarrow is required for Arrow output: pip install pyarrow")
+        batch = QuoteBatch.from_quotes(quotes).to_arrow()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+def emit_results(quotes: List[Dict[str, Any]], fmt: str = 'json', framed: bool = False):
+    """Write one batch of results to stdout
+
+    JSON stays a text line so existing readers are unaffected; binary formats
+    go to the underlying byte stream, length-prefixed when framed.
+    """
+    if fmt == 'json':
+        sys.stdout.write(json.dumps(quotes, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+        return
+    payload = encode(quotes, fmt)
+    # Anything printed earlier has to reach the pipe before the raw bytes
+    sys.stdout.flush()
+    if framed:
+        sys.stdout.buffer.write(_FRAME_HEADER.pack(len(payload)))
+    sys.stdout.buffer.write(payload)
+    sys.stdout.buffer.flush()
+
+
+def read_frame(stream: BinaryIO) -> Optional[bytes]:
+    """Next framed payload from a daemon's stdout, or None at end of stream"""
+    header = stream.read(_FRAME_HEADER.size)
+    if len(header) < _FRAME_HEADER.size:
+        return None
+    (length,) = _FRAME_HEADER.unpack(header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise EOFError(f"Frame cut short: expected {length} bytes, got {len(payload)}")
+    return payload
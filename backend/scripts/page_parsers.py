@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Quote page parsers for advanced_multi_crawler's HTML fallbacks.
+
+Each parser is a pure function of (symbol, html) returning the structured
+quote or None, so it can run in a worker process: the crawler's event loop
+only ships the body out and gets a small dict back. This module imports
+nothing heavy, which keeps worker start-up cheap.
+"""
+
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+_GOOGLE_PRICE = re.compile(r'class="YMlKec fxKbKc">([0-9,.]+)')
+_MARKETWATCH_PRICE = re.compile(r'class="intraday__price"[^>]*>.*?([0-9,.]+)', re.DOTALL)
+_CNBC_PRICE = re.compile(r'QuoteStrip-lastPrice">([0-9,.]+)')
+
+
+def _price_quote(symbol: str, match: Optional[re.Match], source: str) -> Optional[Dict[str, Any]]:
+    if not match:
+        return None
+    return {
+        'symbol': symbol,
+        'price': float(match.group(1).replace(',', '')),
+        'source': source,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def parse_yahoo_page(symbol: str, html: str) -> Optional[Dict[str, Any]]:
+    # Tickers like BRK.B contain regex metacharacters
+    pattern = r'data-symbol="' + re.escape(symbol) + r'"[^>]*data-field="regularMarketPrice"[^>]*>([0-9,.]+)'
+    return _price_quote(symbol, re.search(pattern, html), 'Yahoo Finance')
+
+
+def parse_google_page(symbol: str, html: str) -> Optional[Dict[str, Any]]:
+    return _price_quote(symbol, _GOOGLE_PRICE.search(html), 'Google Finance')
+
+
+def parse_investing_page(symbol: str, html: str) -> Optional[Dict[str, Any]]:
+    # Investing.com search results need more than a regex; not parsed yet
+    return None
+
+
+def parse_marketwatch_page(symbol: str, html: str) -> Optional[Dict[str, Any]]:
+    return _price_quote(symbol, _MARKETWATCH_PRICE.search(html), 'MarketWatch')
+
+
+def parse_cnbc_page(symbol: str, html: str) -> Optional[Dict[str, Any]]:
+    return _price_quote(symbol, _CNBC_PRICE.search(html), 'CNBC')
+
+
+PAGE_PARSERS: Dict[str, Callable[[str, str], Optional[Dict[str, Any]]]] = {
+    'yahoo': parse_yahoo_page,
+    'google': parse_google_page,
+    'investing': parse_investing_page,
+    'marketwatch': parse_marketwatch_page,
+    'cnbc': parse_cnbc_page,
+}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Column-oriented form of a batch of crawler quotes.
+
+The crawlers produce quote dicts; QuoteBatch converts a finished batch into
+one typed array per field, which is the layout of the Arrow output format:
+
+- prices as int64 fixed point (PRICE_SCALE units, exact for KRW and cents)
+- changePercent as float32, volume as int64
+- timestamps as int64 epoch milliseconds
+- sources as uint16 ids into a small interned table
+
+extend() makes one pass over the quotes per field and writes the values
+into that field's array. to_arrow() wraps the arrays without copying them
+and needs pyarrow, which is optional.
+"""
+
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Same key order as the crawlers' result dicts
+FIELDS = ('symbol', 'name', 'currentPrice', 'previousClose', 'change', 'changePercent',
+          'dayOpen', 'dayHigh', 'dayLow', 'volume', 'timestamp', 'source')
+
+PRICE_FIELDS = ('currentPrice', 'previousClose', 'change', 'dayOpen', 'dayHigh', 'dayLow')
+
+# Fixed-point scale of the price columns: 4 decimal places
+PRICE_SCALE = 10_000
+
+
+def _timestamp_ms(value: Any) -> int:
+    """Crawler timestamp as epoch ms; naive ISO strings are local time"""
+    if isinstance(value, (int, float)):
+        return int(value * 1000)
+    if isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value).timestamp() * 1000)
+        except ValueError:
+            pass
+    return int(time.time() * 1000)
+
+
+def _number(value: Any) -> float:
+    return value if isinstance(value, (int, float)) else 0
+
+
+class QuoteBatch:
+    def __init__(self, capacity: int = 64):
+        self.length = 0
+        self.symbols: List[str] = []
+        self.names: List[str] = []
+        self.prices: Dict[str, np.ndarray] = {field: np.zeros(capacity, np.int64) for field in PRICE_FIELDS}
+        self.change_percent = np.zeros(capacity, np.float32)
+        self.volume = np.zeros(capacity, np.int64)
+        self.timestamp = np.zeros(capacity, np.int64)
+        self.source = np.zeros(capacity, np.uint16)
+        self.source_names: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        self.errors: List[Optional[str]] = []
+
+    def __len__(self):
+        return self.length
+
+    def source_id(self, source: str) -> int:
+        """Interned id for a source name"""
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            source_id = self._source_ids[source] = len(self.source_names)
+            self.source_names.append(source)
+        return source_id
+
+    def _reserve(self, rows: int):
+        capacity = len(self.volume)
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2)
+
+        def grown(array: np.ndarray) -> np.ndarray:
+            new = np.zeros(capacity, array.dtype)
+            new[:self.length] = array[:self.length]
+            return new
+
+        self.prices = {field: grown(array) for field, array in self.prices.items()}
+        self.change_percent = grown(self.change_percent)
+        self.volume = grown(self.volume)
+        self.timestamp = grown(self.timestamp)
+        self.source = grown(self.source)
+
+    def extend(self, quotes: Iterable[Dict[str, Any]]):
+        """Add crawler result dicts, one pass over them per column"""
+        quotes = list(quotes)
+        start, count = self.length, len(quotes)
+        self._reserve(start + count)
+        end = start + count
+        rows = slice(start, end)
+
+        for field in PRICE_FIELDS:
+            values = np.array([_number(quote.get(field)) for quote in quotes], dtype=np.float64)
+            self.prices[field][rows] = np.rint(values * PRICE_SCALE)
+        self.change_percent[rows] = [_number(quote.get('changePercent')) for quote in quotes]
+        self.volume[rows] = [int(_number(quote.get('volume'))) for quote in quotes]
+        self.timestamp[rows] = [_timestamp_ms(quote.get('timestamp')) for quote in quotes]
+        self.source[rows] = [self.source_id(quote.get('source') or 'crawler') for quote in quotes]
+
+        for quote in quotes:
+            symbol = quote.get('symbol') or ''
+            self.symbols.append(symbol)
+            self.names.append(quote.get('name') or symbol)
+            self.errors.append(quote.get('error'))
+        self.length = end
+
+    @classmethod
+    def from_quotes(cls, quotes: Iterable[Dict[str, Any]]) -> 'QuoteBatch':
+        quotes = list(quotes)
+        batch = cls(max(len(quotes), 1))
+        batch.extend(quotes)
+        return batch
+
+    def to_arrow(self):
+        """pyarrow.RecordBatch over the column arrays (numeric columns are not copied)
+
+        Prices stay int64 fixed point; the schema metadata carries price_scale.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError("pyarrow is required for Arrow output: pip install pyarrow")
+
+        n = self.length
+        arrays = [pa.array(self.symbols, pa.string()), pa.array(self.names, pa.string())]
+        arrays += [pa.array(self.prices[field][:n]) for field in ('currentPrice', 'previousClose', 'change')]
+        arrays.append(pa.array(self.change_percent[:n]))
+        arrays += [pa.array(self.prices[field][:n]) for field in ('dayOpen', 'dayHigh', 'dayLow')]
+        arrays.append(pa.array(self.volume[:n]))
+        arrays.append(pa.array(self.timestamp[:n]).view(pa.timestamp('ms', tz='UTC')))
+        arrays.append(pa.DictionaryArray.from_arrays(pa.array(self.source[:n]),
+                                                     pa.array(self.source_names, pa.string())))
+        arrays.append(pa.array(self.errors, pa.string()))
+        return pa.RecordBatch.from_arrays(arrays, names=list(FIELDS) + ['error'],
+                                          metadata={'price_scale': str(PRICE_SCALE)})
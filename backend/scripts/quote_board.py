@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared-memory quote board: the latest quote of every KRX listing in a
+fixed-layout memory-mapped file.
+
+    header (64 bytes) | slot 0 | slot 1 | ... (64 bytes each)
+
+There is one slot per symbol master record, in the same (code) order, and
+each slot carries its code, so a reader indexes the slots once without
+opening the master. A slot is
+
+    seq u32 | reserved u32 | code 8s | price, open, high, low f64 | volume i64 | updated ms i64
+
+all little-endian. Slots are seqlock-versioned: the writer makes seq odd,
+writes the fields, then makes it even again. A reader copies the slot and
+re-reads seq; if it was odd or changed, the copy is torn and it retries.
+Readers never lock or make a syscall once the file is mapped. Writers
+serialize on an flock, so several crawlers can share one board.
+
+The layout is rebuilt when the master's codes change (codes_crc in the
+header).
+
+    quote_board.py read 005930,000660
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from http_cache import DEFAULT_CACHE_DIR
+from symbol_master import default_master
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BOARD_PATH = os.environ.get('QUOTE_BOARD_PATH') or os.path.join(DEFAULT_CACHE_DIR, 'quote_board.bin')
+
+MAGIC = b'KRQB'
+VERSION = 1
+
+# magic, version, slot size, slot count, CRC32 of the codes
+_HEADER = struct.Struct('<4sHHII')
+HEADER_SIZE = 64
+_SLOT = struct.Struct('<II8sddddqq')
+SLOT_SIZE = _SLOT.size
+_SEQ = struct.Struct('<I')
+# seq and code sit before the payload
+_PAYLOAD = struct.Struct('<ddddqq')
+_PAYLOAD_OFFSET = 16
+
+# A reader that keeps hitting a writer gives up rather than spin
+READ_RETRIES = 100
+
+
+def _codes_crc(codes: List[str]) -> int:
+    return zlib.crc32(','.join(codes).encode('ascii'))
+
+
+class QuoteBoard:
+    def __init__(self, buffer, lock_file=None):
+        self.buffer = buffer
+        self.lock_file = lock_file
+        magic, version, slot_size, self.count, self.codes_crc = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            raise ValueError("Not a quote board (or an incompatible version)")
+        self.slots = {self._code(i): i for i in range(self.count)}
+
+    @classmethod
+    def create(cls, path: str, codes: List[str]) -> 'QuoteBoard':
+        """Lay out an empty board for these codes (replacing any file at path)"""
+        buffer = bytearray(HEADER_SIZE + SLOT_SIZE * len(codes))
+        _HEADER.pack_into(buffer, 0, MAGIC, VERSION, SLOT_SIZE, len(codes), _codes_crc(codes))
+        for i, code in enumerate(codes):
+            _SLOT.pack_into(buffer, HEADER_SIZE + i * SLOT_SIZE, 0, 0, code.encode('ascii'), 0, 0, 0, 0, 0, 0)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers mapping the old file keep it until they reopen
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer)
+        os.replace(tmp_path, path)
+        return cls.open(path, writable=True)
+
+    @classmethod
+    def open(cls, path: str = DEFAULT_BOARD_PATH, writable: bool = False) -> 'QuoteBoard':
+        with open(path, 'r+b' if writable else 'rb') as f:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            buffer = mmap.mmap(f.fileno(), 0, access=access)
+        lock_file = open(f'{path}.lock', 'a') if writable else None
+        return cls(buffer, lock_file)
+
+    @classmethod
+    def for_master(cls, path: str = DEFAULT_BOARD_PATH) -> Optional['QuoteBoard']:
+        """Writable board over the default symbol master, rebuilt if the listings changed; None without a master"""
+        master = default_master()
+        if master is None:
+            logger.warning("No symbol master, so no quote board")
+            return None
+        codes = master.codes()
+        try:
+            board = cls.open(path, writable=True)
+            if board.count == len(codes) and board.codes_crc == _codes_crc(codes):
+                return board
+            board.close()
+        except (OSError, ValueError, struct.error):
+            pass
+        return cls.create(path, codes)
+
+    def close(self):
+        self.buffer.close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+
+    def __len__(self):
+        return self.count
+
+    def _code(self, i: int) -> str:
+        at = HEADER_SIZE + i * SLOT_SIZE + 8
+        return bytes(self.buffer[at:at + 8]).rstrip(b'\0').decode('ascii')
+
+    def update(self, quotes: Iterable[Dict[str, Any]], now: Optional[float] = None) -> int:
+        """Write the quotes of listed symbols into their slots; returns how many were written"""
+        updated = int((time.time() if now is None else now) * 1000)
+        written = 0
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            for quote in quotes:
+                slot = self.slots.get(quote.get('symbol'))
+                if slot is None or 'error' in quote:
+                    continue
+                at = HEADER_SIZE + slot * SLOT_SIZE
+                seq = _SEQ.unpack_from(self.buffer, at)[0]
+                _SEQ.pack_into(self.buffer, at, (seq + 1) & 0xFFFFFFFF)
+                _PAYLOAD.pack_into(self.buffer, at + _PAYLOAD_OFFSET,
+                                   float(quote.get('currentPrice') or 0), float(quote.get('dayOpen') or 0),
+                                   float(quote.get('dayHigh') or 0), float(quote.get('dayLow') or 0),
+                                   int(quote.get('volume') or 0), updated)
+                _SEQ.pack_into(self.buffer, at, (seq + 2) & 0xFFFFFFFF)
+                written += 1
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        return written
+
+    def read(self, code: str) -> Optional[Dict[str, Any]]:
+        """Latest quote in the slot, or None if the symbol isn't listed or was never written"""
+        slot = self.slots.get(code)
+        if slot is None:
+            return None
+        at = HEADER_SIZE + slot * SLOT_SIZE
+        for _ in range(READ_RETRIES):
+            seq = _SEQ.unpack_from(self.buffer, at)[0]
+            if seq & 1:
+                continue
+            price, day_open, high, low, volume, updated = _PAYLOAD.unpack_from(self.buffer, at + _PAYLOAD_OFFSET)
+            if _SEQ.unpack_from(self.buffer, at)[0] != seq:
+                continue
+            if not updated:
+                return None
+            return {
+                'symbol': code,
+                'currentPrice': price,
+                'dayOpen': day_open,
+                'dayHigh': high,
+                'dayLow': low,
+                'volume': volume,
+                'timestamp': datetime.fromtimestamp(updated / 1000).isoformat(),
+            }
+        raise RuntimeError(f"Quote board slot {code} kept changing while being read")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read the shared-memory quote board')
+    commands = parser.add_subparsers(dest='command', required=True)
+    read = commands.add_parser('read', help='Print the board quotes for comma-separated codes')
+    read.add_argument('codes')
+    read.add_argument('--path', default=DEFAULT_BOARD_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    board = QuoteBoard.open(args.path)
+    quotes = [board.read(code.strip()) for code in args.codes.split(',') if code.strip()]
+    print(json.dumps(quotes, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
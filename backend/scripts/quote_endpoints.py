@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lightweight JSON quote endpoints shared by the crawlers.
+
+Each fetcher returns a quote dict in the usual crawler shape, or None. They
+cost a few hundred bytes to a few KB per quote, against hundreds of KB for
+the desktop HTML pages, so the source planner tries them first.
+"""
+
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from source_planner import SourcePlanner
+from symbol_master import lookup_name
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+def _get(requester, timer, url: str, source: str, symbol: str, **kwargs):
+    if timer is not None:
+        return timer.get(requester, url, source, symbol, **kwargs)
+    return requester.get(url, **kwargs)
+
+
+def _number(value, cast=int):
+    """Naver mobile API returns numbers as strings like "71,000" or "-0.56" """
+    if value is None:
+        return cast(0)
+    return cast(float(str(value).replace(',', '')))
+
+
+def _quote(symbol: str, name: Optional[str], price, previous_close, change, change_percent,
+           day_open, day_high, day_low, volume, source: str) -> Dict[str, Any]:
+    return {
+        "symbol": symbol,
+        # itemSummary has no name; the symbol master costs no request
+        "name": name or lookup_name(symbol) or symbol,
+        "currentPrice": price,
+        "previousClose": previous_close,
+        "change": change,
+        "changePercent": change_percent,
+        # Fields an endpoint doesn't carry fall back to the current price
+        "dayOpen": day_open or price,
+        "dayHigh": day_high or price,
+        "dayLow": day_low or price,
+        "volume": volume,
+        "timestamp": datetime.now().isoformat(),
+        "source": source
+    }
+
+
+def fetch_naver_polling(requester, symbol: str, timer=None, timeout: int = 10) -> Optional[Dict[str, Any]]:
+    """polling.finance.naver.com realtime API (~1KB, full OHLC)"""
+    try:
+        url = f"https://polling.finance.naver.com/api/realtime/domestic/stock/{symbol}"
+        headers = {
+            'User-Agent': USER_AGENT,
+            'Referer': f'https://finance.naver.com/item/main.naver?code={symbol}',
+        }
+        response = _get(requester, timer, url, 'naver_finance_api', symbol, headers=headers, timeout=timeout)
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        if not data or not data.get('datas'):
+            return None
+
+        item = data['datas'][0]
+        return _quote(
+            symbol, item.get('nm'), int(item.get('nv', 0)), int(item.get('pcv', 0)),
+            int(item.get('cv', 0)), float(item.get('cr', 0)), int(item.get('ov', 0)),
+            int(item.get('hv', 0)), int(item.get('lv', 0)), int(item.get('aq', 0)),
+            'naver_finance_api'
+        )
+    except Exception as e:
+        print(f"Naver polling API error for {symbol}: {e}", file=sys.stderr)
+        return None
+
+
+def fetch_naver_item_summary(requester, symbol: str, timer=None, timeout: int = 10) -> Optional[Dict[str, Any]]:
+    """api.finance.naver.com itemSummary (~300B, no name or open price)"""
+    try:
+        url = f"https://api.finance.naver.com/service/itemSummary.nhn?itemcode={symbol}"
+        response = _get(requester, timer, url, 'naver_item_summary', symbol,
+                        headers={'User-Agent': USER_AGENT}, timeout=timeout)
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        price = int(data.get('now', 0))
+        if price <= 0:
+            return None
+
+        change = int(data.get('diff', 0))
+        return _quote(
+            symbol, None, price, price - change, change, float(data.get('rate', 0)),
+            None, int(data.get('high', 0)), int(data.get('low', 0)), int(data.get('quant', 0)),
+            'naver_item_summary'
+        )
+    except Exception as e:
+        print(f"Naver itemSummary error for {symbol}: {e}", file=sys.stderr)
+        return None
+
+
+def fetch_naver_mobile(requester, symbol: str, timer=None, timeout: int = 10) -> Optional[Dict[str, Any]]:
+    """m.stock.naver.com basic API (~2KB, price and change only)"""
+    try:
+        url = f"https://m.stock.naver.com/api/stock/{symbol}/basic"
+        response = _get(requester, timer, url, 'naver_mobile_api', symbol,
+                        headers={'User-Agent': USER_AGENT}, timeout=timeout)
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        price = _number(data.get('closePrice'))
+        if price <= 0:
+            return None
+
+        change = _number(data.get('compareToPreviousClosePrice'))
+        return _quote(
+            symbol, data.get('stockName'), price, price - change, change,
+            _number(data.get('fluctuationsRatio'), float), None, None, None, 0,
+            'naver_mobile_api'
+        )
+    except Exception as e:
+        print(f"Naver mobile API error for {symbol}: {e}", file=sys.stderr)
+        return None
+
+
+def fetch_daum_quote(requester, symbol: str, timer=None, timeout: int = 10) -> Optional[Dict[str, Any]]:
+    """finance.daum.net quotes API (~3KB, full OHLC)"""
+    try:
+        url = f"https://finance.daum.net/api/quotes/A{symbol}"
+        headers = {
+            'User-Agent': USER_AGENT,
+            'Referer': 'https://finance.daum.net/',
+            'Accept': 'application/json',
+        }
+        response = _get(requester, timer, url, 'daum_api', symbol, headers=headers, timeout=timeout)
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        return _quote(
+            symbol, data.get('name'), int(data.get('tradePrice', 0)), int(data.get('prevClosingPrice', 0)),
+            int(data.get('change', 0)), float(data.get('changeRate', 0) * 100),
+            int(data.get('openingPrice', 0)), int(data.get('highPrice', 0)), int(data.get('lowPrice', 0)),
+            int(data.get('accTradeVolume', 0)), 'daum_api'
+        )
+    except Exception as e:
+        print(f"Daum quotes API error for {symbol}: {e}", file=sys.stderr)
+        return None
+
+
+# Source name -> (fetcher, typical bytes per response, used until observed)
+JSON_ENDPOINTS = {
+    'naver_item_summary': (fetch_naver_item_summary, 400),
+    'naver_finance_api': (fetch_naver_polling, 1500),
+    'naver_mobile_api': (fetch_naver_mobile, 2000),
+    'daum_api': (fetch_daum_quote, 3000),
+}
+
+# Source name -> origin it talks to, for connection pre-warming
+ENDPOINT_HOSTS = {
+    'naver_item_summary': 'https://api.finance.naver.com/',
+    'naver_finance_api': 'https://polling.finance.naver.com/',
+    'naver_mobile_api': 'https://m.stock.naver.com/',
+    'daum_api': 'https://finance.daum.net/',
+}
+
+
+def json_planner(extra_bytes: Optional[Dict[str, int]] = None) -> SourcePlanner:
+    """Planner over the JSON endpoints plus any heavier sources a crawler has"""
+    expected_bytes = {name: size for name, (_, size) in JSON_ENDPOINTS.items()}
+    expected_bytes.update(extra_bytes or {})
+    return SourcePlanner(expected_bytes)
+
+
+def fetch_json_quote(planner: SourcePlanner, requester, symbol: str, timer,
+                     sources: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """Try the JSON endpoints cheapest first; the first usable quote or None"""
+    for source in planner.plan(sources or list(JSON_ENDPOINTS)):
+        fetch = JSON_ENDPOINTS[source][0]
+        result = planner.attempt(source, lambda: fetch(requester, symbol, timer), timer)
+        if result:
+            return result
+    return None
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Token-bucket rate limits for concurrent crawlers.
+
+Concurrency alone doesn't protect an upstream: 16 workers against a fast
+endpoint can still fire hundreds of requests a second. These limiters cap
+the request start rate per host, allowing a small burst.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+
+class AsyncRateLimiter:
+    """At most `rate` acquisitions per second on average, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # The lock queues waiters so tokens go out first come, first served
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class RateLimiter:
+    """AsyncRateLimiter for thread pools: acquire() blocks the calling thread"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class HostRateLimiter:
+    """One AsyncRateLimiter per host; `rates` overrides the default per host"""
+
+    def __init__(self, default_rate: float, rates: Optional[Dict[str, float]] = None):
+        self.default_rate = default_rate
+        self.rates = rates or {}
+        self.limiters: Dict[str, AsyncRateLimiter] = {}
+
+    def for_url(self, url: str) -> AsyncRateLimiter:
+        host = urlsplit(url).hostname or ''
+        limiter = self.limiters.get(host)
+        if limiter is None:
+            limiter = self.limiters[host] = AsyncRateLimiter(self.rates.get(host, self.default_rate))
+        return limiter
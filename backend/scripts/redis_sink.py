@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Redis sink for crawled quotes.
+
+Writes a batch straight into the keys ImprovedCacheService reads
+(stock:price:<symbol>, a JSON value with a 60 s TTL), so the API sees fresh
+prices without waiting for the Node process to parse crawler output and set
+them one key at a time. The whole batch is one pipeline and one round trip:
+a single MSET, an EXPIRE per key, and an XADD per quote on the
+stock:quotes stream for consumers that want change events.
+
+The client only needs pipeline(), so fakeredis works as a stand-in.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# cacheService-improved.ts: generateKey('stock', 'price', symbol), cacheConfig.stockPrice
+PRICE_KEY = 'stock:price:{}'
+PRICE_TTL = 60
+
+QUOTE_STREAM = 'stock:quotes'
+# Approximate cap on stream entries; trimming whole macro nodes keeps XADD O(1)
+STREAM_MAXLEN = 10000
+
+# Stream entry fields, a flat subset of the quote
+EVENT_FIELDS = ('symbol', 'currentPrice', 'change', 'changePercent', 'volume', 'timestamp', 'source')
+
+
+class RedisSink:
+    def __init__(self, client, ttl: int = PRICE_TTL, stream: Optional[str] = QUOTE_STREAM,
+                 maxlen: int = STREAM_MAXLEN):
+        self.client = client
+        self.ttl = ttl
+        self.stream = stream
+        self.maxlen = maxlen
+
+    @classmethod
+    def connect(cls, url: Optional[str] = None, **kwargs) -> 'RedisSink':
+        """redis://... (needs redis); defaults to REDIS_URL"""
+        url = url or os.environ.get('REDIS_URL')
+        if not url:
+            raise ValueError("No Redis URL given and REDIS_URL is not set")
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("redis is required for the Redis sink: pip install redis")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def close(self):
+        self.client.close()
+
+    def publish(self, quotes: Iterable[Dict[str, Any]]) -> int:
+        """Set, expire and announce a batch in one round trip; error rows are skipped
+
+        Returns the number of quotes written.
+        """
+        quotes = [quote for quote in quotes if 'error' not in quote and quote.get('symbol')]
+        if not quotes:
+            return 0
+        values = {PRICE_KEY.format(quote['symbol']): json.dumps(quote, ensure_ascii=False) for quote in quotes}
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.mset(values)
+        for key in values:
+            pipe.expire(key, self.ttl)
+        if self.stream:
+            for quote in quotes:
+                event = {field: str(quote[field]) for field in EVENT_FIELDS if quote.get(field) is not None}
+                pipe.xadd(self.stream, event, maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+        return len(quotes)
+
+
+def publish_results(quotes: Iterable[Dict[str, Any]], url: Optional[str] = None) -> Optional[int]:
+    """One-shot publish for CLI runs; logs and returns None instead of raising
+
+    The cache is only an accelerator, so an unreachable Redis never fails a run.
+    """
+    try:
+        sink = RedisSink.connect(url)
+    except Exception as e:
+        logger.error(f"Redis sink unavailable: {e}")
+        return None
+    try:
+        return sink.publish(quotes)
+    except Exception as e:
+        logger.error(f"Publishing to Redis failed: {e}")
+        return None
+    finally:
+        sink.close()
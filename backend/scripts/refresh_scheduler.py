@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Demand-driven price refresh scheduler.
+
+Instead of refreshing every tracked stock on one flat cron, each symbol gets
+a refresh interval from its priority:
+
+    priority = 1 + 2*log1p(holders) + log1p(watchers) + 0.5*volatility
+    interval = clamp(MAX_INTERVAL / priority, MIN_INTERVAL, MAX_INTERVAL)
+
+holders/watchers are the students holding or watching it. volatility is an
+exponentially weighted average of |changePercent| over its refreshes.
+
+Symbols wait in a deadline heap. Each cycle spends at most `budget` quote
+requests on the due symbols, earliest deadline first, so a stock nobody has
+looked at for a while still gets its turn, just rarely. A symbol costs one
+request per JSON endpoint tried, so the number taken per cycle is the budget
+over the recent requests per symbol. Stale symbols start out due: their
+first deadline is their lastPriceUpdate plus the interval.
+
+Refreshed quotes go through a DeltaFilter before the database, so a symbol
+that hasn't moved only rewrites its Stock row and history once per heartbeat.
+
+    refresh_scheduler.py                    # run against DATABASE_URL
+    refresh_scheduler.py --plan             # print the schedule and exit
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from db_sink import QuoteSink
+from delta_filter import HEARTBEAT_SECONDS, DeltaFilter, default_state_path
+from history_buffer import HistoryBuffer
+from quote_board import DEFAULT_BOARD_PATH, QuoteBoard
+from quote_endpoints import JSON_ENDPOINTS, fetch_json_quote, json_planner
+from quote_validation import LastGoodPrices, validate_quotes
+from redis_sink import RedisSink
+from request_timing import RequestTimer
+
+logger = logging.getLogger(__name__)
+
+MIN_INTERVAL = 60.0
+MAX_INTERVAL = 3600.0
+
+HOLDER_WEIGHT = 2.0
+WATCHER_WEIGHT = 1.0
+VOLATILITY_WEIGHT = 0.5
+
+# Weight of the newest |changePercent| in the volatility average
+VOLATILITY_ALPHA = 0.3
+
+# Failed refreshes retry after this, doubling per consecutive failure up to the interval
+RETRY_SECONDS = 30.0
+
+# How often the demand counts are re-read from the database
+RELOAD_SECONDS = 300.0
+
+# Weight of the newest cycle in the requests-per-symbol average
+REQUESTS_ALPHA = 0.3
+
+
+def _epoch(value: Any) -> Optional[float]:
+    """lastPriceUpdate (naive UTC datetime, or a string from SQLite) as epoch seconds"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return None
+
+
+class SymbolState:
+    __slots__ = ('holders', 'watchers', 'volatility', 'priority', 'interval', 'deadline', 'failures',
+                 'version')
+
+    def __init__(self):
+        self.holders = 0
+        self.watchers = 0
+        self.volatility = 0.0
+        self.priority = 1.0
+        self.interval = MAX_INTERVAL
+        self.deadline = 0.0
+        self.failures = 0
+        self.version = 0
+
+
+class RefreshScheduler:
+    def __init__(self, budget: int = 60, min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL):
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.states: Dict[str, SymbolState] = {}
+        # (deadline, -priority, symbol, version); outdated entries are skipped on pop
+        self.heap: List[Tuple[float, float, str, int]] = []
+
+    def __len__(self):
+        return len(self.states)
+
+    def _rescore(self, state: SymbolState):
+        state.priority = (1 + HOLDER_WEIGHT * math.log1p(state.holders) + WATCHER_WEIGHT * math.log1p(state.watchers)
+                          + VOLATILITY_WEIGHT * state.volatility)
+        state.interval = min(self.max_interval, max(self.min_interval, self.max_interval / state.priority))
+
+    def _schedule(self, symbol: str, state: SymbolState, deadline: float):
+        state.deadline = deadline
+        state.version += 1
+        heapq.heappush(self.heap, (deadline, -state.priority, symbol, state.version))
+
+    def set_demand(self, symbol: str, holders: int, watchers: int, change_percent: Optional[float] = None,
+                   last_update: Optional[float] = None, now: Optional[float] = None):
+        """Add a symbol or update its counts; a rise in priority pulls its deadline forward"""
+        now = time.time() if now is None else now
+        state = self.states.get(symbol)
+        if state is None:
+            state = self.states[symbol] = SymbolState()
+            state.volatility = abs(change_percent or 0)
+            state.holders, state.watchers = holders, watchers
+            self._rescore(state)
+            # Never updated means due now
+            self._schedule(symbol, state, now if last_update is None else last_update + state.interval)
+            return
+
+        old_interval = state.interval
+        state.holders, state.watchers = holders, watchers
+        self._rescore(state)
+        if state.interval < old_interval:
+            # Deadline as if the shorter interval had applied since the last refresh
+            self._schedule(symbol, state, state.deadline - old_interval + state.interval)
+
+    def load(self, rows: Iterable[Tuple], now: Optional[float] = None):
+        """Replace the demand from QuoteSink.refresh_candidates() rows; dropped symbols stop refreshing"""
+        now = time.time() if now is None else now
+        seen = set()
+        for symbol, holders, watchers, change_percent, last_update in rows:
+            seen.add(symbol)
+            self.set_demand(symbol, int(holders), int(watchers), change_percent, _epoch(last_update), now)
+        for symbol in set(self.states) - seen:
+            # Its heap entry is skipped once the state is gone
+            del self.states[symbol]
+
+    def due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[str]:
+        """Up to `limit` (at most `budget`) symbols whose deadline has passed, earliest first
+
+        They are provisionally rescheduled a full interval out; record()
+        adjusts that once the refresh result is known.
+        """
+        now = time.time() if now is None else now
+        limit = self.budget if limit is None else min(limit, self.budget)
+        batch = []
+        while self.heap and len(batch) < limit and self.heap[0][0] <= now:
+            deadline, _, symbol, version = heapq.heappop(self.heap)
+            state = self.states.get(symbol)
+            if state is None or state.version != version:
+                continue
+            batch.append(symbol)
+            self._schedule(symbol, state, now + state.interval)
+        return batch
+
+    def record(self, symbol: str, quote: Optional[Dict[str, Any]], now: Optional[float] = None):
+        """Feed a refresh result back: volatility from a quote, a sooner retry on failure"""
+        now = time.time() if now is None else now
+        state = self.states.get(symbol)
+        if state is None:
+            return
+        if quote is None or 'error' in quote:
+            state.failures += 1
+            retry = min(state.interval, RETRY_SECONDS * 2 ** (state.failures - 1))
+            self._schedule(symbol, state, now + retry)
+            return
+
+        state.failures = 0
+        change = abs(quote.get('changePercent') or 0)
+        state.volatility += VOLATILITY_ALPHA * (change - state.volatility)
+        self._rescore(state)
+        self._schedule(symbol, state, now + state.interval)
+
+    def next_deadline(self) -> Optional[float]:
+        while self.heap:
+            deadline, _, symbol, version = self.heap[0]
+            state = self.states.get(symbol)
+            if state is not None and state.version == version:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def plan(self) -> List[Dict[str, Any]]:
+        """Current schedule, soonest first"""
+        rows = [
+            {
+                'symbol': symbol,
+                'holders': state.holders,
+                'watchers': state.watchers,
+                'volatility': round(state.volatility, 3),
+                'priority': round(state.priority, 3),
+                'interval': round(state.interval, 1),
+                'deadline': datetime.fromtimestamp(state.deadline).isoformat(timespec='seconds'),
+            }
+            for symbol, state in self.states.items()
+        ]
+        return sorted(rows, key=lambda row: row['deadline'])
+
+
+def refreshable(symbol: str) -> bool:
+    """KRX codes; the JSON quote endpoints don't cover other markets"""
+    return len(symbol) == 6 and symbol.isalnum() and symbol[0].isdigit()
+
+
+def run(args):
+    sink = QuoteSink.connect(args.db_url)
+    scheduler = RefreshScheduler(args.budget, args.min_interval, args.max_interval)
+    scheduler.load(row for row in sink.refresh_candidates() if refreshable(row[0]))
+    if args.plan:
+        print(json.dumps(scheduler.plan(), ensure_ascii=False))
+        sink.close()
+        return
+
+    # requests.Session isn't thread-safe, so each worker keeps its own
+    sessions = threading.local()
+    planner = json_planner()
+    timer = RequestTimer()
+    last_good = LastGoodPrices()
+    delta = DeltaFilter(args.epsilon, args.heartbeat, args.delta_state or default_state_path(__file__))
+    cache = RedisSink.connect(args.redis_url or None) if args.redis_url is not None else None
+    board = QuoteBoard.for_master(args.board or DEFAULT_BOARD_PATH) if args.board is not None else None
+    reloaded = time.monotonic()
+    # Until observed, assume every endpoint gets tried
+    requests_per_symbol = float(len(JSON_ENDPOINTS))
+
+    def fetch(symbol: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        """The quote and how many requests it took"""
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        with timer.capture() as records:
+            quote = fetch_json_quote(planner, session, symbol, timer)
+        return quote, len(records)
+
+    with HistoryBuffer(sink, source='scheduler') as history, ThreadPoolExecutor(args.workers) as pool:
+        while True:
+            if time.monotonic() - reloaded >= RELOAD_SECONDS:
+                try:
+                    rows = sink.refresh_candidates()
+                except Exception as e:
+                    logger.error(f"Reloading demand failed, keeping the current schedule: {e}")
+                else:
+                    scheduler.load(row for row in rows if refreshable(row[0]))
+                reloaded = time.monotonic()
+                # One timing summary per reload period
+                timer.emit(reset=True)
+
+            symbols = scheduler.due(limit=max(1, int(args.budget / requests_per_symbol)))
+            if symbols:
+                fetched = list(pool.map(fetch, symbols))
+                spent = sum(count for _, count in fetched)
+                requests_per_symbol += REQUESTS_ALPHA * (max(spent / len(symbols), 1.0) - requests_per_symbol)
+                results, _ = validate_quotes([quote for quote, _ in fetched if quote], last_good)
+                by_symbol = {result['symbol']: result for result in results}
+                now = time.time()
+                for symbol in symbols:
+                    scheduler.record(symbol, by_symbol.get(symbol), now)
+                # Volatility above still learns from unchanged quotes
+                changed = delta.filter(results, now)
+                history.add(changed)
+                if board is not None:
+                    board.update(results, now)
+                history.flush()
+                if cache is not None:
+                    try:
+                        cache.publish(changed)
+                    except Exception as e:
+                        logger.error(f"Publishing to Redis failed: {e}")
+                last_good.save()
+                delta.save()
+                logger.info(f"Refreshed {sum('error' not in r for r in results)}/{len(symbols)} symbols "
+                            f"with {spent} requests, {sum('error' not in r for r in changed)} changed, "
+                            f"{len(scheduler)} scheduled")
+
+            if args.once:
+                break
+            # Sleep to the next deadline, but at least one cycle between bursts
+            next_deadline = scheduler.next_deadline()
+            wait = args.cycle if next_deadline is None else max(args.cycle, next_deadline - time.time())
+            time.sleep(min(wait, RELOAD_SECONDS))
+
+    planner.save()
+    timer.emit()
+    if cache is not None:
+        cache.close()
+    if board is not None:
+        board.close()
+    sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh stock prices by demand, within a request budget')
+    parser.add_argument('--db-url', help='Database URL (default DATABASE_URL)')
+    parser.add_argument('--budget', type=int, default=60, help='Most quote requests per cycle')
+    parser.add_argument('--cycle', type=float, default=60.0, help='Seconds between cycles')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL,
+                        help='Refresh interval of the hottest symbols (seconds)')
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL,
+                        help='Refresh interval of symbols nobody holds or watches (seconds)')
+    parser.add_argument('--redis-url', nargs='?', const='', metavar='URL',
+                        help='Also publish changed quotes to the Redis price cache (default REDIS_URL)')
+    parser.add_argument('--board', nargs='?', const='', metavar='PATH',
+                        help='Also keep the shared-memory quote board current (default QUOTE_BOARD_PATH)')
+    parser.add_argument('--epsilon', type=float, default=0.0,
+                        help='Relative move below which a quote counts as unchanged and is not written')
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_SECONDS,
+                        help='Write unchanged symbols anyway after this many seconds')
+    parser.add_argument('--delta-state', metavar='PATH',
+                        help='Where to keep the last written quotes '
+                             '(default .cache/last_emitted.refresh_scheduler.json)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent quote requests')
+    parser.add_argument('--once', action='store_true', help='Run one cycle and exit')
+    parser.add_argument('--plan', action='store_true', help='Print the schedule as JSON and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
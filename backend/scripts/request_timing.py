@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-request timing instrumentation shared by the crawlers.
+
+aiohttp sessions get a TraceConfig that records DNS, connect (TCP+TLS),
+time to first byte and body download phases. requests/cloudscraper sessions
+go through RequestTimer.get() or RequestTimer.track(), which record TTFB
+(from response.elapsed) and body time. Every record is tagged with the
+source and symbol it was made for, and the whole run is summarised as one
+JSON object at the end.
+
+Only the most recent MAX_RECORDS records are kept; older ones are folded
+into per-source totals as they drop out, so long-running modes stay bounded.
+They emit and reset() the summary periodically instead of once at exit.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+PHASES = ('dns_ms', 'connect_ms', 'ttfb_ms', 'body_ms', 'total_ms')
+
+# Records kept individually; percentiles are over this window
+MAX_RECORDS = 1000
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000, 2)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class TimingRecord:
+    """Timing and byte counts of a single HTTP request"""
+
+    __slots__ = (
+        'source', 'symbol', 'client', 'method', 'host', 'status', 'error',
+        'reused', 'bytes', 'wire_bytes', 'start', 'dns_start', 'dns_end',
+        'connect_start', 'connect_end', 'sent', 'headers', 'end',
+    )
+
+    def __init__(self, source: str, symbol: Optional[str], client: str,
+                 method: str, url: str):
+        self.source = source
+        self.symbol = symbol
+        self.client = client
+        self.method = method
+        self.host = urlsplit(url).hostname
+        self.status = None
+        self.error = None
+        self.reused = False
+        self.bytes = 0
+        self.wire_bytes = None
+        self.start = time.perf_counter()
+        self.dns_start = self.dns_end = None
+        self.connect_start = self.connect_end = None
+        self.sent = None
+        self.headers = None
+        self.end = None
+
+    def mark_headers(self, response=None):
+        """Response headers arrived (time to first byte)"""
+        self.headers = time.perf_counter()
+        if response is not None:
+            self.status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+            elapsed = getattr(response, 'elapsed', None)
+            if elapsed is not None:
+                # requests measures elapsed from send to parsed headers
+                self.headers = min(self.headers, self.start + elapsed.total_seconds())
+
+    def add_bytes(self, count: int):
+        self.bytes += count
+        self.end = time.perf_counter()
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.end is None or error is not None:
+            self.end = time.perf_counter()
+        if error is not None and self.error is None:
+            self.error = type(error).__name__
+
+    def to_dict(self) -> Dict[str, Any]:
+        first_byte_from = self.sent or self.connect_end or self.start
+        return {
+            'source': self.source,
+            'symbol': self.symbol,
+            'client': self.client,
+            'method': self.method,
+            'host': self.host,
+            'status': self.status,
+            'error': self.error,
+            'reused': self.reused,
+            'dns_ms': _ms(self.dns_start, self.dns_end),
+            'connect_ms': _ms(self.connect_start, self.connect_end),
+            'ttfb_ms': _ms(first_byte_from, self.headers),
+            'body_ms': _ms(self.headers, self.end),
+            'total_ms': _ms(self.start, self.end or self.headers),
+            'bytes': self.bytes,
+            'wire_bytes': self.wire_bytes,
+        }
+
+
+class _Tracked:
+    """Context manager returned by RequestTimer.track()"""
+
+    def __init__(self, timer: 'RequestTimer', record: TimingRecord):
+        self.timer = timer
+        self.record = record
+
+    def __enter__(self) -> TimingRecord:
+        return self.record
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.record.finish(exc_val)
+        return False
+
+
+def _new_totals() -> Dict[str, Any]:
+    # Per phase: count, sum, max
+    return {'requests': 0, 'errors': 0, 'bytes': 0, 'phases': {phase: [0, 0.0, 0.0] for phase in PHASES}}
+
+
+def _fold(totals: Dict[str, Dict[str, Any]], item: Dict[str, Any]):
+    stats = totals.setdefault(item['source'], _new_totals())
+    stats['requests'] += 1
+    stats['bytes'] += item['bytes']
+    if item['error'] or (item['status'] or 0) >= 400:
+        stats['errors'] += 1
+    for phase in PHASES:
+        value = item[phase]
+        if value is not None:
+            aggregate = stats['phases'][phase]
+            aggregate[0] += 1
+            aggregate[1] += value
+            aggregate[2] = max(aggregate[2], value)
+
+
+class RequestTimer:
+    """Collects TimingRecords for one crawler run"""
+
+    def __init__(self, max_records: int = MAX_RECORDS):
+        self.records: Deque[TimingRecord] = deque(maxlen=max_records)
+        # Records that dropped out of the window, per source
+        self.totals: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
+        self._trace_config = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _add(self, record: TimingRecord):
+        with self._lock:
+            if len(self.records) == self.records.maxlen:
+                _fold(self.totals, self.records[0].to_dict())
+            self.records.append(record)
+        for captured in getattr(self._local, 'captures', ()):
+            captured.append(record)
+
+    @contextmanager
+    def capture(self) -> Iterator[List[TimingRecord]]:
+        """Collect the records this thread starts inside the block
+
+        Attempts that run on a thread pool each see only their own requests.
+        """
+        captures = self._local.__dict__.setdefault('captures', [])
+        captured: List[TimingRecord] = []
+        captures.append(captured)
+        try:
+            yield captured
+        finally:
+            captures.remove(captured)
+
+    def reset(self):
+        """Start a new reporting period"""
+        with self._lock:
+            self.records.clear()
+            self.totals = {}
+            self.started_at = time.time()
+
+    # aiohttp ---------------------------------------------------------------
+
+    def trace_config(self):
+        """TraceConfig for aiohttp.ClientSession(trace_configs=[...])
+
+        Requests are tagged through trace_request_ctx={'source': ..., 'symbol': ...}.
+        """
+        if self._trace_config is not None:
+            return self._trace_config
+
+        import aiohttp
+
+        async def on_request_start(session, ctx, params):
+            tags = ctx.trace_request_ctx or {}
+            ctx.record = TimingRecord(
+                tags.get('source', 'unknown'), tags.get('symbol'), 'aiohttp',
+                params.method, str(params.url)
+            )
+            self._add(ctx.record)
+
+        async def on_dns_resolvehost_start(session, ctx, params):
+            ctx.record.dns_start = time.perf_counter()
+
+        async def on_dns_resolvehost_end(session, ctx, params):
+            ctx.record.dns_end = time.perf_counter()
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.record.connect_start = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx, params):
+            ctx.record.connect_end = time.perf_counter()
+
+        async def on_connection_reuseconn(session, ctx, params):
+            ctx.record.reused = True
+
+        async def on_request_headers_sent(session, ctx, params):
+            ctx.record.sent = time.perf_counter()
+
+        async def on_request_end(session, ctx, params):
+            record = ctx.record
+            record.mark_headers()
+            record.status = params.response.status
+            length = params.response.headers.get('Content-Length')
+            if length and length.isdigit():
+                record.wire_bytes = int(length)
+
+        async def on_response_chunk_received(session, ctx, params):
+            ctx.record.add_bytes(len(params.chunk))
+
+        async def on_request_exception(session, ctx, params):
+            ctx.record.finish(params.exception)
+
+        config = aiohttp.TraceConfig()
+        config.on_request_start.append(on_request_start)
+        config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        config.on_connection_create_start.append(on_connection_create_start)
+        config.on_connection_create_end.append(on_connection_create_end)
+        config.on_connection_reuseconn.append(on_connection_reuseconn)
+        config.on_request_headers_sent.append(on_request_headers_sent)
+        config.on_request_end.append(on_request_end)
+        config.on_response_chunk_received.append(on_response_chunk_received)
+        config.on_request_exception.append(on_request_exception)
+        self._trace_config = config
+        return config
+
+    # requests --------------------------------------------------------------
+
+    def track(self, source: str, symbol: Optional[str], url: str,
+              method: str = 'GET', client: str = 'requests') -> _Tracked:
+        """Manually timed request, for callers that stream the body themselves"""
+        record = TimingRecord(source, symbol, client, method, url)
+        self._add(record)
+        return _Tracked(self, record)
+
+    def request(self, requester, method: str, url: str, source: str,
+                symbol: Optional[str] = None, client: str = 'requests', **kwargs):
+        """Timed requester.request(); requester is a Session or the requests module"""
+        with self.track(source, symbol, url, method, client) as record:
+            response = requester.request(method, url, **kwargs)
+            record.mark_headers(response)
+            if not kwargs.get('stream'):
+                record.add_bytes(len(response.content))
+                try:
+                    record.wire_bytes = response.raw.tell()
+                except Exception:
+                    pass
+            return response
+
+    def get(self, requester, url: str, source: str, symbol: Optional[str] = None, **kwargs):
+        return self.request(requester, 'GET', url, source, symbol, **kwargs)
+
+    def post(self, requester, url: str, source: str, symbol: Optional[str] = None, **kwargs):
+        return self.request(requester, 'POST', url, source, symbol, **kwargs)
+
+    # summary ---------------------------------------------------------------
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals since started_at; percentiles and the request list cover the recent window"""
+        with self._lock:
+            records = list(self.records)
+            totals = {
+                source: {**stats, 'phases': {phase: list(aggregate) for phase, aggregate in stats['phases'].items()}}
+                for source, stats in self.totals.items()
+            }
+        requests = [record.to_dict() for record in records]
+        recent: Dict[str, Dict[str, List[float]]] = {}
+        for item in requests:
+            _fold(totals, item)
+            phases = recent.setdefault(item['source'], {phase: [] for phase in PHASES})
+            for phase in PHASES:
+                if item[phase] is not None:
+                    phases[phase].append(item[phase])
+
+        by_source: Dict[str, Dict[str, Any]] = {}
+        for source, stats in totals.items():
+            by_source[source] = {'requests': stats['requests'], 'errors': stats['errors'], 'bytes': stats['bytes']}
+            for phase, (count, total, maximum) in stats['phases'].items():
+                if not count:
+                    continue
+                values = recent.get(source, {}).get(phase) or [maximum]
+                by_source[source][phase] = {
+                    'mean': round(total / count, 2),
+                    'p50': _percentile(values, 50),
+                    'p95': _percentile(values, 95),
+                    'max': maximum,
+                }
+
+        return {
+            'type': 'request_timing',
+            'started_at': self.started_at,
+            'duration_ms': round((time.time() - self.started_at) * 1000, 2),
+            'total_requests': sum(stats['requests'] for stats in totals.values()),
+            'total_bytes': sum(stats['bytes'] for stats in totals.values()),
+            'by_source': by_source,
+            'requests': requests,
+        }
+
+    def emit(self, stream=None, reset: bool = False):
+        """Write the summary as a single JSON line (stderr by default); reset starts a new period"""
+        print(json.dumps(self.summary(), ensure_ascii=False), file=stream or sys.stderr)
+        if reset:
+            self.reset()
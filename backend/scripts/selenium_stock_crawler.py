@@ -14,6 +14,10 @@ import time
 import random
 from datetime import datetime
 import logging
+import requests
+from request_timing import RequestTimer
+from quote_endpoints import ENDPOINT_HOSTS, fetch_json_quote, json_planner
+from connection_warmup import install_dns_cache, prewarm_requests
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -237,16 +241,21 @@ def main():
     
     stock_codes = sys.argv[1].split(",")
     crawler = SeleniumStockCrawler()
+    timer = RequestTimer()
+    planner = json_planner()
+    session = requests.Session()
+    install_dns_cache()
+    prewarm_requests(session, [ENDPOINT_HOSTS[source] for source in planner.plan()[:2]])
     results = []
     
     try:
         for i, code in enumerate(stock_codes):
             logger.info(f"Crawling {code}... ({i+1}/{len(stock_codes)})")
             
-            # Try Daum API first (faster and more reliable)
-            result = crawler.crawl_daum_api(code)
+            # Try the JSON quote APIs first, smallest payload first
+            result = fetch_json_quote(planner, session, code, timer)
             
-            # If Daum fails, try Selenium on Naver
+            # If they all fail, try Selenium on Naver
             if not result or result.get('currentPrice', 0) == 0:
                 result = crawler.crawl_naver_with_selenium(code)
             
@@ -260,8 +269,10 @@ def main():
                 
     finally:
         crawler.close_driver()
+        planner.save()
     
     print(json.dumps(results, ensure_ascii=False))
+    timer.emit()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Request coalescing ("singleflight") for the asyncio crawler.
+
+Concurrent calls with the same key share one in-flight call: the first
+caller runs it, later callers await the same result or exception.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    def __init__(self, on_coalesced: Optional[Callable[[Hashable], None]] = None):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.on_coalesced = on_coalesced
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) unless a call for key is already in flight"""
+        while key in self._calls:
+            future = self._calls[key]
+            if self.on_coalesced:
+                self.on_coalesced(key)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # We were cancelled ourselves
+                    raise
+                # The leading caller was cancelled; take over the call
+
+        future = asyncio.get_event_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so a call nobody joined doesn't log "never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Payload-aware source ordering.
+
+Tracks how many bytes each source costs per successful quote and orders the
+sources cheapest first, so small JSON endpoints are tried before the heavy
+HTML pages. A source that fails is charged for the bytes it used anyway (at
+least its expected size), which pushes unreliable endpoints down the list.
+
+Costs come from request_timing records and are persisted next to the HTTP
+validator cache so short-lived CLI runs learn from each other.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from http_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Weight of history when folding in a new observation, so costs follow
+# endpoint changes without one odd response reordering everything
+DECAY = 0.8
+
+
+class SourcePlanner:
+    def __init__(self, expected_bytes: Dict[str, int], path: Optional[str] = None):
+        """expected_bytes: source -> rough bytes per quote, used until observed"""
+        self.expected_bytes = dict(expected_bytes)
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'source_bytes.json')
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self.dirty = False
+        # Attempts may run on a thread pool
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+        except FileNotFoundError:
+            self.stats = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable source stats {self.path}: {e}")
+            self.stats = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        with self.lock:
+            stats = {source: dict(values) for source, values in self.stats.items()}
+            self.dirty = False
+        # Another crawler may have saved other sources meanwhile
+        merged = stats
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                merged = {**json.load(f), **stats}
+        except (OSError, ValueError):
+            pass
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(merged, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def cost(self, source: str) -> float:
+        """Expected bytes spent per successful quote
+
+        The expected size counts as one prior successful quote, so new sources
+        start at it and sources that keep failing grow more expensive.
+        """
+        expected = float(self.expected_bytes.get(source, 0))
+        stats = self.stats.get(source)
+        if not stats:
+            return expected
+        return (stats['bytes'] + expected) / (stats['quotes'] + 1)
+
+    def plan(self, sources: Optional[List[str]] = None) -> List[str]:
+        """Sources cheapest first; ties keep the given order"""
+        sources = list(sources if sources is not None else self.expected_bytes)
+        return sorted(sources, key=self.cost)
+
+    def record(self, source: str, used_bytes: Optional[int], ok: bool):
+        """Fold one attempt in; used_bytes None means the client couldn't count"""
+        expected = self.expected_bytes.get(source, 0)
+        if used_bytes is None:
+            used_bytes = expected
+        elif not ok:
+            # A failed attempt still costs a round trip, even if nothing came back
+            used_bytes = max(used_bytes, expected)
+
+        with self.lock:
+            stats = self.stats.setdefault(source, {'bytes': 0.0, 'quotes': 0.0, 'attempts': 0})
+            stats['bytes'] = stats['bytes'] * DECAY + used_bytes
+            stats['quotes'] = stats['quotes'] * DECAY + (1 if ok else 0)
+            stats['attempts'] += 1
+            stats['updated_at'] = time.time()
+            self.dirty = True
+
+    def attempt(self, source: str, fetch: Callable[[], Optional[dict]], timer) -> Optional[dict]:
+        """Run fetch() and charge the source the bytes of the requests it made"""
+        with timer.capture() as records:
+            result = fetch()
+        ok = bool(result and result.get('currentPrice', 0) > 0)
+        self.record(source, sum(record.bytes for record in records) if records else None, ok)
+        return result if ok else None
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-source bytes per quote and attempt counts, for logs"""
+        return {
+            source: {
+                'bytes_per_quote': round(self.cost(source)),
+                'attempts': self.stats.get(source, {}).get('attempts', 0),
+            }
+            for source in self.plan()
+        }
@@ -1,15 +1,153 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import requests
 from bs4 import BeautifulSoup
 import json
 import sys
 import time
 from datetime import datetime
+from request_timing import RequestTimer
+from http_cache import ValidatorCache
+from crawler_metrics import CrawlerMetrics
+from html_scanner import StreamingFieldScanner, scan_response
+from crawler_profile import default_profile_prefix, profile_run
+from quote_endpoints import ENDPOINT_HOSTS, fetch_json_quote, json_planner
+from connection_warmup import install_dns_cache, prewarm_requests
+from quote_validation import LastGoodPrices, validate_quotes
+from history_buffer import write_results
+from redis_sink import publish_results
+from delta_filter import HEARTBEAT_SECONDS, DeltaFilter, default_state_path
+from output_format import FORMATS, emit_results
+from contextlib import nullcontext
 
-def crawl_naver_stock(stock_code):
-    """네이버 증권에서 주식 정보를 크롤링합니다."""
+# 요청별 구간 타이밍 (실행 종료 시 stderr로 요약 출력)
+timer = RequestTimer()
+
+# 캐시 적중률과 종목별 성공/실패 집계 (--stats-file로 기록)
+metrics = CrawlerMetrics('stock_crawler')
+
+# ETag/Last-Modified 검증 캐시 (실행 간 공유)
+http_cache = ValidatorCache(metrics=metrics)
+
+# 소스별 시세 1건당 바이트 기록, 가벼운 JSON API부터 시도 (item/main 페이지는 최후 수단)
+planner = json_planner({'naver_crawler': 250_000})
+
+# 소스별 접속 호스트 (시작 시 미리 연결할 대상)
+SOURCE_HOSTS = {**ENDPOINT_HOSTS, 'naver_crawler': 'https://finance.naver.com/'}
+
+# keep-alive 연결을 종목 간에 재사용
+session = requests.Session()
+
+# 스트리밍 모드에서 이 블록들이 모두 닫히면 나머지 본문 다운로드를 중단
+MAIN_MARKERS = {
+    'company': [r'class="wrap_company"[\s\S]*?</h2>'],
+    'no_today': [r'class="no_today"[\s\S]*?</p>'],
+    'no_info': [r'class="no_info"[\s\S]*?</table>'],
+    # 거래량(pgRR)은 시세 블록 뒤에 있어 따로 기다림
+    'volume': [r'class="pgRR"[\s\S]*?</td>'],
+}
+
+def parse_item_main(content):
+    """item/main.naver 페이지에서 종목명과 시세 필드를 추출합니다."""
+    # HTML 파싱
+    soup = BeautifulSoup(content, "html.parser")
+
+    # 종목명
+    stock_name = soup.find("div", {"class": "wrap_company"})
+    if stock_name:
+        stock_name = stock_name.find("h2").text.strip()
+    else:
+        stock_name = "Unknown"
+
+    # 현재가
+    current_price = soup.find("p", {"class": "no_today"})
+    if current_price:
+        current_price = current_price.find("span", {"class": "blind"}).text.strip()
+        current_price = int(current_price.replace(",", ""))
+    else:
+        current_price = 0
+
+    # 전일 종가
+    table = soup.find("table", {"class": "no_info"})
+    previous_close = 0
+    if table:
+        first_td = table.find("td", {"class": "first"})
+        if first_td:
+            previous_close_span = first_td.find("span", {"class": "blind"})
+            if previous_close_span:
+                previous_close = int(previous_close_span.text.replace(",", ""))
+
+    # 시가, 고가, 저가
+    day_open = 0
+    day_high = 0
+    day_low = 0
+
+    if table:
+        all_tds = table.find_all("td")
+        for i, td in enumerate(all_tds):
+            blind_span = td.find("span", {"class": "blind"})
+            if blind_span:
+                value = int(blind_span.text.replace(",", ""))
+                if i == 0:  # 전일
+                    previous_close = value
+                elif i == 1:  # 시가
+                    day_open = value
+                elif i == 2:  # 고가
+                    day_high = value
+                elif i == 3:  # 저가
+                    day_low = value
+
+    # 거래량
+    volume = 0
+    volume_td = soup.find("td", {"class": "pgRR"})
+    if volume_td:
+        volume_span = volume_td.find("span", {"class": "blind"})
+        if volume_span:
+            volume = int(volume_span.text.replace(",", ""))
+
+    # 전일 대비
+    change = current_price - previous_close
+    change_percent = 0
+    if previous_close > 0:
+        change_percent = (change / previous_close) * 100
+
+    return {
+        "name": stock_name,
+        "currentPrice": current_price,
+        "previousClose": previous_close,
+        "change": change,
+        "changePercent": round(change_percent, 2),
+        "dayOpen": day_open,
+        "dayHigh": day_high,
+        "dayLow": day_low,
+        "volume": volume
+    }
+
+def crawl_naver_stock(stock_code, stream=True):
+    """네이버 증권에서 주식 정보를 가져옵니다.
+
+    JSON API(수백 바이트~수 KB)를 먼저 시도하고, 모두 실패하면 페이지를 크롤링합니다.
+    """
+    result = fetch_json_quote(planner, session, stock_code, timer)
+    if result:
+        return result
+    
+    page_result = {}
+    
+    def crawl_page():
+        page_result.update(crawl_naver_page(stock_code, stream))
+        return page_result
+    
+    planner.attempt('naver_crawler', crawl_page, timer)
+    return page_result
+
+def crawl_naver_page(stock_code, stream=True):
+    """네이버 증권 item/main 페이지를 크롤링합니다.
+
+    stream=True이면 시세 블록까지만 받고 연결을 끊습니다.
+    """
     try:
         # 네이버 증권 페이지 URL
         url = f"https://finance.naver.com/item/main.naver?code={stock_code}"
@@ -20,83 +158,30 @@ def crawl_naver_stock(stock_code):
         }
         
         # 웹 페이지 소스코드 가져오기
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        # HTML 파싱
-        soup = BeautifulSoup(response.content, "html.parser")
-        
-        # 종목명
-        stock_name = soup.find("div", {"class": "wrap_company"})
-        if stock_name:
-            stock_name = stock_name.find("h2").text.strip()
-        else:
-            stock_name = "Unknown"
-        
-        # 현재가
-        current_price = soup.find("p", {"class": "no_today"})
-        if current_price:
-            current_price = current_price.find("span", {"class": "blind"}).text.strip()
-            current_price = int(current_price.replace(",", ""))
-        else:
-            current_price = 0
-        
-        # 전일 종가
-        table = soup.find("table", {"class": "no_info"})
-        previous_close = 0
-        if table:
-            first_td = table.find("td", {"class": "first"})
-            if first_td:
-                previous_close_span = first_td.find("span", {"class": "blind"})
-                if previous_close_span:
-                    previous_close = int(previous_close_span.text.replace(",", ""))
-        
-        # 시가, 고가, 저가
-        day_open = 0
-        day_high = 0
-        day_low = 0
-        
-        if table:
-            all_tds = table.find_all("td")
-            for i, td in enumerate(all_tds):
-                blind_span = td.find("span", {"class": "blind"})
-                if blind_span:
-                    value = int(blind_span.text.replace(",", ""))
-                    if i == 0:  # 전일
-                        previous_close = value
-                    elif i == 1:  # 시가
-                        day_open = value
-                    elif i == 2:  # 고가
-                        day_high = value
-                    elif i == 3:  # 저가
-                        day_low = value
-        
-        # 거래량
-        volume = 0
-        volume_td = soup.find("td", {"class": "pgRR"})
-        if volume_td:
-            volume_span = volume_td.find("span", {"class": "blind"})
-            if volume_span:
-                volume = int(volume_span.text.replace(",", ""))
-        
-        # 전일 대비
-        change = current_price - previous_close
-        change_percent = 0
-        if previous_close > 0:
-            change_percent = (change / previous_close) * 100
+        headers.update(http_cache.conditional_headers(url))
+        with timer.track('naver_crawler', stock_code, url) as record:
+            response = session.get(url, headers=headers, stream=True)
+            record.mark_headers(response)
+            
+            # 변경 없는 페이지는 304로 받고 저장된 파싱 결과 재사용
+            fields = http_cache.revalidated(url, response)
+            if fields is None:
+                response.raise_for_status()
+                if stream:
+                    scanner = StreamingFieldScanner(MAIN_MARKERS, response.encoding or 'euc-kr')
+                    content = scan_response(response, scanner, record)
+                else:
+                    content = response.content
+                    record.add_bytes(len(content))
+                fields = parse_item_main(content)
+                http_cache.store(url, response, fields)
+            else:
+                response.close()
         
         # 결과 반환
         result = {
             "symbol": stock_code,
-            "name": stock_name,
-            "currentPrice": current_price,
-            "previousClose": previous_close,
-            "change": change,
-            "changePercent": round(change_percent, 2),
-            "dayOpen": day_open,
-            "dayHigh": day_high,
-            "dayLow": day_low,
-            "volume": volume,
+            **fields,
             "timestamp": datetime.now().isoformat(),
             "source": "naver_crawler"
         }
@@ -110,13 +195,14 @@ def crawl_naver_stock(stock_code):
             "timestamp": datetime.now().isoformat()
         }
 
-def crawl_multiple_stocks(stock_codes):
+def crawl_multiple_stocks(stock_codes, stream=True):
     """여러 종목을 크롤링합니다."""
     results = []
     
     for code in stock_codes:
-        result = crawl_naver_stock(code)
+        result = crawl_naver_stock(code, stream)
         results.append(result)
+        metrics.observe_symbol('error' not in result)
         
         # 요청 간 딜레이 (서버 부하 방지)
         time.sleep(0.5)
@@ -124,15 +210,71 @@ def crawl_multiple_stocks(stock_codes):
     return results
 
 if __name__ == "__main__":
+    # 계획상 먼저 쓸 호스트에 미리 연결 (인자 파싱과 병렬로)
+    install_dns_cache()
+    prewarm_requests(session, [SOURCE_HOSTS[source] for source in planner.plan()[:2]])
+    
     # 명령행 인자로 종목 코드 받기
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description='네이버 증권 크롤러')
+    parser.add_argument('codes', nargs='?')
+    parser.add_argument('--stats-file',
+                        help='Write run metrics here when done (JSON, or Prometheus text for *.prom)')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='Output encoding (msgpack needs msgpack, arrow needs pyarrow)')
+    parser.add_argument('--db-url', nargs='?', const='', metavar='URL',
+                        help='Also bulk-write the results to this database (default DATABASE_URL)')
+    parser.add_argument('--redis-url', nargs='?', const='', metavar='URL',
+                        help='Also publish the results to the Redis price cache (default REDIS_URL)')
+    parser.add_argument('--changed-only', nargs='?', type=float, const=0.0, metavar='EPSILON',
+                        help='Only emit symbols whose quote moved by more than EPSILON (relative) '
+                             'since it was last emitted')
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_SECONDS,
+                        help='With --changed-only, re-emit unchanged symbols after this many seconds')
+    parser.add_argument('--delta-state', metavar='PATH',
+                        help='With --changed-only, where to keep the last emitted quotes '
+                             '(default .cache/last_emitted.<script>.json)')
+    parser.add_argument('--profile', nargs='?', const='', metavar='PREFIX',
+                        help='Profile the run into PREFIX.pstats and PREFIX.collapsed')
+    parser.add_argument('--full-page', action='store_true',
+                        help='Download the whole page instead of stopping after the price block')
+    args = parser.parse_args()
+    
+    if not args.codes:
         print(json.dumps({"error": "No stock codes provided"}))
         sys.exit(1)
     
-    stock_codes = sys.argv[1].split(",")
+    stock_codes = args.codes.split(",")
     
     # 크롤링 실행
-    results = crawl_multiple_stocks(stock_codes)
+    profiler = nullcontext()
+    if args.profile is not None:
+        profiler = profile_run(args.profile or default_profile_prefix(__file__, args.stats_file))
+    
+    with profiler:
+        results = crawl_multiple_stocks(stock_codes, stream=not args.full_page)
+    
+    # 시세 일관성 검사 (직전 정상가 대비 급변은 오류로 처리)
+    last_good = LastGoodPrices()
+    results, _ = validate_quotes(results, last_good)
+    last_good.save()
+    
+    # 직전 출력 이후 변동 없는 종목은 제외 (하트비트 주기마다는 다시 출력)
+    if args.changed_only is not None:
+        delta = DeltaFilter(args.changed_only, args.heartbeat, args.delta_state or default_state_path(__file__))
+        results = delta.filter(results)
+        delta.save()
+        print(f"Suppressed {delta.suppressed} unchanged quotes", file=sys.stderr)
     
-    # JSON 형태로 출력
-    print(json.dumps(results, ensure_ascii=False))
\ No newline at end of file
+    # 결과 출력 (기본 JSON, --format으로 msgpack/arrow)
+    emit_results(results, args.format)
+    if args.db_url is not None:
+        # Stock 갱신과 히스토리 추가를 한 트랜잭션으로
+        write_results(results, args.db_url or None)
+    if args.redis_url is not None:
+        # API 캐시 키(stock:price:<종목>)에 바로 기록
+        publish_results(results, args.redis_url or None)
+    http_cache.save()
+    planner.save()
+    timer.emit()
+    if args.stats_file:
+        metrics.write_stats_file(args.stats_file)
\ No newline at end of file
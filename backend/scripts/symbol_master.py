@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Symbol master for KRX listings, built from the KRX data portal snapshots.
+
+Joins the daily price listing (data_3241_*.csv: code, name, market,
+department, shares outstanding) with the basic info listing
+(data_3308_*.csv: ISIN, full and English names), both EUC-KR, into one
+binary index that is read through mmap:
+
+    header | records (sorted by code) | hash slots | name order | UTF-8 strings
+
+Records are fixed-size, so a code lookup is a CRC32 probe into the hash
+slots plus one struct read; code prefixes bisect the records and name
+prefixes bisect the name order. Nothing is parsed up front, so opening
+the index costs the same for one lookup as for thousands.
+
+    symbol_master.py build                  # rebuild the default index
+    symbol_master.py lookup 005930
+    symbol_master.py search 삼성
+"""
+
+import argparse
+import bisect
+import csv
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from http_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# The listing snapshots sit at the backend root, where importStocks reads them
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DEFAULT_INDEX_PATH = os.path.join(DEFAULT_CACHE_DIR, 'symbol_master.bin')
+
+MAGIC = b'KRSM'
+VERSION = 2
+
+MARKETS = ('', 'KOSPI', 'KOSDAQ', 'KONEX')
+
+# KOSDAQ GLOBAL is a KOSDAQ segment, traded and suffixed (.KQ) like the rest
+MARKET_ALIASES = {'KOSDAQ GLOBAL': 'KOSDAQ'}
+
+# magic, version, count, hash slots, offsets of slots / name order / strings
+_HEADER = struct.Struct('<4sHxxIIIII')
+# code, ISIN, market, shares, then (offset, length) of name, full name,
+# English name and department in the string blob
+_RECORD = struct.Struct('<8s12sBQIHIHIHIH')
+_U32 = struct.Struct('<I')
+
+
+class Listing(NamedTuple):
+    code: str
+    isin: str
+    market: str
+    name: str
+    full_name: str
+    name_en: str
+    # 소속부 (KOSDAQ/KONEX department, e.g. 우량기업부); empty for KOSPI
+    department: str
+    shares: int
+
+
+def _read_csv(path: str) -> List[Dict[str, str]]:
+    # cp949 is the superset of EUC-KR that KRX actually writes
+    with open(path, 'r', encoding='cp949', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def latest_snapshot(pattern: str, data_dir: str = DATA_DIR) -> Optional[str]:
+    """Newest file matching pattern; the date in the name sorts lexically"""
+    paths = sorted(glob.glob(os.path.join(data_dir, pattern)))
+    return paths[-1] if paths else None
+
+
+def read_listings(price_csv: str, info_csv: Optional[str] = None) -> List[Listing]:
+    """Listings from the price snapshot, completed from the info snapshot when given"""
+    info = {}
+    if info_csv:
+        info = {row['단축코드'].strip(): row for row in _read_csv(info_csv)}
+
+    listings = []
+    for row in _read_csv(price_csv):
+        code = row['종목코드'].strip()
+        if not code:
+            continue
+        extra = info.get(code, {})
+        market = row.get('시장구분', '').strip()
+        market = MARKET_ALIASES.get(market, market)
+        listings.append(Listing(
+            code=code,
+            isin=extra.get('표준코드', '').strip(),
+            market=market if market in MARKETS else '',
+            name=row['종목명'].strip(),
+            full_name=extra.get('한글 종목명', '').strip(),
+            name_en=extra.get('영문 종목명', '').strip(),
+            department=(row.get('소속부') or '').strip(),
+            shares=int((row.get('상장주식수') or '0').replace(',', '') or 0),
+        ))
+    return listings
+
+
+def build_index(listings: Sequence[Listing]) -> bytes:
+    listings = sorted({listing.code: listing for listing in listings}.values(), key=lambda l: l.code)
+    count = len(listings)
+    slots = 1
+    while slots < count * 2:
+        slots *= 2
+
+    strings = bytearray()
+    string_refs: Dict[str, tuple] = {}
+
+    def intern(text: str) -> tuple:
+        ref = string_refs.get(text)
+        if ref is None:
+            encoded = text.encode('utf-8')
+            ref = string_refs[text] = (len(strings), len(encoded))
+            strings.extend(encoded)
+        return ref
+
+    records = bytearray()
+    for listing in listings:
+        records += _RECORD.pack(
+            listing.code.encode('ascii'), listing.isin.encode('ascii'), MARKETS.index(listing.market),
+            listing.shares, *intern(listing.name), *intern(listing.full_name),
+            *intern(listing.name_en), *intern(listing.department),
+        )
+
+    table = [0] * slots
+    for i, listing in enumerate(listings):
+        slot = zlib.crc32(listing.code.encode('ascii')) & (slots - 1)
+        while table[slot]:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = i + 1
+
+    name_order = sorted(range(count), key=lambda i: listings[i].name)
+
+    slots_offset = _HEADER.size + len(records)
+    names_offset = slots_offset + 4 * slots
+    strings_offset = names_offset + 4 * count
+    header = _HEADER.pack(MAGIC, VERSION, count, slots, slots_offset, names_offset, strings_offset)
+    return b''.join([header, bytes(records), struct.pack(f'<{slots}I', *table),
+                     struct.pack(f'<{count}I', *name_order), bytes(strings)])
+
+
+def write_index(listings: Sequence[Listing], path: str = DEFAULT_INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(build_index(listings))
+    os.replace(tmp_path, path)
+
+
+class _Keys(Sequence):
+    """Lazy sequence of sort keys, so bisect can search the index in place"""
+
+    def __init__(self, count: int, key):
+        self.count = count
+        self.key = key
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.key(i)
+
+
+class SymbolMaster:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        magic, version, self.count, self.slots, self.slots_offset, self.names_offset, self.strings_offset = \
+            _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a symbol master index (or an incompatible version)")
+
+    @classmethod
+    def open(cls, path: str = DEFAULT_INDEX_PATH) -> 'SymbolMaster':
+        with open(path, 'rb') as f:
+            # The mapping stays valid after the file is closed
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, code: str):
+        return self._find(code) >= 0
+
+    def _code(self, i: int) -> bytes:
+        at = _HEADER.size + i * _RECORD.size
+        return bytes(self.buffer[at:at + 8]).rstrip(b'\0')
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self.strings_offset + offset
+        return bytes(self.buffer[start:start + length]).decode('utf-8')
+
+    def _find(self, code: str) -> int:
+        try:
+            key = code.encode('ascii')
+        except UnicodeEncodeError:
+            return -1
+        slot = zlib.crc32(key) & (self.slots - 1)
+        while True:
+            entry = _U32.unpack_from(self.buffer, self.slots_offset + 4 * slot)[0]
+            if not entry:
+                return -1
+            if self._code(entry - 1) == key:
+                return entry - 1
+            slot = (slot + 1) & (self.slots - 1)
+
+    def _listing(self, i: int) -> Listing:
+        (code, isin, market, shares, name_at, name_len, full_at, full_len,
+         en_at, en_len, department_at, department_len) = _RECORD.unpack_from(self.buffer, _HEADER.size + i * _RECORD.size)
+        return Listing(
+            code.rstrip(b'\0').decode('ascii'), isin.rstrip(b'\0').decode('ascii'), MARKETS[market],
+            self._string(name_at, name_len), self._string(full_at, full_len),
+            self._string(en_at, en_len), self._string(department_at, department_len), shares,
+        )
+
+    def _name(self, i: int) -> str:
+        name_at, name_len = struct.unpack_from('<IH', self.buffer, _HEADER.size + i * _RECORD.size + 29)
+        return self._string(name_at, name_len)
+
+    def get(self, code: str) -> Optional[Listing]:
+        i = self._find(code)
+        return self._listing(i) if i >= 0 else None
+
+    def name(self, code: str) -> Optional[str]:
+        i = self._find(code)
+        return self._name(i) if i >= 0 else None
+
+    def isin(self, code: str) -> Optional[str]:
+        listing = self.get(code)
+        return listing.isin if listing and listing.isin else None
+
+    def market(self, code: str) -> Optional[str]:
+        listing = self.get(code)
+        return listing.market if listing and listing.market else None
+
+    def codes(self) -> List[str]:
+        """All codes in record order (ascending)"""
+        return [self._code(i).decode('ascii') for i in range(self.count)]
+
+    def by_code_prefix(self, prefix: str, limit: int = 20) -> List[Listing]:
+        if not prefix or not prefix.isascii():
+            return []
+        key = prefix.encode('ascii')
+        codes = _Keys(self.count, self._code)
+        start = bisect.bisect_left(codes, key)
+        results = []
+        for i in range(start, min(start + limit, self.count)):
+            if not self._code(i).startswith(key):
+                break
+            results.append(self._listing(i))
+        return results
+
+    def by_name_prefix(self, prefix: str, limit: int = 20) -> List[Listing]:
+        order_at = self.names_offset
+
+        def record(position: int) -> int:
+            return _U32.unpack_from(self.buffer, order_at + 4 * position)[0]
+
+        names = _Keys(self.count, lambda position: self._name(record(position)))
+        start = bisect.bisect_left(names, prefix)
+        results = []
+        for position in range(start, min(start + limit, self.count)):
+            i = record(position)
+            if not self._name(i).startswith(prefix):
+                break
+            results.append(self._listing(i))
+        return results
+
+    def search(self, text: str, limit: int = 20) -> List[Listing]:
+        """Code or name prefix matches first, then names containing the text (English case-insensitive)"""
+        text = text.strip()
+        if not text:
+            return []
+        results = {listing.code: listing for listing in self.by_code_prefix(text, limit)}
+        for listing in self.by_name_prefix(text, limit):
+            results.setdefault(listing.code, listing)
+        folded = text.casefold()
+        for i in range(self.count):
+            if len(results) >= limit:
+                break
+            listing = self._listing(i)
+            if listing.code not in results and (folded in listing.name.casefold()
+                                                or folded in listing.name_en.casefold()):
+                results[listing.code] = listing
+        return list(results.values())[:limit]
+
+
+def build_default(index_path: str = DEFAULT_INDEX_PATH, data_dir: str = DATA_DIR) -> Optional[str]:
+    """(Re)build the index from the newest snapshots; returns its path, or None without snapshots"""
+    price_csv = latest_snapshot('data_3241_*.csv', data_dir)
+    if not price_csv:
+        return None
+    listings = read_listings(price_csv, latest_snapshot('data_3308_*.csv', data_dir))
+    write_index(listings, index_path)
+    logger.info(f"Built symbol master with {len(listings)} listings from {os.path.basename(price_csv)}")
+    return index_path
+
+
+@lru_cache(maxsize=None)
+def default_master() -> Optional[SymbolMaster]:
+    """The shared index, rebuilt first if a snapshot is newer; None if unavailable
+
+    Crawlers fall back to their old behaviour when this is None.
+    """
+    try:
+        snapshots = glob.glob(os.path.join(DATA_DIR, 'data_3*_*.csv'))
+        newest = max((os.path.getmtime(path) for path in snapshots), default=0)
+        if not os.path.exists(DEFAULT_INDEX_PATH) or os.path.getmtime(DEFAULT_INDEX_PATH) < newest:
+            if not build_default():
+                return None
+        try:
+            return SymbolMaster.open(DEFAULT_INDEX_PATH)
+        except ValueError:
+            # Written by an older version of this module
+            if not build_default():
+                return None
+            return SymbolMaster.open(DEFAULT_INDEX_PATH)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        logger.warning(f"Symbol master unavailable: {e}")
+        return None
+
+
+def lookup_name(code: str) -> Optional[str]:
+    master = default_master()
+    return master.name(code) if master else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='KRX symbol master index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Build the index from the listing snapshots')
+    build.add_argument('--price-csv', help='data_3241 snapshot (default: newest in the backend dir)')
+    build.add_argument('--info-csv', help='data_3308 snapshot (default: newest in the backend dir)')
+    build.add_argument('--out', default=DEFAULT_INDEX_PATH)
+    lookup = commands.add_parser('lookup', help='Print the listings for comma-separated codes')
+    lookup.add_argument('codes')
+    search = commands.add_parser('search', help='Search by code or name')
+    search.add_argument('text')
+    search.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    if args.command == 'build':
+        price_csv = args.price_csv or latest_snapshot('data_3241_*.csv')
+        if not price_csv:
+            parser.error("No data_3241_*.csv snapshot found")
+        listings = read_listings(price_csv, args.info_csv or latest_snapshot('data_3308_*.csv'))
+        write_index(listings, args.out)
+        print(json.dumps({'listings': len(listings), 'path': args.out, 'bytes': os.path.getsize(args.out)}))
+        return
+
+    master = default_master()
+    if master is None:
+        print(json.dumps({"error": "Symbol master unavailable"}))
+        sys.exit(1)
+    if args.command == 'lookup':
+        listings = [master.get(code.strip()) for code in args.codes.split(',') if code.strip()]
+    else:
+        listings = master.search(args.text, args.limit)
+    print(json.dumps([listing._asdict() if listing else None for listing in listings], ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The scripts import their siblings directly, as they do when run from scripts/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_sink import QuoteSink  # noqa: E402
+
+# The prisma/schema.prisma tables the sink touches, as SQLite sees them
+SCHEMA = '''
+CREATE TABLE "Stock" (
+    id TEXT PRIMARY KEY, symbol TEXT NOT NULL UNIQUE, name TEXT NOT NULL, market TEXT NOT NULL,
+    "currentPrice" REAL NOT NULL DEFAULT 0, "previousClose" REAL NOT NULL DEFAULT 0,
+    "dayOpen" REAL, "dayHigh" REAL, "dayLow" REAL, volume INTEGER,
+    change REAL NOT NULL DEFAULT 0, "changePercent" REAL NOT NULL DEFAULT 0,
+    "isActive" BOOLEAN NOT NULL DEFAULT 1, "isTracked" BOOLEAN NOT NULL DEFAULT 0,
+    "lastPriceUpdate" DATETIME, "createdAt" DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" DATETIME NOT NULL
+);
+CREATE TABLE "StockPriceHistory" (
+    id TEXT PRIMARY KEY, "stockId" TEXT NOT NULL REFERENCES "Stock" (id), symbol TEXT NOT NULL,
+    "currentPrice" REAL NOT NULL, "previousClose" REAL NOT NULL, "dayOpen" REAL NOT NULL,
+    "dayHigh" REAL NOT NULL, "dayLow" REAL NOT NULL, volume INTEGER NOT NULL DEFAULT 0,
+    change REAL NOT NULL DEFAULT 0, "changePercent" REAL NOT NULL DEFAULT 0,
+    timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, source TEXT NOT NULL DEFAULT 'mock',
+    "createdAt" DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE "PriceHistory" (
+    id TEXT PRIMARY KEY, "stockId" TEXT NOT NULL REFERENCES "Stock" (id), date DATETIME NOT NULL,
+    open REAL NOT NULL, high REAL NOT NULL, low REAL NOT NULL, close REAL NOT NULL,
+    volume INTEGER NOT NULL, "createdAt" DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX "PriceHistory_stockId_date_key" ON "PriceHistory" ("stockId", date);
+CREATE TABLE "IntradayBar" (
+    id TEXT PRIMARY KEY, "stockId" TEXT NOT NULL REFERENCES "Stock" (id), interval INTEGER NOT NULL,
+    start DATETIME NOT NULL, open REAL NOT NULL, high REAL NOT NULL, low REAL NOT NULL,
+    close REAL NOT NULL, volume INTEGER NOT NULL DEFAULT 0,
+    "createdAt" DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX "IntradayBar_stockId_interval_start_key" ON "IntradayBar" ("stockId", interval, start);
+-- Read by refresh_candidates(); only the columns it uses
+CREATE TABLE "Holding" (
+    id TEXT PRIMARY KEY, "userId" TEXT NOT NULL, "stockId" TEXT NOT NULL REFERENCES "Stock" (id),
+    quantity INTEGER NOT NULL
+);
+CREATE TABLE "Watchlist" (
+    id TEXT PRIMARY KEY, "userId" TEXT NOT NULL, "stockId" TEXT NOT NULL REFERENCES "Stock" (id)
+);
+'''
+
+
+@pytest.fixture
+def sink():
+    connection = sqlite3.connect(':memory:')
+    connection.executescript(SCHEMA)
+    connection.executemany(
+        'INSERT INTO "Stock" (id, symbol, name, market, "updatedAt") VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)',
+        [('stock-samsung', '005930', '삼성전자', 'KOSPI'), ('stock-hynix', '000660', 'SK하이닉스', 'KOSPI')])
+    connection.commit()
+    sink = QuoteSink(connection, 'sqlite')
+    yield sink
+    sink.close()
+
+
+def quote(symbol, price, timestamp, **fields):
+    return {'symbol': symbol, 'currentPrice': price, 'previousClose': 70000, 'volume': 1000,
+            'timestamp': timestamp, 'source': 'test', **fields}
+
+
+def fetch(sink, sql, params=()):
+    return sink.connection.execute(sql, params).fetchall()
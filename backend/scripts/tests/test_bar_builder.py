@@ -0,0 +1,72 @@
+from bar_builder import BarBuilder
+
+# A minute boundary, in epoch seconds
+T0 = 1_767_571_200
+
+
+def closes(rows):
+    return [(row[1], row[6], row[7]) for row in rows]
+
+
+def test_bar_is_written_once_its_period_is_over():
+    bars = BarBuilder(intervals=(1, 5))
+    bars.update('005930', T0 + 1, 71000, 1000)
+    bars.update('005930', T0 + 30, 71100, 1200)
+
+    assert bars.finished(T0 + 59) == ([], [])
+    rows, marks = bars.finished(T0 + 60)
+    assert closes(rows) == [(1, 71100, 200)]
+    bars.mark_flushed(marks)
+    assert bars.finished(T0 + 61) == ([], [])
+
+
+def test_late_updates_to_a_written_bar_are_written_again():
+    bars = BarBuilder(intervals=(1,))
+    # The source's timestamps lag the clock, so the bar is flushed after one poll
+    bars.update('005930', T0 + 1, 71000, 1000)
+    assert bars.flush(lambda rows: None, T0 + 90) == 1
+
+    bars.update('005930', T0 + 40, 71200, 1500)
+    rows, marks = bars.finished(T0 + 95)
+    assert closes(rows) == [(1, 71200, 500)]
+
+    # Changed again while that write was in flight
+    bars.update('005930', T0 + 50, 70900, 1600)
+    bars.mark_flushed(marks)
+    assert closes(bars.finished(T0 + 100)[0]) == [(1, 70900, 600)]
+
+
+def test_failed_write_keeps_the_bars():
+    bars = BarBuilder(intervals=(1,))
+    bars.update('005930', T0 + 1, 71000, 1000)
+
+    def fail(rows):
+        raise OSError('database is down')
+
+    try:
+        bars.flush(fail, T0 + 60)
+    except OSError:
+        pass
+    assert len(bars.finished(T0 + 60)[0]) == 1
+
+
+def test_unwritten_bars_overwritten_by_the_ring_are_counted():
+    bars = BarBuilder(intervals=(1,), capacity=2)
+    for minute in range(3):
+        bars.update('005930', T0 + minute * 60, 71000 + minute, 1000)
+
+    assert bars.dropped == 1
+    assert [row[6] for row in bars.finished(T0 + 180)[0]] == [71001, 71002]
+
+
+def test_sources_without_volume_move_prices_only():
+    bars = BarBuilder(intervals=(1,))
+    quotes = [
+        {'symbol': 'AAPL', 'currentPrice': 190.0, 'volume': 5000, 'timestamp': T0 + 1, 'source': 'yahoo_quote_api'},
+        {'symbol': 'AAPL', 'currentPrice': 191.0, 'volume': 1000000, 'timestamp': T0 + 10, 'source': 'CNBC'},
+        {'symbol': 'AAPL', 'currentPrice': 190.5, 'volume': 5600, 'timestamp': T0 + 20, 'source': 'yahoo_quote_api'},
+    ]
+
+    assert bars.add(quotes, {'yahoo_quote_api'}) == 3
+    [row] = bars.finished(T0 + 60)[0]
+    assert row[3:] == (190.0, 191.0, 190.0, 190.5, 600)
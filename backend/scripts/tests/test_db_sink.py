@@ -0,0 +1,151 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from conftest import fetch, quote
+from db_sink import quote_rows
+
+
+def bucketed(quotes, start, end):
+    """quote_rows with the history buffer's dedupe window filled in"""
+    return [row[:-2] + (start, end) for row in quote_rows(quotes)]
+
+
+def test_write_updates_stock_and_appends_history(sink):
+    written = sink.write([quote('005930', 71000, '2026-01-05T10:00:00+09:00', change=1000)], source='test')
+
+    assert written == 1
+    assert fetch(sink, 'SELECT "currentPrice", change, "lastPriceUpdate" FROM "Stock" WHERE symbol = ?',
+                 ('005930',)) == [(71000, 1000, '2026-01-05 01:00:00.000')]
+    assert fetch(sink, 'SELECT "stockId", "currentPrice", source FROM "StockPriceHistory"') == \
+        [('stock-samsung', 71000, 'test')]
+
+
+def test_symbols_missing_from_stock_are_skipped(sink):
+    written = sink.write([quote('005930', 71000, '2026-01-05T10:00:00+09:00'),
+                          quote('999999', 500, '2026-01-05T10:00:00+09:00')])
+
+    assert written == 1
+    assert fetch(sink, 'SELECT symbol FROM "StockPriceHistory"') == [('005930',)]
+    assert fetch(sink, 'SELECT COUNT(*) FROM "Stock"') == [(2,)]
+
+
+def test_error_and_unpriced_quotes_are_dropped():
+    rows = quote_rows([{'symbol': '005930', 'error': 'timeout'}, quote('000660', 0, None),
+                       quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+
+    assert [row[0] for row in rows] == ['005930']
+
+
+def test_older_quote_does_not_overwrite_stock(sink):
+    sink.write([quote('005930', 72000, '2026-01-05T10:05:00+09:00')])
+    sink.write([quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+
+    assert fetch(sink, 'SELECT "currentPrice", "lastPriceUpdate" FROM "Stock" WHERE symbol = ?',
+                 ('005930',)) == [(72000, '2026-01-05 01:05:00.000')]
+    # The older quote still lands in the history
+    assert fetch(sink, 'SELECT "currentPrice" FROM "StockPriceHistory" ORDER BY timestamp') == [(71000,), (72000,)]
+
+
+def test_latest_quote_of_a_batch_sets_stock(sink):
+    sink.write([quote('005930', 72000, '2026-01-05T10:05:00+09:00'),
+                quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+
+    assert fetch(sink, 'SELECT "currentPrice" FROM "Stock" WHERE symbol = ?', ('005930',)) == [(72000,)]
+
+
+def test_one_history_row_per_bucket(sink):
+    start, end = datetime(2026, 1, 5, 1, 0), datetime(2026, 1, 5, 1, 5)
+    first = sink.write_rows(bucketed([quote('005930', 71000, '2026-01-05T10:01:00+09:00'),
+                                      quote('000660', 130000, '2026-01-05T10:01:00+09:00')], start, end))
+    second = sink.write_rows(bucketed([quote('005930', 71500, '2026-01-05T10:03:00+09:00')], start, end))
+    later = sink.write_rows(bucketed([quote('005930', 72000, '2026-01-05T10:06:00+09:00')],
+                                     end, datetime(2026, 1, 5, 1, 10)))
+
+    assert (first, second, later) == (2, 0, 1)
+    assert fetch(sink, 'SELECT "currentPrice" FROM "StockPriceHistory" WHERE symbol = ? ORDER BY timestamp',
+                 ('005930',)) == [(71000,), (72000,)]
+    # The Stock row still follows every quote
+    assert fetch(sink, 'SELECT "currentPrice" FROM "Stock" WHERE symbol = ?', ('005930',)) == [(72000,)]
+
+
+def test_write_rows_without_stock_update(sink):
+    sink.write_rows(quote_rows([quote('005930', 71000, '2026-01-05T10:00:00+09:00')]), update_stock=False)
+
+    assert fetch(sink, 'SELECT "currentPrice", "lastPriceUpdate" FROM "Stock" WHERE symbol = ?',
+                 ('005930',)) == [(0, None)]
+    assert fetch(sink, 'SELECT COUNT(*) FROM "StockPriceHistory"') == [(1,)]
+
+
+def test_replayed_rows_keep_their_ids(sink):
+    rows = quote_rows([quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+
+    assert sink.write_rows(rows) == 1
+    assert sink.write_rows(rows) == 0
+    assert fetch(sink, 'SELECT COUNT(*) FROM "StockPriceHistory"') == [(1,)]
+
+
+def test_upsert_price_history_overwrites_the_day(sink):
+    day = datetime(2026, 1, 5)
+    sink.upsert_price_history([('stock-samsung', day, 70000, 71000, 69000, 70500, 100),
+                               ('stock-hynix', day, 130000, 131000, 129000, 130500, 50)])
+    sink.upsert_price_history([('stock-samsung', day, 70000, 72000, 69000, 71500, 150)])
+
+    assert fetch(sink, 'SELECT "stockId", date, high, close, volume FROM "PriceHistory" ORDER BY "stockId"') == [
+        ('stock-hynix', '2026-01-05 00:00:00.000', 131000, 130500, 50),
+        ('stock-samsung', '2026-01-05 00:00:00.000', 72000, 71500, 150),
+    ]
+
+
+def test_upsert_intraday_bars(sink):
+    start = datetime(2026, 1, 5, 1, 0)
+    written = sink.upsert_intraday_bars([('005930', 1, start, 71000, 71200, 70900, 71100, 300),
+                                         ('999999', 1, start, 500, 500, 500, 500, 1)])
+    sink.upsert_intraday_bars([('005930', 1, start, 71000, 71500, 70900, 71400, 450),
+                               ('005930', 5, start, 71000, 71500, 70900, 71400, 450)])
+
+    assert written == 1
+    assert fetch(sink, 'SELECT interval, start, high, close, volume FROM "IntradayBar" ORDER BY interval') == [
+        (1, '2026-01-05 01:00:00.000', 71500, 71400, 450),
+        (5, '2026-01-05 01:00:00.000', 71500, 71400, 450),
+    ]
+
+
+def test_failed_write_rolls_back(sink):
+    sink.connection.execute('DROP TABLE "StockPriceHistory"')
+
+    with pytest.raises(sqlite3.OperationalError):
+        sink.write([quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+    assert fetch(sink, 'SELECT "currentPrice" FROM "Stock" WHERE symbol = ?', ('005930',)) == [(0,)]
+
+
+def test_sqlite_sink_is_usable_from_executor_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from conftest import SCHEMA
+    from db_sink import QuoteSink
+
+    path = tmp_path / 'stand_in.db'
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    connection.execute('INSERT INTO "Stock" (id, symbol, name, market, "updatedAt") '
+                       "VALUES ('stock-samsung', '005930', '삼성전자', 'KOSPI', CURRENT_TIMESTAMP)")
+    connection.commit()
+    connection.close()
+
+    sink = QuoteSink.connect(f'sqlite:///{path}')
+    start = datetime(2026, 1, 5, 1, 0)
+
+    def work(minute):
+        sink.write([quote('005930', 71000 + minute, f'2026-01-05T10:{minute:02d}:00+09:00')])
+        sink.upsert_intraday_bars([('005930', 1, start.replace(minute=minute), 1, 1, 1, 1, 1)])
+        return sink.refresh_candidates()
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(work, range(20)))
+
+    assert fetch(sink, 'SELECT COUNT(*) FROM "StockPriceHistory"') == [(20,)]
+    assert fetch(sink, 'SELECT COUNT(*) FROM "IntradayBar"') == [(20,)]
+    assert fetch(sink, 'SELECT "currentPrice" FROM "Stock"') == [(71019,)]
+    sink.close()
@@ -0,0 +1,26 @@
+import json
+
+from conftest import quote
+
+TS = '2026-01-05T10:00:00+09:00'
+from delta_filter import DeltaFilter, default_state_path
+
+
+def test_state_file_is_per_consumer():
+    assert default_state_path('/srv/scripts/stock_crawler.py').endswith('last_emitted.stock_crawler.json')
+    assert default_state_path('refresh_scheduler') != default_state_path('stock_crawler')
+
+
+def test_save_keeps_symbols_saved_by_another_run(tmp_path):
+    path = str(tmp_path / 'last_emitted.json')
+    first, second = DeltaFilter(path=path), DeltaFilter(path=path)
+
+    first.filter([quote('005930', 71000, TS)], now=1000.0)
+    second.filter([quote('000660', 130000, TS)], now=1001.0)
+    first.save()
+    second.save()
+
+    with open(path, encoding='utf-8') as f:
+        assert sorted(json.load(f)) == ['000660', '005930']
+    # Reloaded state suppresses the unchanged quote until the heartbeat
+    assert DeltaFilter(path=path).filter([quote('005930', 71000, TS)], now=1100.0) == []
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from conftest import fetch, quote
+from history_buffer import HistoryBuffer
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return str(tmp_path / 'history_spool.ndjson')
+
+
+def history_count(sink):
+    return fetch(sink, 'SELECT COUNT(*) FROM "StockPriceHistory"')[0][0]
+
+
+def test_stock_prices_are_written_before_the_flush(sink, spool):
+    with HistoryBuffer(sink, spool, max_age=3600) as buffer:
+        buffer.add([quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+
+        assert fetch(sink, 'SELECT "currentPrice" FROM "Stock" WHERE symbol = ?', ('005930',)) == [(71000,)]
+        assert history_count(sink) == 0
+        assert len(buffer) == 1
+    assert history_count(sink) == 1
+
+
+def test_second_buffer_spools_privately_instead_of_waiting(sink, spool):
+    with HistoryBuffer(sink, spool, max_age=3600) as daemon:
+        daemon.add([quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+        with HistoryBuffer(sink, spool) as run:
+            assert run.spool_path == spool.replace('.ndjson', f'.{os.getpid()}.ndjson')
+            run.add([quote('000660', 130000, '2026-01-05T10:00:00+09:00')])
+        assert not os.path.exists(run.spool_path)
+        assert len(daemon) == 1
+    assert fetch(sink, 'SELECT symbol FROM "StockPriceHistory" ORDER BY symbol') == [('000660',), ('005930',)]
+
+
+def test_unflushed_rows_are_replayed_with_their_prices(sink, spool):
+    # No sink: rows are only spooled, as when the database is down
+    HistoryBuffer(None, spool).add([quote('005930', 71000, '2026-01-05T10:00:00+09:00')])
+
+    with HistoryBuffer(sink, spool) as buffer:
+        assert len(buffer) == 1
+    assert history_count(sink) == 1
+    assert fetch(sink, 'SELECT "currentPrice" FROM "Stock" WHERE symbol = ?', ('005930',)) == [(71000,)]
+    assert os.path.getsize(spool) == 0
+
+
+def test_private_spools_of_exited_processes_are_adopted(sink, spool):
+    orphan = spool.replace('.ndjson', '.999999.ndjson')
+    with HistoryBuffer(None, orphan) as buffer:
+        buffer.add([quote('000660', 130000, '2026-01-05T10:00:00+09:00')])
+
+    with HistoryBuffer(sink, spool) as buffer:
+        assert len(buffer) == 1
+    assert not os.path.exists(orphan)
+    assert fetch(sink, 'SELECT symbol FROM "StockPriceHistory"') == [('000660',)]
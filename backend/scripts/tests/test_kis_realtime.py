@@ -0,0 +1,134 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('dotenv')
+pytest.importorskip('requests')
+
+import aiohttp  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from db_sink import _utc_timestamp  # noqa: E402
+from kis_realtime import TICK_TR_ID, KISRealtime, parse_ticks, read_recording, replay_app  # noqa: E402
+
+
+def tick(code, hhmmss, price, change, volume, high=None, low=None):
+    """One 46-field H0STCNT0 record"""
+    fields = ['0'] * 46
+    fields[0], fields[1], fields[2], fields[4], fields[5] = code, hhmmss, str(price), str(change), '1.00'
+    fields[7], fields[8], fields[9] = '70500', str(high or price), str(low or price)
+    fields[13] = str(volume)
+    return '^'.join(fields)
+
+
+def data_frame(*records):
+    return f'0|{TICK_TR_ID}|{len(records)}|' + '^'.join(records)
+
+
+PINGPONG = json.dumps({'header': {'tr_id': 'PINGPONG', 'datetime': '20260105090000'}})
+
+SCRIPT = [
+    {'t': 0.3, 'frame': data_frame(tick('005930', '090001', 71000, 500, 1000))},
+    {'t': 0.3, 'frame': 'not a json control frame'},
+    {'t': 0.3, 'frame': f'0|{TICK_TR_ID}|0|' + tick('005930', '090002', 71000, 500, 1000)},
+    {'t': 0.3, 'frame': f'0|{TICK_TR_ID}|1|005930^090003^71000'},
+    {'t': 0.3, 'frame': PINGPONG},
+    {'t': 0.4, 'frame': data_frame(tick('005930', '090030', 71200, 700, 1500),
+                                   tick('005930', '090110', 71100, 600, 1800))},
+    # Not registered, so the replay server holds it back
+    {'t': 0.4, 'frame': data_frame(tick('000660', '090030', 130000, 0, 10))},
+]
+
+
+async def subscribe(frames, symbols, record_path=None, expected_frames=6):
+    """Run a subscriber against a replay of frames until it has seen expected_frames"""
+    server = TestServer(replay_app(frames, speed=2.0))
+    await server.start_server()
+    feed = KISRealtime(str(server.make_url('/')).replace('http', 'ws', 1), 'test-key', record_path)
+    await feed.set_symbols(symbols)
+    try:
+        async with aiohttp.ClientSession() as session:
+            connection = asyncio.ensure_future(feed.connect_once(session))
+            for _ in range(200):
+                if feed.ticks + feed.malformed >= expected_frames - 2 and feed.latest.get('005930', {}).get(
+                        'currentPrice') == 71100:
+                    break
+                await asyncio.sleep(0.01)
+            connection.cancel()
+    finally:
+        feed.close()
+        await server.close()
+    return feed
+
+
+def assert_fed(feed):
+    assert feed.ticks == 3
+    assert feed.malformed == 3
+    [quote] = feed.take()
+    assert (quote['symbol'], quote['currentPrice'], quote['previousClose'], quote['volume']) == \
+        ('005930', 71100, 70500, 1800)
+    assert quote['timestamp'].endswith('T09:01:10+09:00')
+
+    rows = [row for row in feed.bars.finished(datetime.now().timestamp() + 86400)[0] if row[1] == 1]
+    assert [(row[3], row[4], row[5], row[6], row[7]) for row in rows] == [
+        (71000, 71200, 71000, 71200, 500),
+        (71100, 71100, 71100, 71100, 300),
+    ]
+
+
+def test_recorded_frames_replay_to_the_same_quotes_and_bars(tmp_path):
+    recording = str(tmp_path / 'ticks.ndjson')
+
+    assert_fed(asyncio.run(subscribe(SCRIPT, ['005930'], recording)))
+    recorded = read_recording(recording)
+    # Acks and the data frames of registered symbols
+    assert [entry['frame'] for entry in recorded if 'SUCCESS' not in entry['frame']] == \
+        [entry['frame'] for entry in SCRIPT[:-1]]
+
+    assert_fed(asyncio.run(subscribe(recorded, ['005930'])))
+
+
+def test_malformed_frames_are_skipped():
+    feed = KISRealtime(approval_key='test-key')
+
+    assert feed.handle(f'0|{TICK_TR_ID}|0|005930') is None
+    assert feed.handle(f'0|{TICK_TR_ID}|2|' + tick('005930', '090001', 71000, 500, 1000)) is None
+    assert feed.handle('{"header": ') is None
+    assert feed.handle('[]') is None
+    assert feed.handle(PINGPONG) == PINGPONG
+    assert feed.malformed == 4
+    assert feed.take() == []
+
+
+def test_parse_ticks_reads_every_record():
+    quotes = parse_ticks(data_frame(tick('005930', '090001', 71000, 500, 1000, high=71500, low=70900),
+                                    tick('000660', '090002', 130000, -1000, 20)))
+
+    assert [(q['symbol'], q['currentPrice'], q['change'], q['dayHigh'], q['dayLow']) for q in quotes] == [
+        ('005930', 71000, 500, 71500, 70900),
+        ('000660', 130000, -1000, 130000, 130000),
+    ]
+    assert parse_ticks('0|H0STASP0|1|005930') == []
+
+
+def test_ticks_are_kst_on_a_utc_host(monkeypatch):
+    monkeypatch.setenv('TZ', 'UTC')
+    time.tzset()
+    try:
+        [quote] = parse_ticks(data_frame(tick('005930', '090110', 71000, 500, 1000)))
+        stored = _utc_timestamp(quote['timestamp'])
+
+        assert quote['timestamp'].endswith('T09:01:10+09:00')
+        assert (stored.hour, stored.minute, stored.second) == (0, 1, 10)
+
+        feed = KISRealtime(approval_key='test-key')
+        feed.handle(data_frame(tick('005930', '090110', 71000, 500, 1000)))
+        [bar] = [row for row in feed.bars.finished(time.time() + 86400)[0] if row[1] == 1]
+        assert (bar[2].hour, bar[2].minute) == (0, 1)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
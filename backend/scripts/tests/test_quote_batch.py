@@ -0,0 +1,34 @@
+import pytest
+
+from quote_batch import PRICE_SCALE, QuoteBatch
+
+
+def test_extend_fills_fixed_point_columns_and_grows():
+    batch = QuoteBatch(capacity=1)
+    batch.extend([{'symbol': '005930', 'currentPrice': 71000, 'changePercent': 1.25, 'volume': 1200,
+                   'timestamp': 1700000000, 'source': 'naver_polling'}])
+    batch.extend([{'symbol': 'AAPL', 'name': 'Apple', 'currentPrice': 190.1234, 'timestamp': 1700000001.5,
+                   'source': 'yahoo_quote_api'},
+                  {'symbol': '000660', 'error': 'timeout', 'source': 'naver_polling'}])
+
+    assert len(batch) == 3
+    assert batch.prices['currentPrice'][:3].tolist() == [71000 * PRICE_SCALE, 1901234, 0]
+    assert batch.volume[:3].tolist() == [1200, 0, 0]
+    assert batch.timestamp[:2].tolist() == [1700000000000, 1700000001500]
+    assert [batch.source_names[i] for i in batch.source[:3]] == ['naver_polling', 'yahoo_quote_api', 'naver_polling']
+    assert batch.names == ['005930', 'Apple', '000660']
+    assert batch.errors == [None, None, 'timeout']
+
+
+def test_to_arrow_keeps_prices_fixed_point():
+    pa = pytest.importorskip('pyarrow')
+    record_batch = QuoteBatch.from_quotes([
+        {'symbol': '005930', 'currentPrice': 71000, 'timestamp': 1700000000, 'source': 'naver_polling'},
+        {'symbol': '000660', 'error': 'timeout'},
+    ]).to_arrow()
+
+    assert record_batch.num_rows == 2
+    assert record_batch.column('currentPrice').to_pylist() == [71000 * PRICE_SCALE, 0]
+    assert record_batch.column('timestamp').type == pa.timestamp('ms', tz='UTC')
+    assert record_batch.column('error').to_pylist() == [None, 'timeout']
+    assert record_batch.schema.metadata[b'price_scale'] == str(PRICE_SCALE).encode()
@@ -0,0 +1,61 @@
+import json
+
+from redis_sink import PRICE_TTL, QUOTE_STREAM, RedisSink
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def mset(self, values):
+        self.commands.append(('mset', values))
+
+    def expire(self, key, ttl):
+        self.commands.append(('expire', key, ttl))
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+        self.commands.append(('xadd', stream, fields, maxlen))
+
+    def execute(self):
+        self.client.executed.append(self.commands)
+
+
+class FakeRedis:
+    """Records each executed pipeline as its list of commands"""
+
+    def __init__(self):
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def test_publish_is_one_pipeline():
+    client = FakeRedis()
+    quotes = [{'symbol': '005930', 'currentPrice': 71000, 'change': 500, 'volume': 10, 'source': 'test'},
+              {'symbol': '000660', 'error': 'timeout'},
+              {'symbol': '000660', 'currentPrice': 130000, 'change': None}]
+
+    assert RedisSink(client).publish(quotes) == 2
+
+    [commands] = client.executed
+    mset = commands[0]
+    assert mset[0] == 'mset'
+    assert json.loads(mset[1]['stock:price:005930'])['currentPrice'] == 71000
+    assert set(mset[1]) == {'stock:price:005930', 'stock:price:000660'}
+    assert ('expire', 'stock:price:000660', PRICE_TTL) in commands
+    events = [command for command in commands if command[0] == 'xadd']
+    assert [event[1] for event in events] == [QUOTE_STREAM, QUOTE_STREAM]
+    # Missing fields are left out of the stream entry, values are strings
+    assert events[1][2] == {'symbol': '000660', 'currentPrice': '130000'}
+
+
+def test_publish_without_stream_or_quotes():
+    client = FakeRedis()
+    sink = RedisSink(client, stream=None)
+
+    assert sink.publish([{'symbol': '005930', 'error': 'timeout'}]) == 0
+    assert client.executed == []
+    sink.publish([{'symbol': '005930', 'currentPrice': 71000}])
+    assert [command[0] for command in client.executed[0]] == ['mset', 'expire']
@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from request_timing import RequestTimer
+from source_planner import SourcePlanner
+
+
+def test_attempts_on_a_thread_pool_are_charged_their_own_bytes(tmp_path):
+    planner = SourcePlanner({'small': 100, 'large': 100}, str(tmp_path / 'source_bytes.json'))
+    timer = RequestTimer()
+
+    def fetch(source: str, size: int):
+        def request():
+            with timer.track(source, None, f'https://example.com/{source}') as record:
+                record.add_bytes(size)
+            return {'currentPrice': 1}
+        return planner.attempt(source, request, timer)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: fetch('small', 300) if i % 2 else fetch('large', 30000), range(400)))
+
+    assert planner.stats['small']['attempts'] == planner.stats['large']['attempts'] == 200
+    assert round(planner.cost('small')) < 400 < 20000 < round(planner.cost('large'))
+    assert planner.plan() == ['small', 'large']
+
+
+def test_failed_attempt_costs_at_least_the_expected_size(tmp_path):
+    planner = SourcePlanner({'api': 1000}, str(tmp_path / 'source_bytes.json'))
+
+    assert planner.attempt('api', lambda: None, RequestTimer()) is None
+    assert planner.stats['api']['bytes'] == 1000
+    assert planner.cost('api') == 2000
+
+    planner.save()
+    assert SourcePlanner({'api': 1000}, planner.path).stats['api']['attempts'] == 1
@@ -13,6 +13,9 @@ import ast
 import csv
 from datetime import datetime
 import argparse
+from quote_validation import (
+    CHANGE_MISMATCH, NEGATIVE_VOLUME, NON_POSITIVE_PRICE, OHLC_ORDER, to_columns, validate_columns
+)
 
 # Stock symbols and names mapping
 STOCK_MAPPING = {
@@ -38,6 +41,14 @@ STOCK_MAPPING = {
     "033780": "KT&G"
 }
 
+# Message per quote_validation rule
+VALIDATION_MESSAGES = {
+    NON_POSITIVE_PRICE: "Zero or negative price",
+    OHLC_ORDER: "Day high/low inconsistent with open or current price",
+    CHANGE_MISMATCH: "change/changePercent inconsistent with previousClose",
+    NEGATIVE_VOLUME: "Negative volume",
+}
+
 class AdvancedPriceUpdater:
     def __init__(self):
         self.crawler_file = os.path.join(os.path.dirname(__file__), 'public_api_crawler.py')
@@ -195,19 +206,13 @@ class AdvancedPriceUpdater:
                 if field not in data:
                     errors.append(f"Missing field '{field}' for stock {code}")
             
-            # Validate price logic
-            if 'dayHigh' in data and 'dayLow' in data:
-                if data['dayHigh'] < data['dayLow']:
-                    errors.append(f"Day high is less than day low for {code}")
-            
-            if 'currentPrice' in data and 'dayHigh' in data and 'dayLow' in data:
-                if data['currentPrice'] > data['dayHigh'] or data['currentPrice'] < data['dayLow']:
-                    errors.append(f"Current price outside of day range for {code}")
-            
-            # Check for negative values
-            for field, value in data.items():
-                if field != 'change' and value < 0:
-                    errors.append(f"Negative value for {field} in {code}")
+        # Price logic for the whole file at once (vectorized)
+        codes = [code for code in prices if code in STOCK_MAPPING]
+        flags = validate_columns(to_columns([prices[code] for code in codes]))
+        for code, flag in zip(codes, flags.tolist()):
+            for bit, message in VALIDATION_MESSAGES.items():
+                if flag & bit:
+                    errors.append(f"{message} for {code}")
         
         return errors
 
@@ -0,0 +1,128 @@
+import fs from 'fs';
+import path from 'path';
+import { logger } from '../utils/logger';
+
+// Layout written by scripts/quote_board.py
+const MAGIC = 'KRQB';
+const VERSION = 1;
+const HEADER_SIZE = 64;
+const SLOT_SIZE = 64;
+const READ_RETRIES = 100;
+// How often to check whether the board file was replaced
+const REOPEN_CHECK_MS = 5000;
+
+export interface BoardQuote {
+  symbol: string;
+  currentPrice: number;
+  dayOpen: number;
+  dayHigh: number;
+  dayLow: number;
+  volume: number;
+  updatedAt: Date;
+}
+
+// Reads the crawlers' shared quote board. Node has no built-in mmap, so a
+// read is a positional read of the 64-byte slot from the page cache plus one
+// of its seq word: no process round trip and no JSON parsing. The seq check
+// discards slots caught mid-write.
+export class QuoteBoardReader {
+  private fd: number | null = null;
+  private slots = new Map<string, number>();
+  private slot = Buffer.alloc(SLOT_SIZE);
+  private seq = Buffer.alloc(4);
+  private inode = 0;
+  private checkedAt = 0;
+
+  constructor(
+    private boardPath: string = process.env.QUOTE_BOARD_PATH ||
+      path.join(process.env.CRAWLER_CACHE_DIR || path.join(__dirname, '../../scripts/.cache'), 'quote_board.bin')
+  ) {}
+
+  private open(): boolean {
+    if (this.fd !== null && Date.now() - this.checkedAt < REOPEN_CHECK_MS) {
+      return true;
+    }
+    try {
+      this.checkedAt = Date.now();
+      const stat = fs.statSync(this.boardPath);
+      // The board is replaced when the symbol master changes
+      if (this.fd !== null && stat.ino === this.inode) {
+        return true;
+      }
+      this.close();
+
+      const fd = fs.openSync(this.boardPath, 'r');
+      const header = Buffer.alloc(HEADER_SIZE);
+      fs.readSync(fd, header, 0, HEADER_SIZE, 0);
+      if (header.toString('ascii', 0, 4) !== MAGIC || header.readUInt16LE(4) !== VERSION ||
+          header.readUInt16LE(6) !== SLOT_SIZE) {
+        fs.closeSync(fd);
+        logger.warn(`Not a quote board: ${this.boardPath}`);
+        return false;
+      }
+
+      // Codes are fixed for the life of the file, so index them once
+      const count = header.readUInt32LE(8);
+      const body = Buffer.alloc(count * SLOT_SIZE);
+      fs.readSync(fd, body, 0, body.length, HEADER_SIZE);
+      for (let i = 0; i < count; i++) {
+        const code = body.toString('ascii', i * SLOT_SIZE + 8, i * SLOT_SIZE + 16).replace(/\0+$/, '');
+        this.slots.set(code, i);
+      }
+      this.fd = fd;
+      this.inode = stat.ino;
+      return true;
+    } catch (error) {
+      return false;
+    }
+  }
+
+  close(): void {
+    if (this.fd !== null) {
+      fs.closeSync(this.fd);
+      this.fd = null;
+    }
+    this.slots.clear();
+  }
+
+  read(symbol: string): BoardQuote | null {
+    if (!this.open()) {
+      return null;
+    }
+    const index = this.slots.get(symbol);
+    if (index === undefined) {
+      return null;
+    }
+
+    const offset = HEADER_SIZE + index * SLOT_SIZE;
+    for (let attempt = 0; attempt < READ_RETRIES; attempt++) {
+      fs.readSync(this.fd!, this.slot, 0, SLOT_SIZE, offset);
+      const seq = this.slot.readUInt32LE(0);
+      if (seq & 1) {
+        continue;
+      }
+      fs.readSync(this.fd!, this.seq, 0, 4, offset);
+      if (this.seq.readUInt32LE(0) !== seq) {
+        continue;
+      }
+
+      const updated = Number(this.slot.readBigInt64LE(56));
+      if (!updated) {
+        return null;
+      }
+      return {
+        symbol,
+        currentPrice: this.slot.readDoubleLE(16),
+        dayOpen: this.slot.readDoubleLE(24),
+        dayHigh: this.slot.readDoubleLE(32),
+        dayLow: this.slot.readDoubleLE(40),
+        volume: Number(this.slot.readBigInt64LE(48)),
+        updatedAt: new Date(updated),
+      };
+    }
+    logger.warn(`Quote board slot ${symbol} kept changing while being read`);
+    return null;
+  }
+}
+
+export const quoteBoardReader = new QuoteBoardReader();